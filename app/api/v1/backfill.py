@@ -0,0 +1,81 @@
+from datetime import datetime
+import asyncio
+import logging
+import os
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+
+from app.api.v1.log_watcher import tailer, XRAY_LOG_PATH, CENTRAL_LOG_SERVER
+from app.core.http import http_client
+from app.services.backfill import BackfillJob, BACKFILL_WORKERS
+from app.services.connection_log import connection_log
+from app.services.squid_index import SQUID_LOG_PATH
+
+router = APIRouter()
+
+# Догружать можно только файлы из каталога логов
+BACKFILL_ROOT = os.getenv("BACKFILL_ROOT", "/logs")
+
+logger = logging.getLogger("backfill")
+
+jobs = {}
+current_task = None
+
+
+class BackfillRequest(BaseModel):
+    xray_files: list[str] = [f"{XRAY_LOG_PATH}.*"]
+    squid_files: list[str] = [f"{SQUID_LOG_PATH}*"]
+    since: datetime | None = None
+    until: datetime | None = None
+    workers: int = Field(default=min(BACKFILL_WORKERS, os.cpu_count() or 1), ge=1, le=os.cpu_count() or 1)
+    dry_run: bool = False
+    local_log: bool = False  # писать и в локальный журнал подключений (новый узел, потерянная база)
+
+
+def check_paths(paths):
+    """Проверяет уже раскрытые маски и возвращает реальные пути: симлинк из каталога логов наружу не пройдёт"""
+    root = os.path.realpath(BACKFILL_ROOT)
+    resolved = []
+    for path in paths:
+        real = os.path.realpath(path)
+        if os.path.commonpath([root, real]) != root:
+            raise HTTPException(status_code=400, detail=f"Path outside {BACKFILL_ROOT}: {path}")
+        resolved.append(real)
+    return resolved
+
+
+@router.post("/backfill")
+async def start_backfill(data: BackfillRequest):
+    """Запускает догрузку ротированных логов в фоне; прогресс — GET /backfill/{id}"""
+    global current_task
+    if current_task and not current_task.done():
+        raise HTTPException(status_code=409, detail="Backfill already running")
+    job = BackfillJob(
+        data.xray_files, data.squid_files, since=data.since, until=data.until, workers=data.workers,
+        server_ip=await tailer.resolve_server_ip(),
+        collector_url=None if data.dry_run else CENTRAL_LOG_SERVER,
+        local_log=connection_log if data.local_log and not data.dry_run else None,
+    )
+    # Проверяем ровно те файлы, которые задача будет читать, и читать она будет их реальные пути
+    job.xray_files = check_paths(job.xray_files)
+    job.squid_files = check_paths(job.squid_files)
+    if not job.xray_files:
+        raise HTTPException(status_code=400, detail="No Xray log files matched")
+    jobs[job.id] = job
+    current_task = asyncio.create_task(job.run(http_client.session))
+    logger.info(f"Догрузка {job.id} запущена: {len(job.xray_files)} файлов Xray, {len(job.squid_files)} Squid")
+    return job.status()
+
+
+@router.get("/backfill")
+async def list_backfills():
+    return {"jobs": [job.status() for job in jobs.values()]}
+
+
+@router.get("/backfill/{job_id}")
+async def get_backfill(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Backfill not found")
+    return job.status()
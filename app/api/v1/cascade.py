@@ -1,19 +1,17 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from pathlib import Path
 from uuid import UUID, uuid4
-import json
-import aiofiles
-import asyncio
-import subprocess
 import logging
-from fastapi.responses import JSONResponse
 
-router = APIRouter()
+from app.api.v1.xray import (
+    hot_add_client, hot_remove_client, hot_add_clients, hot_remove_clients, forget_traffic, parse_uuids, BulkResult,
+    BulkResponse
+)
+from app.services.cascade_exits import BALANCER_TAG, cascade_exits
+from app.services.config_store import config_store
+from app.services.reload_scheduler import schedule_reload
 
-# Пути
-XRAY_CONFIG_PATH = Path("/usr/local/etc/xray/config.json")
-XRAY_CONTAINER_NAME = "xray"
+router = APIRouter()
 
 # Настройка логов
 logger = logging.getLogger("cascade")
@@ -24,6 +22,7 @@ class CascadeRequest(BaseModel):
     uuid: str
     server2_ip: str
     server2_port: int = 8443
+    server2_uuid: str = ""  # задаёт контроллер флота, чтобы регистрировать второй хоп параллельно
 
 
 class CascadeResponse(BaseModel):
@@ -31,6 +30,31 @@ class CascadeResponse(BaseModel):
     vless_link: str = ""
     message: str = ""
     cascade_uuid: str = ""
+    reload_pending: bool = False
+
+
+class CascadeBulkRequest(BaseModel):
+    uuids: list[str]
+    server2_ip: str
+    server2_port: int = 8443
+    server2_uuid: str = ""
+
+
+class CascadeBulkResponse(BulkResponse):
+    cascade_uuid: str = ""
+
+
+class ExitRequest(BaseModel):
+    address: str
+    port: int = 8443
+    uuid: str
+    tls: bool = False
+    server_name: str = ""
+
+
+class CascadeLinkRequest(BaseModel):
+    uuid: str
+    port: int = 8443
 
 
 class CascadeConfig(BaseModel):
@@ -39,26 +63,196 @@ class CascadeConfig(BaseModel):
     server2_uuid: str = ""
 
 
-async def restart_xray():
-    """Перезапуск контейнера Xray через docker"""
-    try:
-        logger.info(f"Перезапуск контейнера {XRAY_CONTAINER_NAME}")
-        proc = await asyncio.create_subprocess_exec(
-            "docker", "restart", XRAY_CONTAINER_NAME,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
-        if proc.returncode != 0:
-            raise RuntimeError(stderr.decode().strip())
-        logger.info(f"Контейнер {XRAY_CONTAINER_NAME} перезапущен")
-    except Exception as e:
-        logger.error(f"Ошибка перезапуска Xray: {e}")
-        raise
+def ensure_cascade_layout(config: dict, server2_ip: str, server2_port: int, server2_uuid: str = "") -> tuple:
+    """Создаёт при необходимости каскадный inbound, outbound на второй сервер и правило маршрутизации.
+
+    Возвращает (UUID для второго сервера, изменилась ли структура конфига). Клиентов Xray может
+    добавлять на лету, а изменение inbounds/outbounds/routing требует перезапуска.
+    Если server2_uuid не задан, для нового второго сервера генерируется случайный.
+    """
+    requested_uuid = server2_uuid
+    # Генерируем UUID для второго сервера
+    server2_uuid = server2_uuid or str(uuid4())
+    layout_changed = False
+
+    # Проверяем, есть ли уже каскадный inbound
+    cascade_inbound = None
+    for inbound in config.get("inbounds", []):
+        if inbound.get("tag") == "vless-cascade":
+            cascade_inbound = inbound
+            break
+
+    if not cascade_inbound:
+        # Создаем каскадный inbound
+        cascade_inbound = {
+            "port": 1443,
+            "protocol": "vless",
+            "settings": {
+                "clients": [],
+                "decryption": "none"
+            },
+            "streamSettings": {
+                "network": "ws",
+                "security": "tls",
+                "tlsSettings": {
+                    "certificates": [
+                        {
+                            "certificateFile": "/etc/letsencrypt/live/germany.anonixvpn.space/fullchain.pem",
+                            "keyFile": "/etc/letsencrypt/live/germany.anonixvpn.space/privkey.pem"
+                        }
+                    ]
+                },
+                "wsSettings": {
+                    "path": "/cascade",
+                    "headers": {
+                        "Host": "germany.anonixvpn.space"
+                    }
+                }
+            },
+            "tag": "vless-cascade",
+            "sniffing": {
+                "enabled": True,
+                "destOverride": ["http", "tls"]
+            }
+        }
+        config["inbounds"].append(cascade_inbound)
+        layout_changed = True
+        logger.info("Каскадный inbound создан")
+
+    # Проверяем/создаем outbound для каскада
+    cascade_outbound = None
+    for outbound in config.get("outbounds", []):
+        if outbound.get("tag") == "cascade-to-server2":
+            cascade_outbound = outbound
+            break
+
+    if not cascade_outbound:
+        cascade_outbound = {
+            "protocol": "vless",
+            "settings": {
+                "vnext": [
+                    {
+                        "address": server2_ip,
+                        "port": server2_port,
+                        "users": [
+                            {
+                                "id": server2_uuid,
+                                "level": 0,
+                                "encryption": "none"
+                            }
+                        ]
+                    }
+                ]
+            },
+            "streamSettings": {
+                "network": "tcp",
+                "security": "none"
+            },
+            "tag": "cascade-to-server2"
+        }
+        config["outbounds"].append(cascade_outbound)
+        layout_changed = True
+        logger.info("Каскадный outbound создан")
+    else:
+        vnext = cascade_outbound["settings"]["vnext"][0]
+        same_uuid = not requested_uuid or vnext["users"][0]["id"] == requested_uuid
+        if vnext["address"] == server2_ip and vnext["port"] == server2_port and same_uuid:
+            # Второй сервер тот же: оставляем его UUID, чтобы не перезапускать Xray
+            server2_uuid = vnext["users"][0]["id"]
+        else:
+            # Обновляем настройки второго сервера
+            vnext["address"] = server2_ip
+            vnext["port"] = server2_port
+            vnext["users"][0]["id"] = server2_uuid
+            layout_changed = True
+
+    # Проверяем/создаем routing rules
+    if "routing" not in config:
+        config["routing"] = {"domainStrategy": "IPIfNonMatch", "rules": []}
+
+    # Добавляем правило для каскада; при пуле exit трафик идёт через его балансировщик
+    cascade_rule = {
+        "type": "field",
+        "inboundTag": ["vless-cascade"],
+        "outboundTag": "cascade-to-server2"
+    }
+    if any(balancer.get("tag") == BALANCER_TAG for balancer in config["routing"].get("balancers", [])):
+        del cascade_rule["outboundTag"]
+        cascade_rule["balancerTag"] = BALANCER_TAG
+
+    if not any(rule.get("inboundTag") == ["vless-cascade"] for rule in config["routing"]["rules"]):
+        config["routing"]["rules"].append(cascade_rule)
+        layout_changed = True
+        logger.info("Правило маршрутизации для каскада добавлено")
+
+    return server2_uuid, layout_changed
+
+
+def find_cascade_outbound(config: dict):
+    return next((outbound for outbound in config.get("outbounds", []) if outbound.get("tag") == "cascade-to-server2"), None)
+
+
+LINK_INBOUND_TAG = "cascade-link-in"
+
+
+def is_link_inbound(inbound: dict, port: int) -> bool:
+    """Inbound, на который entry-узел ходит outbound'ом cascade-to-server2: VLESS по TCP без шифрования"""
+    stream = inbound.get("streamSettings", {})
+    return (
+        inbound.get("protocol") == "vless"
+        and inbound.get("port") == port
+        and stream.get("network", "tcp") == "tcp"
+        and stream.get("security", "none") == "none"
+    )
+
+
+def find_link_inbound(config: dict, port: int):
+    """Inbound связок на порту port, иначе свой cascade-link-in на любом порту; конфиг не меняется"""
+    for inbound in config.get("inbounds", []):
+        if is_link_inbound(inbound, port):
+            return inbound
+    return next((inbound for inbound in config.get("inbounds", []) if inbound.get("tag") == LINK_INBOUND_TAG), None)
+
+
+def ensure_link_inbound(config: dict, port: int) -> tuple:
+    """Находит или создаёт на exit-узле inbound для связок каскада; возвращает (inbound, изменилась ли структура)"""
+    link_inbound = find_link_inbound(config, port)
+    if link_inbound is not None and link_inbound.get("port") == port:
+        return link_inbound, False
+    if link_inbound is not None:
+        # Порт каскада на узле сменился: переносим inbound вместе с клиентами
+        link_inbound["port"] = port
+        return link_inbound, True
+    link_inbound = {
+        "tag": LINK_INBOUND_TAG,
+        "port": port,
+        "listen": "0.0.0.0",
+        "protocol": "vless",
+        "settings": {
+            "clients": [],
+            "decryption": "none"
+        },
+        "streamSettings": {
+            "network": "tcp",
+            "security": "none"
+        }
+    }
+    config["inbounds"].append(link_inbound)
+    logger.info(f"Inbound связок каскада создан на порту {port}")
+    return link_inbound, True
+
+
+def build_cascade_link(uid: str) -> str:
+    domain = "germany.anonixvpn.space"
+    port = 1443
+    return (
+        f"vless://{uid}@{domain}:{port}"
+        f"?encryption=none&security=tls&type=ws&host={domain}&path=%2Fcascade#cascade-double-encryption"
+    )
 
 
 @router.post("/cascade", response_model=CascadeResponse)
-async def create_cascade_user(data: CascadeRequest):
+async def create_cascade_user(data: CascadeRequest, wait: bool = True):
     """Создает пользователя для каскадного соединения (двойное шифрование)"""
     try:
         uid = str(UUID(data.uuid))
@@ -67,142 +261,36 @@ async def create_cascade_user(data: CascadeRequest):
 
     try:
         logger.info(f"Создание каскадного пользователя {uid}")
-        
-        # Генерируем UUID для второго сервера
-        server2_uuid = str(uuid4())
-        
-        async with aiofiles.open(XRAY_CONFIG_PATH, "r") as f:
-            config_data = await f.read()
-        config = json.loads(config_data)
-
-        # Проверяем, есть ли уже каскадный inbound
-        cascade_inbound = None
-        for inbound in config.get("inbounds", []):
-            if inbound.get("tag") == "vless-cascade":
-                cascade_inbound = inbound
-                break
-
-        if not cascade_inbound:
-            # Создаем каскадный inbound
-            cascade_inbound = {
-                "port": 1443,
-                "protocol": "vless",
-                "settings": {
-                    "clients": [],
-                    "decryption": "none"
-                },
-                "streamSettings": {
-                    "network": "ws",
-                    "security": "tls",
-                    "tlsSettings": {
-                        "certificates": [
-                            {
-                                "certificateFile": "/etc/letsencrypt/live/germany.anonixvpn.space/fullchain.pem",
-                                "keyFile": "/etc/letsencrypt/live/germany.anonixvpn.space/privkey.pem"
-                            }
-                        ]
-                    },
-                    "wsSettings": {
-                        "path": "/cascade",
-                        "headers": {
-                            "Host": "germany.anonixvpn.space"
-                        }
-                    }
-                },
-                "tag": "vless-cascade",
-                "sniffing": {
-                    "enabled": True,
-                    "destOverride": ["http", "tls"]
-                }
-            }
-            config["inbounds"].append(cascade_inbound)
-            logger.info("Каскадный inbound создан")
-
-        # Добавляем клиента в каскадный inbound
-        clients = cascade_inbound["settings"]["clients"]
-        if any(client["id"] == uid for client in clients):
-            logger.warning(f"UUID уже существует в каскаде: {uid}")
-            return CascadeResponse(success=False, message="UUID already exists in cascade")
-
-        email = f"{uid}@cascade"
-        clients.append({
-            "id": uid,
-            "level": 0,
-            "email": email
-        })
-        logger.info(f"Клиент {uid} добавлен в каскад")
-
-        # Проверяем/создаем outbound для каскада
-        cascade_outbound = None
-        for outbound in config.get("outbounds", []):
-            if outbound.get("tag") == "cascade-to-server2":
-                cascade_outbound = outbound
-                break
-
-        if not cascade_outbound:
-            cascade_outbound = {
-                "protocol": "vless",
-                "settings": {
-                    "vnext": [
-                        {
-                            "address": data.server2_ip,
-                            "port": data.server2_port,
-                            "users": [
-                                {
-                                    "id": server2_uuid,
-                                    "level": 0,
-                                    "encryption": "none"
-                                }
-                            ]
-                        }
-                    ]
-                },
-                "streamSettings": {
-                    "network": "tcp",
-                    "security": "none"
-                },
-                "tag": "cascade-to-server2"
-            }
-            config["outbounds"].append(cascade_outbound)
-            logger.info("Каскадный outbound создан")
-        else:
-            # Обновляем настройки второго сервера
-            cascade_outbound["settings"]["vnext"][0]["address"] = data.server2_ip
-            cascade_outbound["settings"]["vnext"][0]["port"] = data.server2_port
-            cascade_outbound["settings"]["vnext"][0]["users"][0]["id"] = server2_uuid
-
-        # Проверяем/создаем routing rules
-        if "routing" not in config:
-            config["routing"] = {"domainStrategy": "IPIfNonMatch", "rules": []}
-
-        # Добавляем правило для каскада
-        cascade_rule = {
-            "type": "field",
-            "inboundTag": ["vless-cascade"],
-            "outboundTag": "cascade-to-server2"
-        }
 
-        if not any(rule.get("inboundTag") == ["vless-cascade"] for rule in config["routing"]["rules"]):
-            config["routing"]["rules"].append(cascade_rule)
-            logger.info("Правило маршрутизации для каскада добавлено")
+        async with config_store.transaction() as config:
+            if uid in config_store.clients("vless-cascade"):
+                logger.warning(f"UUID уже существует в каскаде: {uid}")
+                return CascadeResponse(success=False, message="UUID already exists in cascade")
 
-        # Сохраняем конфиг
-        async with aiofiles.open(XRAY_CONFIG_PATH, "w") as f:
-            await f.write(json.dumps(config, indent=2))
-        logger.info("Конфиг успешно записан")
+            server2_uuid, layout_changed = ensure_cascade_layout(
+                config, data.server2_ip, data.server2_port, data.server2_uuid
+            )
 
-        # Перезапускаем Xray
-        await restart_xray()
+            # Добавляем клиента в каскадный inbound
+            client = {
+                "id": uid,
+                "level": 0,
+                "email": f"{uid}@cascade"
+            }
+            config_store.inbound("vless-cascade")["settings"]["clients"].append(client)
+            logger.info(f"Клиент {uid} добавлен в каскад")
 
-        # Генерируем ссылку для каскада
-        domain = "germany.anonixvpn.space"
-        port = 1443
-        path = "/cascade"
+            # Сохраняем конфиг
+            await config_store.save(config, touched=None if layout_changed else ["vless-cascade"])
+            logger.info("Конфиг успешно записан")
 
-        vless_link = (
-            f"vless://{uid}@{domain}:{port}"
-            f"?encryption=none&security=tls&type=ws&host={domain}&path=%2Fcascade#cascade-double-encryption"
-        )
+        if layout_changed:
+            reload_pending = await schedule_reload(wait)
+        else:
+            reload_pending = await hot_add_client("vless-cascade", client, wait)
+
+        # Генерируем ссылку для каскада
+        vless_link = build_cascade_link(uid)
 
         logger.info(f"Каскадная VLESS ссылка сгенерирована: {vless_link}")
         
@@ -210,7 +298,8 @@ async def create_cascade_user(data: CascadeRequest):
             success=True, 
             vless_link=vless_link, 
             message="Cascade user created successfully",
-            cascade_uuid=server2_uuid
+            cascade_uuid=server2_uuid,
+            reload_pending=reload_pending
         )
 
     except Exception as e:
@@ -219,7 +308,7 @@ async def create_cascade_user(data: CascadeRequest):
 
 
 @router.delete("/cascade", response_model=CascadeResponse)
-async def delete_cascade_user(data: CascadeRequest):
+async def delete_cascade_user(data: CascadeRequest, wait: bool = True):
     """Удаляет пользователя из каскадного соединения"""
     try:
         uid = str(UUID(data.uuid))
@@ -228,56 +317,51 @@ async def delete_cascade_user(data: CascadeRequest):
 
     try:
         logger.info(f"Удаление каскадного пользователя {uid}")
-        
-        async with aiofiles.open(XRAY_CONFIG_PATH, "r") as f:
-            config_data = await f.read()
-        config = json.loads(config_data)
-
-        # Ищем каскадный inbound
-        cascade_inbound = None
-        for inbound in config.get("inbounds", []):
-            if inbound.get("tag") == "vless-cascade":
-                cascade_inbound = inbound
-                break
-
-        if not cascade_inbound:
-            logger.warning("Каскадный inbound не найден")
-            return CascadeResponse(success=False, message="Cascade inbound not found")
-
-        # Удаляем клиента из каскадного inbound
-        clients = cascade_inbound["settings"]["clients"]
-        original_len = len(clients)
-        clients = [client for client in clients if client["id"] != uid]
-
-        if len(clients) == original_len:
-            logger.warning(f"UUID {uid} не найден в каскаде")
-            return CascadeResponse(success=False, message="UUID not found in cascade")
-
-        cascade_inbound["settings"]["clients"] = clients
-        logger.info(f"Клиент {uid} удален из каскада")
-
-        # Если каскадный inbound пустой, удаляем его
-        if not clients:
-            config["inbounds"] = [inbound for inbound in config["inbounds"] if inbound.get("tag") != "vless-cascade"]
-            logger.info("Пустой каскадный inbound удален")
 
-        # Удаляем правило маршрутизации для каскада, если inbound удален
-        if not clients:
-            config["routing"]["rules"] = [
-                rule for rule in config["routing"]["rules"] 
-                if rule.get("inboundTag") != ["vless-cascade"]
-            ]
-            logger.info("Правило маршрутизации для каскада удалено")
+        async with config_store.transaction() as config:
+            # Ищем каскадный inbound
+            cascade_inbound = config_store.inbound("vless-cascade")
+
+            if not cascade_inbound:
+                logger.warning("Каскадный inbound не найден")
+                return CascadeResponse(success=False, message="Cascade inbound not found")
+
+            # Удаляем клиента из каскадного inbound
+            removed = config_store.clients("vless-cascade").get(uid)
+
+            if removed is None:
+                logger.warning(f"UUID {uid} не найден в каскаде")
+                return CascadeResponse(success=False, message="UUID not found in cascade")
+
+            clients = [client for client in cascade_inbound["settings"]["clients"] if client["id"] != uid]
+            cascade_inbound["settings"]["clients"] = clients
+            logger.info(f"Клиент {uid} удален из каскада")
 
-        # Сохраняем конфиг
-        async with aiofiles.open(XRAY_CONFIG_PATH, "w") as f:
-            await f.write(json.dumps(config, indent=2))
-        logger.info("Конфиг успешно обновлен")
+            # Если каскадный inbound пустой, удаляем его
+            if not clients:
+                config["inbounds"] = [inbound for inbound in config["inbounds"] if inbound.get("tag") != "vless-cascade"]
+                logger.info("Пустой каскадный inbound удален")
 
-        # Перезапускаем Xray
-        await restart_xray()
+            # Удаляем правило маршрутизации для каскада, если inbound удален
+            if not clients:
+                config["routing"]["rules"] = [
+                    rule for rule in config["routing"]["rules"]
+                    if rule.get("inboundTag") != ["vless-cascade"]
+                ]
+                logger.info("Правило маршрутизации для каскада удалено")
+
+            # Сохраняем конфиг
+            await config_store.save(config, touched=["vless-cascade"] if clients else None)
+            logger.info("Конфиг успешно обновлен")
+
+        # Перезапуск нужен, только если каскадный inbound удалён целиком
+        if not clients:
+            forget_traffic([removed])
+            reload_pending = await schedule_reload(wait)
+        else:
+            reload_pending = await hot_remove_client("vless-cascade", removed, wait)
 
-        return CascadeResponse(success=True, message="Cascade user deleted successfully")
+        return CascadeResponse(success=True, message="Cascade user deleted successfully", reload_pending=reload_pending)
 
     except Exception as e:
         logger.error(f"Ошибка при удалении каскадного пользователя: {e}")
@@ -288,21 +372,8 @@ async def delete_cascade_user(data: CascadeRequest):
 async def count_cascade_users():
     """Возвращает количество пользователей в каскаде"""
     try:
-        async with aiofiles.open(XRAY_CONFIG_PATH, "r") as f:
-            config_data = await f.read()
-        config = json.loads(config_data)
-
-        cascade_inbound = None
-        for inbound in config.get("inbounds", []):
-            if inbound.get("tag") == "vless-cascade":
-                cascade_inbound = inbound
-                break
-
-        if not cascade_inbound:
-            return {"count": 0}
-
-        count = len(cascade_inbound["settings"]["clients"])
-        return {"count": count}
+        await config_store.load()
+        return {"count": len(config_store.clients("vless-cascade"))}
 
     except Exception as e:
         logger.error(f"Ошибка при подсчете каскадных пользователей: {e}")
@@ -313,22 +384,264 @@ async def count_cascade_users():
 async def list_cascade_users():
     """Возвращает список пользователей в каскаде"""
     try:
-        async with aiofiles.open(XRAY_CONFIG_PATH, "r") as f:
-            config_data = await f.read()
-        config = json.loads(config_data)
+        await config_store.load()
+        users = list(config_store.clients("vless-cascade"))
+        return {"users": users}
 
-        cascade_inbound = None
-        for inbound in config.get("inbounds", []):
-            if inbound.get("tag") == "vless-cascade":
-                cascade_inbound = inbound
-                break
+    except Exception as e:
+        logger.error(f"Ошибка при получении списка каскадных пользователей: {e}")
+        raise HTTPException(status_code=500, detail=str(e)) 
 
-        if not cascade_inbound:
-            return {"users": []}
 
-        users = [client["id"] for client in cascade_inbound["settings"]["clients"]]
-        return {"users": users}
+@router.post("/cascade/bulk", response_model=CascadeBulkResponse)
+async def create_cascade_users_bulk(data: CascadeBulkRequest, wait: bool = True):
+    """Создаёт пачку каскадных пользователей одной записью конфига и одним применением в Xray"""
+    uids, results = parse_uuids(data.uuids)
+
+    try:
+        logger.info(f"Пакетное создание каскадных пользователей: {len(uids)}")
+        added = []
+        server2_uuid = ""
+        layout_changed = False
+        async with config_store.transaction() as config:
+            existing = config_store.clients("vless-cascade")
+            for uid in uids:
+                if uid in existing:
+                    results.append(BulkResult(uuid=uid, success=False, message="UUID already exists in cascade"))
+                    continue
+                added.append({
+                    "id": uid,
+                    "level": 0,
+                    "email": f"{uid}@cascade"
+                })
+
+            if added:
+                server2_uuid, layout_changed = ensure_cascade_layout(
+                    config, data.server2_ip, data.server2_port, data.server2_uuid
+                )
+                config_store.inbound("vless-cascade")["settings"]["clients"].extend(added)
+                await config_store.save(config, touched=None if layout_changed else ["vless-cascade"])
+                logger.info(f"Конфиг записан, добавлено каскадных клиентов: {len(added)}")
+
+        reload_pending = False
+        if layout_changed:
+            reload_pending = await schedule_reload(wait)
+        elif added:
+            reload_pending = await hot_add_clients("vless-cascade", added, wait)
+
+        results.extend(
+            BulkResult(uuid=client["id"], success=True, vless_link=build_cascade_link(client["id"]),
+                       message="Cascade user created successfully")
+            for client in added
+        )
+        return CascadeBulkResponse(
+            success=bool(added), results=results, cascade_uuid=server2_uuid, reload_pending=reload_pending
+        )
 
     except Exception as e:
-        logger.error(f"Ошибка при получении списка каскадных пользователей: {e}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.error(f"Ошибка при пакетном создании каскадных пользователей: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/cascade/bulk", response_model=BulkResponse)
+async def delete_cascade_users_bulk(data: CascadeBulkRequest, wait: bool = True):
+    """Удаляет пачку каскадных пользователей одной записью конфига и одним применением в Xray"""
+    uids, results = parse_uuids(data.uuids)
+
+    try:
+        logger.info(f"Пакетное удаление каскадных пользователей: {len(uids)}")
+        removed = []
+        clients = []
+        async with config_store.transaction() as config:
+            cascade_inbound = config_store.inbound("vless-cascade")
+            existing = config_store.clients("vless-cascade")
+            for uid in uids:
+                if uid not in existing:
+                    results.append(BulkResult(uuid=uid, success=False, message="UUID not found in cascade"))
+                    continue
+                removed.append(existing[uid])
+
+            if removed:
+                removed_ids = {client["id"] for client in removed}
+                clients = [client for client in cascade_inbound["settings"]["clients"] if client["id"] not in removed_ids]
+                cascade_inbound["settings"]["clients"] = clients
+
+                # Пустой каскадный inbound и его правило маршрутизации удаляем
+                if not clients:
+                    config["inbounds"] = [inbound for inbound in config["inbounds"] if inbound.get("tag") != "vless-cascade"]
+                    config["routing"]["rules"] = [
+                        rule for rule in config["routing"]["rules"]
+                        if rule.get("inboundTag") != ["vless-cascade"]
+                    ]
+                    logger.info("Пустой каскадный inbound и его правило маршрутизации удалены")
+
+                await config_store.save(config, touched=["vless-cascade"] if clients else None)
+                logger.info(f"Конфиг записан, удалено каскадных клиентов: {len(removed)}")
+
+        reload_pending = False
+        if removed and not clients:
+            forget_traffic(removed)
+            reload_pending = await schedule_reload(wait)
+        elif removed:
+            reload_pending = await hot_remove_clients("vless-cascade", removed, wait)
+
+        results.extend(
+            BulkResult(uuid=client["id"], success=True, message="Cascade user deleted successfully")
+            for client in removed
+        )
+        return BulkResponse(success=bool(removed), results=results, reload_pending=reload_pending)
+
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном удалении каскадных пользователей: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cascade/upstream")
+async def get_cascade_upstream():
+    """Entry-узел: куда ведёт outbound cascade-to-server2; пустой ответ, если outbound ещё нет"""
+    try:
+        config = await config_store.load()
+        outbound = find_cascade_outbound(config)
+        if outbound is None:
+            return {}
+        vnext = outbound["settings"]["vnext"][0]
+        return CascadeConfig(server2_ip=vnext["address"], server2_port=vnext["port"], server2_uuid=vnext["users"][0]["id"])
+
+    except Exception as e:
+        logger.error(f"Ошибка при чтении outbound каскада: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.put("/cascade/upstream", response_model=CascadeResponse)
+async def set_cascade_upstream(data: CascadeConfig, wait: bool = True):
+    """Entry-узел: перенаправляет существующий outbound cascade-to-server2 (откат контроллера флота)"""
+    try:
+        async with config_store.transaction() as config:
+            outbound = find_cascade_outbound(config)
+            if outbound is None:
+                return CascadeResponse(success=False, message="Cascade outbound not found")
+            vnext = outbound["settings"]["vnext"][0]
+            upstream = (data.server2_ip, data.server2_port, data.server2_uuid or vnext["users"][0]["id"])
+            if (vnext["address"], vnext["port"], vnext["users"][0]["id"]) == upstream:
+                return CascadeResponse(success=True, message="Cascade upstream unchanged")
+            vnext["address"], vnext["port"], vnext["users"][0]["id"] = upstream
+            await config_store.save(config)
+            logger.info(f"Outbound каскада перенаправлен на {data.server2_ip}:{data.server2_port}")
+
+        reload_pending = await schedule_reload(wait)
+        return CascadeResponse(success=True, message="Cascade upstream updated", reload_pending=reload_pending)
+
+    except Exception as e:
+        logger.error(f"Ошибка при изменении outbound каскада: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cascade/exits")
+async def list_cascade_exits():
+    """Пул exit-серверов каскада: задержка по последним пробам, здоровье и применённый рейтинг"""
+    return cascade_exits.status()
+
+
+@router.put("/cascade/exits/{name}")
+async def register_cascade_exit(name: str, data: ExitRequest):
+    """Добавляет exit в пул; в балансировщик он попадёт после первых успешных проб"""
+    try:
+        UUID(data.uuid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid UUID")
+    try:
+        return cascade_exits.upsert(name=name, **data.model_dump()).to_dict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/cascade/exits/{name}")
+async def remove_cascade_exit(name: str):
+    if not cascade_exits.remove(name):
+        raise HTTPException(status_code=404, detail="Exit not found")
+    return {"success": True}
+
+
+@router.post("/cascade/link", response_model=CascadeResponse)
+async def create_cascade_link(data: CascadeLinkRequest, wait: bool = True):
+    """Exit-узел: принимает UUID связки entry -> exit в inbound на data.port (TCP без шифрования, без flow)"""
+    try:
+        uid = str(UUID(data.uuid))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid UUID")
+
+    try:
+        async with config_store.transaction() as config:
+            # Проверка дубликата до ensure_link_inbound: ранний выход не должен оставить
+            # в кеше хранилища несохранённый перенос порта или новый inbound
+            existing = find_link_inbound(config, data.port)
+            if (
+                existing is not None
+                and existing.get("port") == data.port
+                and uid in config_store.clients(existing.get("tag"))
+            ):
+                return CascadeResponse(success=False, message="UUID already exists")
+            inbound, layout_changed = ensure_link_inbound(config, data.port)
+            tag = inbound.get("tag")
+            client = config_store.clients(tag).get(uid)
+            if client is None:
+                # Без flow: xtls-rprx-vision несовместим с outbound entry-узла без шифрования
+                client = {
+                    "id": uid,
+                    "level": 0,
+                    "email": f"{uid}@link"
+                }
+                inbound["settings"]["clients"].append(client)
+            await config_store.save(config, touched=None if layout_changed else [tag])
+            logger.info(f"UUID связки {uid} добавлен в inbound {tag}")
+
+        if layout_changed:
+            reload_pending = await schedule_reload(wait)
+        else:
+            reload_pending = await hot_add_client(tag, client, wait)
+        return CascadeResponse(success=True, message="Cascade link created", reload_pending=reload_pending)
+
+    except Exception as e:
+        logger.error(f"Ошибка при создании связки каскада: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/cascade/link", response_model=CascadeResponse)
+async def delete_cascade_link(data: CascadeLinkRequest, wait: bool = True):
+    """Exit-узел: отзывает UUID связки; пустой inbound связок удаляется"""
+    try:
+        uid = str(UUID(data.uuid))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid UUID")
+
+    try:
+        async with config_store.transaction() as config:
+            inbound = next(
+                (inbound for inbound in config.get("inbounds", [])
+                 if is_link_inbound(inbound, data.port) and uid in config_store.clients(inbound.get("tag"))),
+                None,
+            )
+            if inbound is None:
+                return CascadeResponse(success=False, message="UUID not found")
+            tag = inbound.get("tag")
+            removed = config_store.clients(tag)[uid]
+            clients = [client for client in inbound["settings"]["clients"] if client["id"] != uid]
+            inbound["settings"]["clients"] = clients
+
+            layout_changed = not clients and tag == LINK_INBOUND_TAG
+            if layout_changed:
+                config["inbounds"] = [item for item in config["inbounds"] if item.get("tag") != LINK_INBOUND_TAG]
+                logger.info("Пустой inbound связок каскада удалён")
+            await config_store.save(config, touched=None if layout_changed else [tag])
+            logger.info(f"UUID связки {uid} удалён из inbound {tag}")
+
+        if layout_changed:
+            forget_traffic([removed])
+            reload_pending = await schedule_reload(wait)
+        else:
+            reload_pending = await hot_remove_client(tag, removed, wait)
+        return CascadeResponse(success=True, message="Cascade link deleted", reload_pending=reload_pending)
+
+    except Exception as e:
+        logger.error(f"Ошибка при удалении связки каскада: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,33 @@
+import os
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from app.core.loop_monitor import PROFILE_MAX_SECONDS, loop_monitor
+from app.core.security import require_admin
+from app.core.timing import SLOW_REQUEST_SECONDS, slowest
+
+# Состояние у каждого воркера своё: ответ относится к воркеру, который принял запрос (pid в ответе)
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/debug/requests")
+async def slow_requests(limit: int = Query(50, ge=1, le=200)):
+    """Самые медленные из недавних запросов с разбивкой по этапам"""
+    return {"pid": os.getpid(), "threshold_ms": SLOW_REQUEST_SECONDS * 1000, "requests": slowest(limit)}
+
+
+@router.get("/debug/loop")
+async def event_loop_status():
+    """Максимальное опоздание event loop и стеки недавних блокирующих вызовов"""
+    return loop_monitor.status()
+
+
+@router.get("/debug/profile", response_class=PlainTextResponse)
+async def profile_event_loop(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+):
+    """Сэмплирующий профиль event loop в формате collapsed stacks (flamegraph.pl, speedscope)"""
+    profile = await loop_monitor.profile(seconds, interval_ms / 1000)
+    return PlainTextResponse(profile, headers={"X-Worker-Pid": str(os.getpid())})
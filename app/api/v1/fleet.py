@@ -0,0 +1,108 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Literal
+import logging
+
+from app.services.fleet import fleet, FleetError, NODE_CONCURRENCY, NODE_TIMEOUT
+
+router = APIRouter()
+
+logger = logging.getLogger("fleet")
+
+
+class NodeRequest(BaseModel):
+    url: str
+    role: Literal["entry", "exit"] = "entry"
+    address: str = ""
+    cascade_port: int = 8443
+    max_concurrency: int = NODE_CONCURRENCY
+    timeout: float = NODE_TIMEOUT
+
+
+class FleetCascadeRequest(BaseModel):
+    uuids: list[str]
+    entry: str
+    exit: str = ""
+
+
+class FleetVLESSRequest(BaseModel):
+    uuids: list[str]
+    nodes: list[str] = []  # пусто — все entry-узлы
+
+
+class FleetFanOutResponse(BaseModel):
+    success: bool
+    nodes: dict
+    errors: dict
+
+
+@router.get("/fleet/nodes")
+async def list_nodes():
+    fleet.load()
+    return {"nodes": [node.to_dict() for node in fleet.nodes.values()]}
+
+
+@router.put("/fleet/nodes/{name}")
+async def register_node(name: str, data: NodeRequest):
+    """Регистрирует или обновляет узел флота"""
+    if data.role == "exit" and not data.address:
+        raise HTTPException(status_code=400, detail="Exit node requires address")
+    return fleet.upsert_node(name=name, **data.model_dump()).to_dict()
+
+
+@router.delete("/fleet/nodes/{name}")
+async def remove_node(name: str):
+    if not fleet.remove_node(name):
+        raise HTTPException(status_code=404, detail="Node not found")
+    return {"success": True}
+
+
+@router.get("/fleet/status")
+async def fleet_status():
+    """Опрашивает все узлы параллельно: число пользователей или ошибка"""
+    fleet.load()
+    responses, errors = await fleet.fan_out("GET", "/vless/count", None, list(fleet.nodes))
+    return {"nodes": responses, "errors": errors}
+
+
+@router.post("/fleet/cascade")
+async def provision_cascade(data: FleetCascadeRequest):
+    """Создаёт каскадных пользователей сразу на обоих хопах; при сбое одного хопа второй откатывается"""
+    if not data.exit:
+        raise HTTPException(status_code=400, detail="Exit node is required")
+    try:
+        return await fleet.provision_cascade(data.uuids, data.entry, data.exit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except FleetError as e:
+        logger.error(f"Каскад {data.entry} -> {data.exit} не создан: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+@router.delete("/fleet/cascade")
+async def remove_cascade(data: FleetCascadeRequest):
+    try:
+        return await fleet.remove_cascade(data.uuids, data.entry, data.exit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except FleetError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+@router.post("/fleet/vless", response_model=FleetFanOutResponse)
+async def fan_out_vless(data: FleetVLESSRequest):
+    """Создаёт VLESS-пользователей на всех выбранных узлах параллельно"""
+    try:
+        responses, errors = await fleet.fan_out("POST", "/vless/bulk", {"uuids": data.uuids}, data.nodes)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return FleetFanOutResponse(success=not errors, nodes=responses, errors=errors)
+
+
+@router.delete("/fleet/vless", response_model=FleetFanOutResponse)
+async def fan_out_vless_delete(data: FleetVLESSRequest):
+    try:
+        responses, errors = await fleet.fan_out("DELETE", "/vless/bulk", {"uuids": data.uuids}, data.nodes)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return FleetFanOutResponse(success=not errors, nodes=responses, errors=errors)
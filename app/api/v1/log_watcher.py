@@ -1,135 +1,159 @@
 import asyncio
 import aiohttp
-import re
-from datetime import datetime
-from asyncio.subprocess import PIPE, create_subprocess_exec
 import os
-import aiofiles
-from collections import deque
-
-# SQUID_LOG_PATH = "/logs/squid/access.log"
-
-XRAY_LOG_PATH = "/logs/xray/access.log"
-CENTRAL_LOG_SERVER = "https://admin.anonixvpn.space/proxylogs/receive-log/"
+import time
+
+from app.core.http import http_client
+from app.core.metrics import (
+    DEST_RULE_DROPPED, SQUID_HITS, SQUID_LOOKUP_SECONDS, SQUID_MISSES, TAIL_LAG_BYTES, TAIL_LAG_SECONDS,
+    XRAY_LINES_PARSED, XRAY_LINES_READ, XRAY_LINES_UNMATCHED,
+)
+from app.services.aggregator import AGGREGATE_WINDOW, ConnectionAggregator
+from app.services.connection_log import connection_log
+from app.services.destination_rules import destination_filter
+from app.services.file_follower import FileFollower
+from app.services.log_parser import collector_payload, parse_xray_line
+from app.services.squid_index import SquidLogIndex, SQUID_LOG_PATH
+from app.services.log_shipper import LogShipper
+from app.services.sessions import session_tracker
+
+XRAY_LOG_PATH = os.getenv("XRAY_LOG_PATH", "/logs/xray/access.log")
+CENTRAL_LOG_SERVER = os.getenv("CENTRAL_LOG_SERVER", "https://admin.anonixvpn.space/proxylogs/receive-log/")
+# Внешний IP узла; если не задан, узнаётся через api.ipify.org
+SERVER_PUBLIC_IP = os.getenv("SERVER_PUBLIC_IP", "")
+# Смещение обработанных строк переживает рестарт контейнера
+XRAY_LOG_STATE_PATH = os.path.join(os.getenv("TAILER_STATE_DIR", "/app/state"), "xray_access.offset")
+IP_LOOKUP_TIMEOUT = aiohttp.ClientTimeout(total=5)
+RULE_AGGREGATE_WINDOW = float(os.getenv("DEST_RULES_AGGREGATE_WINDOW", "60"))  # секунд
 
 class XrayLogTailer:
     def __init__(self):
         self.task = None
         self.running = False
-        self.squid_log_path = "/logs/squid/access.log"
-        self.server_ip = None
+        self.squid_log_path = SQUID_LOG_PATH
+        self.squid_index = SquidLogIndex(self.squid_log_path)
+        self.squid_task = None
+        self.shipper = LogShipper(CENTRAL_LOG_SERVER)
+        # Необязательная свёртка повторяющихся подключений перед отправкой в коллектор
+        self.aggregator = ConnectionAggregator(self.shipper.submit) if AGGREGATE_WINDOW > 0 else None
+        # Назначения с правилом aggregate сворачиваются всегда, даже если общая агрегация выключена
+        self.rule_aggregator = self.aggregator or ConnectionAggregator(
+            self.shipper.submit, window=RULE_AGGREGATE_WINDOW
+        )
+        self.follower = FileFollower(XRAY_LOG_PATH, state_path=XRAY_LOG_STATE_PATH)
+        self.server_ip = SERVER_PUBLIC_IP or None
+        self.last_record_ts = None  # unix-время последней обработанной строки
+        TAIL_LAG_BYTES.labels("xray").set_function(self.follower.lag_bytes)
+        TAIL_LAG_SECONDS.labels("xray").set_function(self.lag_seconds)
 
 
     def stop(self):
         self.running = False
+        self.follower.stop()
+        self.squid_index.stop()
+        if self.squid_task:
+            self.squid_task.cancel()
         if self.task:
             self.task.cancel()
 
-    async def find_squid_info(self, uuid, domain, xray_timestamp=None):
-        if not os.path.exists(self.squid_log_path):
-            return None, None
-        try:
-            async with aiofiles.open(self.squid_log_path, "r") as f:
-                lines = deque(maxlen=1000)
-                async for line in f:
-                    lines.append(line)
-            for line in reversed(lines):
-                match = re.match(r"(\d+\.\d+) [^ ]+ [^ ]+ ([^ ]+) ([A-Z]+) ([^ ]+) (\d+) (\d+) ", line)
-                if not match:
-                    continue
-                unix_ts, user, method, url, status, bytes_sent = match.groups()
-                user_base = user.split("@")[0]
-                url_domain = url.split(":")[0]
-                # Сравниваем uuid и домен
-                if uuid == user_base and domain == url_domain:
-                    # Если есть время из Xray, сравниваем разницу
-                    if xray_timestamp:
-                        squid_time = float(unix_ts)
-                        xray_time = xray_timestamp.timestamp()
-                        if abs(squid_time - xray_time) > 10:  # 10 секунд окно
-                            continue
-                    return status, int(bytes_sent)
-        except Exception as e:
-            print(f"Ошибка поиска в squid access.log: {e}")
-        return None, None
+    def find_squid_info(self, uuid, domain, xray_timestamp=None):
+        # Поиск по индексу в памяти вместо перечитывания access.log на каждую строку
+        started = time.perf_counter()
+        result = self.squid_index.lookup(uuid, domain, xray_timestamp)
+        SQUID_LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        (SQUID_MISSES if result[0] is None else SQUID_HITS).inc()
+        return result
+
+    def lag_seconds(self):
+        if self.last_record_ts is None:
+            return 0
+        return max(0.0, time.time() - self.last_record_ts)
 
     async def parse_xray_log(self):
-        print("📦 Запущен парсер Xray access.log через cat + tail -F")
+        print(f"📦 Запущен парсер Xray access.log: {XRAY_LOG_PATH}")
+        # IP нужен в каждой записи, поэтому узнаём его до первой строки, но не на старте приложения
+        await self.resolve_server_ip()
+
+        async for lines in self.follower:
+            XRAY_LINES_READ.inc(len(lines))
+            for line in lines:
+                self.handle_line(line)
 
+    def handle_line(self, line):
         try:
-            proc = await create_subprocess_exec(
-                "tail", "-F", XRAY_LOG_PATH,
-                stdout=PIPE, stderr=PIPE
-            )
-        except FileNotFoundError:
-            print(f"❌ Не удалось найти файл {XRAY_LOG_PATH}")
-            return
-
-        async with aiohttp.ClientSession() as session:
-            while self.running:
-                line = await proc.stdout.readline()
-                if not line:
-                    await asyncio.sleep(0.1)
-                    continue
-
-                line = line.decode().strip()
-                match = re.search(
-                    r"(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})\.\d+ from ([\d\.]+):\d+ accepted tcp:([^:]+):\d+ .*email: ([a-f0-9\-]+)",
-                    line
-                )
-                if not match:
-                    continue
-
-                timestamp_str, ip, domain, uuid = match.groups()
-                try:
-                    dt = datetime.strptime(timestamp_str, "%Y/%m/%d %H:%M:%S")
-                    timestamp_iso = dt.isoformat()
-                    # Найдём статус и байты из squid (асинхронно, с учётом времени)
-                    status, bytes_sent = await self.find_squid_info(uuid, domain, dt)
-
-                    # Новая логика: если статус найден — accepted, иначе failed
-                    if status is not None:
-                        status_out = "accepted"
-                    else:
-                        status_out = "failed"
-
-                    payload = {
-                        "uuid": uuid,
-                        "ip": ip,
-                        "destination": domain,
-                        "timestamp": timestamp_iso,
-                        "status": status_out,
-                        "bytes_sent": bytes_sent,
-                        "server_ip": self.server_ip,
-                        "raw_log": f"{line} server_ip: {self.server_ip}"
-                    }
-
-                    print(f"📤 Отправляем лог: {payload}")
-                    async with session.post(CENTRAL_LOG_SERVER, json=payload) as resp:
-                        if resp.status != 201:
-                            print(f"❗️Ошибка отправки: {resp.status}")
-                except Exception as e:
-                    print(f"⚠️ Ошибка обработки строки: {e}")
+            record = parse_xray_line(line)
+            if record is None:
+                if line:
+                    XRAY_LINES_UNMATCHED.inc()
+                return
+            XRAY_LINES_PARSED.inc()
+            if record.network != "tcp":
+                return
+
+            dt = record.timestamp
+            self.last_record_ts = dt.timestamp()
+            session_tracker.submit(record.uuid, record.ip, record.destination, self.last_record_ts)
+
+            # Шум (телеметрия, health-check CDN) отсеивается до корреляции и отправки
+            action, rule = destination_filter.decide(record.destination)
+            if action == "drop":
+                DEST_RULE_DROPPED.inc()
+                return
+
+            # Найдём статус и байты из squid (с учётом времени)
+            status, bytes_sent = self.find_squid_info(record.uuid, record.destination, dt)
+            payload = collector_payload(record, line, status, bytes_sent, self.server_ip)
+            if rule is not None and rule.action == "sample":
+                payload["sample_rate"] = rule.sample_rate
+
+            # Отправка идёт пачками в фоне, медленный коллектор не тормозит чтение
+            if action == "aggregate":
+                self.rule_aggregator.submit(payload, self.last_record_ts)
+            elif self.aggregator:
+                self.aggregator.submit(payload, self.last_record_ts)
+            else:
+                self.shipper.submit(payload)
+            # Локальная копия для запросов поддержки без похода на центральный сервер
+            connection_log.submit(payload)
+        except Exception as e:
+            print(f"⚠️ Ошибка обработки строки: {e}")
 
     async def tail_log(self):
         self.running = True
+        if not self.squid_task:
+            self.squid_task = asyncio.create_task(self.squid_index.run())
         await self.parse_xray_log()
 
+    async def resolve_server_ip(self):
+        """Внешний IP узла: запрашивается один раз при первой нужде и кешируется"""
+        if self.server_ip:
+            return self.server_ip
+        try:
+            async with http_client.session.get("https://api.ipify.org", timeout=IP_LOOKUP_TIMEOUT) as resp:
+                self.server_ip = (await resp.text()).strip()
+                print(f"🌍 Внешний IP сервера: {self.server_ip}")
+        except Exception as e:
+            print(f"❌ Не удалось получить IP: {e}")
+            self.server_ip = "unknown"
+        return self.server_ip
+
     async def start(self):
-        if not hasattr(self, "server_ip"):
-            self.server_ip = None
-
-        if not self.server_ip:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get("https://api.ipify.org") as resp:
-                        self.server_ip = await resp.text()
-                        print(f"🌍 Внешний IP сервера: {self.server_ip}")
-            except Exception as e:
-                print(f"❌ Не удалось получить IP: {e}")
-                self.server_ip = "unknown"
+        await self.shipper.start(http_client.session)
+        self.rule_aggregator.start()
+        destination_filter.start()
 
         if not self.task:
             self.task = asyncio.create_task(self.tail_log())
 
+    async def close(self):
+        """Останавливает чтение, сохраняет смещение и досылает накопленные записи"""
+        self.stop()
+        tasks = [task for task in (self.task, self.squid_task) if task]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = self.squid_task = None
+        await destination_filter.close()
+        await self.rule_aggregator.close()
+        await self.shipper.close()
+        print(f"🛑 Парсер остановлен, отправлено записей: {self.shipper.stats['sent']}")
+
 tailer = XrayLogTailer()
\ No newline at end of file
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+from app.services.connection_log import QUERY_LIMIT, connection_log
+
+router = APIRouter()
+
+
+class ConnectionLogEntry(BaseModel):
+    ts: str
+    uuid: str
+    ip: str | None = None
+    destination: str | None = None
+    status: str | None = None
+    bytes_sent: int | None = None
+
+
+class ConnectionLogPage(BaseModel):
+    items: list[ConnectionLogEntry]
+    next_cursor: str | None = None
+
+
+@router.get("/logs", response_model=ConnectionLogPage)
+async def get_connection_logs(
+    uuid: str | None = None,
+    destination: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=QUERY_LIMIT),
+):
+    """История подключений на этом узле из локального журнала; следующая страница — по next_cursor"""
+    if not uuid and not destination:
+        raise HTTPException(status_code=400, detail="uuid or destination is required")
+    try:
+        return await connection_log.query(uuid, destination, since, until, cursor, limit)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from app.services.destination_rules import destination_filter
+
+router = APIRouter()
+
+
+@router.get("/rules")
+async def get_destination_rules(top: int | None = Query(None, ge=1)):
+    """Правила назначения и число совпадений по каждому (самые частые первыми)"""
+    return destination_filter.status(top)
+
+
+@router.post("/rules/reload")
+async def reload_destination_rules():
+    """Перечитать файл правил сейчас, не дожидаясь проверки mtime"""
+    await destination_filter.reload(force=True)
+    if destination_filter.error:
+        raise HTTPException(status_code=400, detail=destination_filter.error)
+    return destination_filter.status(top=0)
@@ -0,0 +1,26 @@
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.services.sessions import session_tracker
+
+router = APIRouter()
+
+
+@router.get("/online")
+async def get_online(min_ips: int = Query(1, ge=1), limit: int | None = Query(None, ge=1)):
+    """Кто онлайн: пользователи с подключениями за окно трекера, самые недавние первыми"""
+    return session_tracker.online(min_ips, limit)
+
+
+@router.get("/vless/{uuid}/sessions")
+async def get_vless_sessions(uuid: str):
+    """Активные IP пользователя за окно: когда подключался, сколько раз и куда в последний раз"""
+    try:
+        uid = str(UUID(uuid))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid UUID")
+    sessions = session_tracker.sessions(uid)
+    if sessions is None:
+        raise HTTPException(status_code=404, detail="No active sessions")
+    return sessions
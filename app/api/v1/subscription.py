@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Header, HTTPException, Response
+from uuid import UUID
+
+from app.services.subscription import subscriptions
+
+router = APIRouter()
+
+
+@router.get("/sub/{uuid}")
+async def get_subscription(uuid: str, if_none_match: str | None = Header(default=None)):
+    """Подписка (base64) со ссылками на все inbound пользователя; при совпадении ETag — 304 без тела"""
+    try:
+        uid = str(UUID(uuid))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid UUID")
+
+    subscription = await subscriptions.get(uid)
+    if subscription is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    body, etag = subscription
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="text/plain", headers=headers)
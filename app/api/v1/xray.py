@@ -1,21 +1,23 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from pathlib import Path
 from uuid import UUID
-import json
-import aiofiles
 import asyncio
-import subprocess
 import logging
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.core.timing import span
+from app.services.config_store import config_store
+from app.services.docker_client import docker, DockerError
+from app.services.xray_control import XRAY_CONTAINER_NAME
+from app.services.reload_scheduler import reload_scheduler, schedule_reload
+from app.services.xray_api import xray_api, XrayApiError
+from app.services.squid_passwd import squid_passwd
+from app.services.traffic_stats import traffic_collector
 
 router = APIRouter()
 
-# Пути
-XRAY_CONFIG_PATH = Path("/usr/local/etc/xray/config.json")
-SQUID_PASSWD_FILE = Path("/etc/squid/passwd")
 SQUID_DEFAULT_PASSWORD = "x"
-XRAY_CONTAINER_NAME = "xray"
+HOT_APPLY_CONCURRENCY = 16  # одновременных вызовов API Xray при пакетных изменениях
 
 # Настройка логов
 logger = logging.getLogger("vless")
@@ -30,93 +32,150 @@ class VLESSResponse(BaseModel):
     success: bool
     vless_link: str = ""
     message: str = ""
+    reload_pending: bool = False
 
 
-async def add_user_to_htpasswd(user: str, password: str):
-    """Добавляет или обновляет пользователя в htpasswd"""
-    try:
-        logger.info(f"Добавление пользователя {user} в htpasswd")
-        result = subprocess.run(
-            ["htpasswd", "-b", "-m", SQUID_PASSWD_FILE, user, password],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        logger.info(f"Пользователь {user} успешно добавлен")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Ошибка htpasswd: {e.stderr.decode().strip()}")
-        raise RuntimeError(f"htpasswd error: {e.stderr.decode().strip()}")
+class VLESSBulkRequest(BaseModel):
+    uuids: list[str]
 
 
-async def restart_xray():
-    """Перезапуск контейнера Xray через docker"""
-    try:
-        logger.info(f"Перезапуск контейнера {XRAY_CONTAINER_NAME}")
-        proc = await asyncio.create_subprocess_exec(
-            "docker", "restart", XRAY_CONTAINER_NAME,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
-        if proc.returncode != 0:
-            raise RuntimeError(stderr.decode().strip())
-        logger.info(f"Контейнер {XRAY_CONTAINER_NAME} перезапущен")
-    except Exception as e:
-        logger.error(f"Ошибка перезапуска Xray: {e}")
-        raise
+class BulkResult(BaseModel):
+    uuid: str
+    success: bool
+    vless_link: str = ""
+    message: str = ""
+
+
+class BulkResponse(BaseModel):
+    success: bool
+    results: list[BulkResult]
+    reload_pending: bool = False
+
+
+async def hot_add_clients(tag: str, clients: list, wait: bool = True) -> bool:
+    """Добавляет клиентов в работающий Xray через API; если API недоступен — один перезапуск на всю пачку.
+
+    Возвращает True, если изменения применятся отложенным перезапуском (wait=False).
+    """
+    if tag and all(client.get("email") for client in clients):
+        semaphore = asyncio.Semaphore(HOT_APPLY_CONCURRENCY)
+
+        async def add(client):
+            async with semaphore:
+                await xray_api.add_vless_user(
+                    tag, client["id"], client["email"], client.get("flow", ""), client.get("level", 0)
+                )
+
+        try:
+            with span("xray_api"):
+                await asyncio.gather(*(add(client) for client in clients))
+            return False
+        except XrayApiError as e:
+            logger.warning(f"Не удалось добавить клиентов через API Xray: {e}")
+    return await schedule_reload(wait)
+
+
+def forget_traffic(clients: list):
+    """Сбрасывает историю трафика удалённых клиентов (вызывать после save)"""
+    # История нужна, пока UUID остаётся хотя бы в одном inbound (vless и каскад считаются вместе)
+    traffic_collector.forget(client["id"] for client in clients if not config_store.has_client(client["id"]))
+
+
+async def hot_remove_clients(tag: str, clients: list, wait: bool = True) -> bool:
+    """Удаляет клиентов из работающего Xray через API; если API недоступен — один перезапуск на всю пачку"""
+    forget_traffic(clients)
+    if tag and all(client.get("email") for client in clients):
+        semaphore = asyncio.Semaphore(HOT_APPLY_CONCURRENCY)
+
+        async def remove(client):
+            async with semaphore:
+                await xray_api.remove_user(tag, client["email"])
+
+        try:
+            with span("xray_api"):
+                await asyncio.gather(*(remove(client) for client in clients))
+            return False
+        except XrayApiError as e:
+            logger.warning(f"Не удалось удалить клиентов через API Xray: {e}")
+    return await schedule_reload(wait)
+
+
+async def hot_add_client(tag: str, client: dict, wait: bool = True) -> bool:
+    return await hot_add_clients(tag, [client], wait)
+
+
+async def hot_remove_client(tag: str, client: dict, wait: bool = True) -> bool:
+    return await hot_remove_clients(tag, [client], wait)
+
+
+def build_vless_link(uid: str) -> str:
+    domain = "indonesia.admin.anonixvpn.space"
+    port = 443
+    return (
+        f"vless://{uid}@{domain}:{port}"
+        f"?encryption=none&security=tls&type=ws&host=indonesia.admin.anonixvpn.space&path=%2Fws#indonesia"
+    )
+
+
+def parse_uuids(values: list) -> tuple:
+    """Нормализует список UUID: (валидные без повторов, результаты-ошибки для остальных)"""
+    valid, errors, seen = [], [], set()
+    for value in values:
+        try:
+            uid = str(UUID(value))
+        except ValueError:
+            errors.append(BulkResult(uuid=value, success=False, message="Invalid UUID"))
+            continue
+        if uid in seen:
+            errors.append(BulkResult(uuid=uid, success=False, message="Duplicate UUID in request"))
+            continue
+        seen.add(uid)
+        valid.append(uid)
+    return valid, errors
 
 
 @router.post("/vless", response_model=VLESSResponse)
-async def create_vless_user(data: VLESSRequest):
+async def create_vless_user(data: VLESSRequest, wait: bool = True):
     try:
         uid = str(UUID(data.uuid))
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID")
 
     try:
-        logger.info(f"Открытие Xray-конфига: {XRAY_CONFIG_PATH}")
-        async with aiofiles.open(XRAY_CONFIG_PATH, "r") as f:
-            config_data = await f.read()
-        config = json.loads(config_data)
+        async with config_store.transaction() as config:
+            inbound = config["inbounds"][0]
 
-        clients = config["inbounds"][0]["settings"]["clients"]
+            if uid in config_store.clients(inbound.get("tag")):
+                logger.warning(f"UUID уже существует: {uid}")
+                return VLESSResponse(success=False, message="UUID already exists")
 
-        if any(client["id"] == uid for client in clients):
-            logger.warning(f"UUID уже существует: {uid}")
-            return VLESSResponse(success=False, message="UUID already exists")
+            # Добавляем клиента (как у существующего пользователя)
+            client = {
+                "id": uid,
+                "level": 0,
+                "email": uid,
+                "flow": "xtls-rprx-vision"
+            }
+            inbound["settings"]["clients"].append(client)
+            logger.info(f"Клиент {uid} добавлен")
 
-        # Добавляем клиента (как у существующего пользователя)
-        clients.append({
-            "id": uid,
-            "level": 0,
-            "email": uid,
-            "flow": "xtls-rprx-vision"
-        })
-        logger.info(f"Клиент {uid} добавлен")
+            # Сохраняем конфиг
+            await config_store.save(config, touched=[inbound.get("tag")])
+            logger.info("Конфиг успешно записан")
 
-        # Сохраняем конфиг
-        async with aiofiles.open(XRAY_CONFIG_PATH, "w") as f:
-            await f.write(json.dumps(config, indent=2))
-        logger.info("Конфиг успешно записан")
+        # Обновляем пароли Squid
+        await squid_passwd.upsert([uid], SQUID_DEFAULT_PASSWORD)
 
-        # Обновляем htpasswd
-        await add_user_to_htpasswd(uid, SQUID_DEFAULT_PASSWORD)
-
-        # Перезапускаем Xray
-        await restart_xray()
+        # Применяем без перезапуска, конфиг на диске уже обновлён
+        reload_pending = await hot_add_client(inbound.get("tag"), client, wait)
 
         # Ссылка
-        domain = "indonesia.admin.anonixvpn.space"
-        port = 443
-        path = "/vless"
-
-        vless_link = (
-            f"vless://{uid}@{domain}:{port}"
-            f"?encryption=none&security=tls&type=ws&host=indonesia.admin.anonixvpn.space&path=%2Fws#indonesia"
-        )
+        vless_link = build_vless_link(uid)
 
         logger.info(f"VLESS ссылка сгенерирована: {vless_link}")
-        return VLESSResponse(success=True, vless_link=vless_link, message="VLESS user created")
+        return VLESSResponse(
+            success=True, vless_link=vless_link, message="VLESS user created", reload_pending=reload_pending
+        )
 
     except Exception as e:
         logger.error(f"Ошибка при создании VLESS: {e}")
@@ -124,7 +183,7 @@ async def create_vless_user(data: VLESSRequest):
 
 
 @router.delete("/vless", response_model=VLESSResponse)
-async def delete_vless_user(data: VLESSRequest):
+async def delete_vless_user(data: VLESSRequest, wait: bool = True):
     try:
         uid = str(UUID(data.uuid))
     except ValueError:
@@ -132,26 +191,23 @@ async def delete_vless_user(data: VLESSRequest):
 
     try:
         logger.info(f"Удаление VLESS-пользователя {uid}")
-        async with aiofiles.open(XRAY_CONFIG_PATH, "r") as f:
-            config_data = await f.read()
-        config = json.loads(config_data)
+        async with config_store.transaction() as config:
+            inbound = config["inbounds"][0]
+            removed = config_store.clients(inbound.get("tag")).get(uid)
 
-        clients = config["inbounds"][0]["settings"]["clients"]
-        original_len = len(clients)
-        clients = [client for client in clients if client["id"] != uid]
+            if removed is None:
+                logger.warning(f"UUID {uid} не найден")
+                return VLESSResponse(success=False, message="UUID not found")
 
-        if len(clients) == original_len:
-            logger.warning(f"UUID {uid} не найден")
-            return VLESSResponse(success=False, message="UUID not found")
+            clients = inbound["settings"]["clients"]
+            inbound["settings"]["clients"] = [client for client in clients if client["id"] != uid]
 
-        config["inbounds"][0]["settings"]["clients"] = clients
+            await config_store.save(config, touched=[inbound.get("tag")])
+            logger.info("Конфиг обновлён после удаления пользователя")
 
-        async with aiofiles.open(XRAY_CONFIG_PATH, "w") as f:
-            await f.write(json.dumps(config, indent=2))
-        logger.info("Конфиг обновлён после удаления пользователя")
-
-        await restart_xray()
-        return VLESSResponse(success=True, message="VLESS user deleted")
+        await squid_passwd.delete([uid])
+        reload_pending = await hot_remove_client(inbound.get("tag"), removed, wait)
+        return VLESSResponse(success=True, message="VLESS user deleted", reload_pending=reload_pending)
 
     except Exception as e:
         logger.error(f"Ошибка при удалении VLESS: {e}")
@@ -162,15 +218,150 @@ async def delete_vless_user(data: VLESSRequest):
 @router.get("/vless/count")
 async def count_vless_users():
     try:
-        logger.info(f"Подсчёт пользователей в конфиге: {XRAY_CONFIG_PATH}")
-        async with aiofiles.open(XRAY_CONFIG_PATH, "r") as f:
-            config_data = await f.read()
-        config = json.loads(config_data)
-
-        clients = config["inbounds"][0]["settings"].get("clients", [])
-        user_count = len(clients)
+        config = await config_store.load()
+        user_count = len(config_store.clients(config["inbounds"][0].get("tag")))
         logger.info(f"Найдено пользователей: {user_count}")
         return JSONResponse(content={"user_count": user_count})
     except Exception as e:
         logger.error(f"Ошибка при подсчёте VLESS-пользователей: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/xray/reload")
+async def get_reload_status():
+    """Состояние планировщика перезапусков Xray: очередь изменений и длительность последнего перезапуска"""
+    return reload_scheduler.status()
+
+
+@router.get("/xray/status")
+async def get_xray_status():
+    """Состояние контейнера Xray по Docker Engine API"""
+    try:
+        return await docker.status(XRAY_CONTAINER_NAME)
+    except DockerError as e:
+        raise HTTPException(status_code=e.status if e.status == 404 else 502, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Docker API unavailable: {e}")
+
+
+@router.get("/xray/logs")
+async def get_xray_logs(tail: int = 100, follow: bool = False):
+    """Логи контейнера Xray; с follow=true поток не закрывается и отдаёт новые строки"""
+    lines = docker.logs(XRAY_CONTAINER_NAME, tail=tail, follow=follow)
+    try:
+        # Ошибку Docker (нет контейнера, нет сокета) отдаём кодом ответа, а не обрывом потока
+        first = await anext(lines)
+    except StopAsyncIteration:
+        first = None
+    except DockerError as e:
+        raise HTTPException(status_code=e.status if e.status == 404 else 502, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Docker API unavailable: {e}")
+
+    async def body():
+        if first is None:
+            return
+        yield f"{first[1]}\n"
+        async for _, line in lines:
+            yield f"{line}\n"
+
+    return StreamingResponse(body(), media_type="text/plain")
+
+
+@router.get("/vless/traffic")
+async def export_vless_traffic():
+    """Трафик всех пользователей с момента запуска сервиса (байты, по данным StatsService Xray)"""
+    return traffic_collector.export()
+
+
+@router.get("/vless/{uuid}/traffic")
+async def get_vless_traffic(uuid: str, since: int | None = None):
+    """Трафик пользователя: итоги и ряд приращений (unix_ts, uplink, downlink)"""
+    try:
+        uid = str(UUID(uuid))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid UUID")
+    return traffic_collector.traffic(uid, since)
+
+
+@router.post("/vless/bulk", response_model=BulkResponse)
+async def create_vless_users_bulk(data: VLESSBulkRequest, wait: bool = True):
+    """Создаёт пачку VLESS-пользователей одной записью конфига и паролей Squid и одним применением в Xray"""
+    uids, results = parse_uuids(data.uuids)
+
+    try:
+        logger.info(f"Пакетное создание VLESS-пользователей: {len(uids)}")
+        added = []
+        reload_pending = False
+        async with config_store.transaction() as config:
+            inbound = config["inbounds"][0]
+            existing = config_store.clients(inbound.get("tag"))
+
+            for uid in uids:
+                if uid in existing:
+                    results.append(BulkResult(uuid=uid, success=False, message="UUID already exists"))
+                    continue
+                added.append({
+                    "id": uid,
+                    "level": 0,
+                    "email": uid,
+                    "flow": "xtls-rprx-vision"
+                })
+
+            if added:
+                inbound["settings"]["clients"].extend(added)
+                await config_store.save(config, touched=[inbound.get("tag")])
+                logger.info(f"Конфиг записан, добавлено клиентов: {len(added)}")
+
+        if added:
+            await squid_passwd.upsert([client["id"] for client in added], SQUID_DEFAULT_PASSWORD)
+            reload_pending = await hot_add_clients(inbound.get("tag"), added, wait)
+
+        results.extend(
+            BulkResult(uuid=client["id"], success=True, vless_link=build_vless_link(client["id"]),
+                       message="VLESS user created")
+            for client in added
+        )
+        return BulkResponse(success=bool(added), results=results, reload_pending=reload_pending)
+
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном создании VLESS: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/vless/bulk", response_model=BulkResponse)
+async def delete_vless_users_bulk(data: VLESSBulkRequest, wait: bool = True):
+    """Удаляет пачку VLESS-пользователей одной записью конфига и одним применением в Xray"""
+    uids, results = parse_uuids(data.uuids)
+
+    try:
+        logger.info(f"Пакетное удаление VLESS-пользователей: {len(uids)}")
+        removed = []
+        reload_pending = False
+        async with config_store.transaction() as config:
+            inbound = config["inbounds"][0]
+            existing = config_store.clients(inbound.get("tag"))
+
+            for uid in uids:
+                if uid not in existing:
+                    results.append(BulkResult(uuid=uid, success=False, message="UUID not found"))
+                    continue
+                removed.append(existing[uid])
+
+            if removed:
+                removed_ids = {client["id"] for client in removed}
+                clients = inbound["settings"]["clients"]
+                inbound["settings"]["clients"] = [client for client in clients if client["id"] not in removed_ids]
+                await config_store.save(config, touched=[inbound.get("tag")])
+                logger.info(f"Конфиг записан, удалено клиентов: {len(removed)}")
+
+        if removed:
+            await squid_passwd.delete([client["id"] for client in removed])
+            reload_pending = await hot_remove_clients(inbound.get("tag"), removed, wait)
+
+        results.extend(BulkResult(uuid=client["id"], success=True, message="VLESS user deleted") for client in removed)
+        return BulkResponse(success=bool(removed), results=results, reload_pending=reload_pending)
+
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном удалении VLESS: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,31 @@
+import aiohttp
+
+HTTP_POOL_LIMIT = 100  # соединений в общем пуле
+HTTP_POOL_LIMIT_PER_HOST = 16
+HTTP_TIMEOUT = 15
+
+
+class HttpClient:
+    """Общий на всё приложение aiohttp.ClientSession с keep-alive пулом; живёт столько же, сколько приложение"""
+
+    def __init__(self):
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=HTTP_POOL_LIMIT, limit_per_host=HTTP_POOL_LIMIT_PER_HOST, keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+http_client = HttpClient()
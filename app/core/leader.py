@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import fcntl
+import logging
+import os
+
+import aiohttp
+import uvicorn
+from fastapi.responses import JSONResponse
+from starlette.responses import Response
+
+# Координация воркеров uvicorn (--workers N): лидер выбирается через flock на общем файле.
+# Только лидер читает логи, опрашивает статистику и пишет конфиг Xray; остальные воркеры
+# отдают чтение сами (config_store перечитывает файл по mtime), а изменения пересылают лидеру
+# через его unix-сокет.
+STATE_DIR = os.getenv("TAILER_STATE_DIR", "/app/state")
+LEADER_LOCK_PATH = os.path.join(STATE_DIR, "leader.lock")
+LEADER_SOCKET_PATH = os.path.join(STATE_DIR, "leader.sock")
+LEADER_RETRY_INTERVAL = 2  # секунд между попытками перехватить лидерство
+FORWARD_TIMEOUT = 60  # изменения ждут перезапуска Xray
+FORWARDED_HEADER = "X-Forwarded-To-Leader"
+HOP_BY_HOP_HEADERS = {"host", "connection", "content-length", "transfer-encoding", "keep-alive"}
+# GET, данные которых есть только в памяти лидера
+LEADER_READ_PREFIXES = (
+    "/api/v1/xray/reload", "/api/v1/fleet", "/api/v1/vless/traffic", "/api/v1/backfill", "/api/v1/online",
+    "/api/v1/rules", "/api/v1/cascade/exits", "/metrics",
+)
+# /api/v1/vless/{uuid}/<suffix> с состоянием лидера
+LEADER_READ_SUFFIXES = ("/traffic", "/sessions")
+
+logger = logging.getLogger("leader")
+
+
+class _SocketServer(uvicorn.Server):
+    """uvicorn на unix-сокете внутри воркера: сигналы остаются у основного сервера"""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+class LeaderElection:
+    def __init__(self, lock_path=LEADER_LOCK_PATH, socket_path=LEADER_SOCKET_PATH):
+        self.lock_path = lock_path
+        self.socket_path = socket_path
+        self.is_leader = False
+        self._lock_fd = None
+        self._on_elected = None
+        self._app = None
+        self._watch_task = None
+        self._server = None
+        self._server_task = None
+        self._session = None
+
+    def _try_lock(self):
+        if self._lock_fd is None:
+            os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        os.ftruncate(self._lock_fd, 0)
+        os.write(self._lock_fd, f"{os.getpid()}\n".encode())
+        return True
+
+    async def start(self, app, on_elected):
+        """Пытается стать лидером; проигравший воркер продолжает попытки в фоне на случай смерти лидера"""
+        self._app = app
+        self._on_elected = on_elected
+        try:
+            elected = self._try_lock()
+        except OSError as e:
+            # Без общего каталога состояния координация невозможна — работаем как единственный процесс
+            logger.warning(f"Файл блокировки лидера недоступен ({e}), воркер считает себя лидером")
+            self.is_leader = True
+            await on_elected()
+            return
+        if elected:
+            await self._become_leader()
+        else:
+            logger.info(f"Воркер {os.getpid()} — ведомый, изменения пересылаются лидеру")
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(LEADER_RETRY_INTERVAL)
+            if self._try_lock():
+                await self._become_leader()
+                return
+
+    async def _become_leader(self):
+        self.is_leader = True
+        logger.info(f"Воркер {os.getpid()} стал лидером")
+        await self._on_elected()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.socket_path)
+        config = uvicorn.Config(self._app, uds=self.socket_path, lifespan="off", log_level="warning")
+        self._server = _SocketServer(config)
+        self._server_task = asyncio.create_task(self._server.serve())
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=self.socket_path),
+                timeout=aiohttp.ClientTimeout(total=FORWARD_TIMEOUT),
+            )
+        return self._session
+
+    async def forward(self, request):
+        """Повторяет запрос на лидере и возвращает его ответ как есть"""
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        headers[FORWARDED_HEADER] = str(os.getpid())
+        url = f"http://leader{request.url.path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+        try:
+            async with self.session.request(request.method, url, data=await request.body(), headers=headers) as resp:
+                content = await resp.read()
+                response_headers = {
+                    k: v for k, v in resp.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS
+                }
+                return Response(content=content, status_code=resp.status, headers=response_headers)
+        except (aiohttp.ClientError, FileNotFoundError) as e:
+            logger.warning(f"Лидер недоступен: {e}")
+            return JSONResponse(
+                status_code=503, content={"detail": "Leader unavailable"}, headers={"Retry-After": "2"}
+            )
+
+    async def close(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+        if self._server:
+            self._server.should_exit = True
+            await asyncio.gather(self._server_task, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # снимает flock
+            self._lock_fd = None
+
+
+def needs_leader(method, path):
+    if method not in ("GET", "HEAD", "OPTIONS"):
+        return True
+    return path.startswith(LEADER_READ_PREFIXES) or (
+        path.startswith("/api/v1/vless/") and path.endswith(LEADER_READ_SUFFIXES)
+    )
+
+
+def via_leader_socket(request):
+    """Запрос пришёл на unix-сокет лидера, а не на публичный порт"""
+    server = request.scope.get("server")
+    return bool(server) and server[1] is None and server[0] == leader.socket_path
+
+
+leader = LeaderElection()
+
+
+async def forward_to_leader(request, call_next):
+    """Middleware: на ведомом воркере изменения и чтение состояния лидера уходят лидеру.
+
+    Заголовок FORWARDED_HEADER может прислать любой клиент, поэтому он учитывается только
+    на сокете лидера: через публичный порт ведомый не применит изменение сам.
+    """
+    if (
+        leader.is_leader
+        or (FORWARDED_HEADER in request.headers and via_leader_socket(request))
+        or not needs_leader(request.method, request.url.path)
+    ):
+        return await call_next(request)
+    return await leader.forward(request)
@@ -0,0 +1,51 @@
+import logging
+from contextlib import asynccontextmanager
+
+from app.api.v1.log_watcher import tailer
+from app.core.http import http_client
+from app.core.leader import leader
+from app.core.loop_monitor import loop_monitor
+from app.services.cascade_exits import cascade_exits
+from app.services.connection_log import connection_log
+from app.services.docker_client import docker
+from app.services.reload_scheduler import reload_scheduler
+from app.services.sessions import session_tracker
+from app.services.traffic_stats import traffic_collector
+from app.services.xray_api import xray_api
+
+logger = logging.getLogger("lifespan")
+
+
+async def start_leader_tasks():
+    """Фоновые задачи, которые должны работать ровно в одном воркере"""
+    await connection_log.start()
+    await tailer.start()
+    await traffic_collector.start()
+    cascade_exits.start()
+
+
+async def stop_leader_tasks():
+    traffic_collector.stop()
+    await cascade_exits.close()
+    await reload_scheduler.close()
+    await tailer.close()
+    await session_tracker.close()
+    await connection_log.close()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Запуск фоновых задач и корректная остановка: парсер дочитывает и досылает логи, пулы закрываются"""
+    loop_monitor.start()
+    await leader.start(app, start_leader_tasks)
+    try:
+        yield
+    finally:
+        logger.info("Остановка сервиса: досылаем логи и закрываем соединения")
+        if leader.is_leader:
+            await stop_leader_tasks()
+        await leader.close()
+        await xray_api.close()
+        await docker.close()
+        await http_client.close()
+        await loop_monitor.close()
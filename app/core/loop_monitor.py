@@ -0,0 +1,156 @@
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+from app.core.metrics import EVENT_LOOP_BLOCKS, EVENT_LOOP_LAG_SECONDS
+
+# Следит, чтобы event loop не блокировался синхронными вызовами (subprocess, чтение файлов, хеширование).
+# Корутина раз в LOOP_CHECK_INTERVAL отмечает «пульс», а сторожевой поток, если пульса нет дольше
+# LOOP_BLOCK_THRESHOLD, снимает стек потока цикла — это и есть блокирующий вызов.
+LOOP_CHECK_INTERVAL = 0.05  # секунд
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))  # секунд
+BLOCKS_KEPT = 100
+PROFILE_MAX_SECONDS = 60
+PROFILE_INTERVAL = 0.005  # секунд между снимками стека
+COROUTINE_FLAGS = inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE | inspect.CO_ASYNC_GENERATOR
+
+logger = logging.getLogger("loop_monitor")
+
+
+def _frame_stack(frame):
+    """Стек от корня к текущему кадру: ['модуль:функция', ...]"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        stack.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _dispatch_point(frame):
+    """(глубина, кадр) места, откуда цикл (asyncio или uvloop) шагает задачи; вызывается внутри задачи"""
+    outermost = None
+    while frame is not None:
+        if frame.f_code.co_flags & COROUTINE_FLAGS:
+            outermost = frame
+        frame = frame.f_back
+    dispatch = outermost.f_back if outermost is not None else None
+    stack = _frame_stack(dispatch)
+    return len(stack), stack[-1] if stack else None
+
+
+class LoopMonitor:
+    def __init__(self, threshold=LOOP_BLOCK_THRESHOLD, interval=LOOP_CHECK_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.blocks = deque(maxlen=BLOCKS_KEPT)
+        self.max_lag = 0.0
+        self._loop_thread_id = None
+        self._dispatch = None
+        self._heartbeat = time.monotonic()
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+        self._profile_lock = asyncio.Lock()
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+    def _watch(self):
+        reported = None  # пульс, для которого блокировка уже записана
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat
+            if stalled < self.threshold or reported == heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported = heartbeat
+            stack = traceback.format_stack(frame)[-8:]
+            EVENT_LOOP_BLOCKS.inc()
+            self.blocks.append({"at": time.time(), "stalled_ms": round(stalled * 1000, 1), "stack": stack})
+            logger.warning(f"Event loop заблокирован на {stalled * 1000:.0f}+ мс:\n{''.join(stack[-3:])}")
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._dispatch = _dispatch_point(sys._getframe())
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._stopped.set()
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "threshold_ms": self.threshold * 1000,
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "blocks": list(reversed(self.blocks)),
+        }
+
+    def _sample(self, seconds, interval, stacks, stop):
+        depth, dispatch = self._dispatch
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not stop.is_set():
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                stack = _frame_stack(frame)
+                if len(stack) > depth and stack[depth - 1] == dispatch:
+                    # Кадры самого цикла одинаковы во всех снимках — оставляем только задачу
+                    stack = stack[depth:]
+                elif len(stack) <= depth:
+                    stack = ["idle"]  # цикл ждёт событий
+                else:
+                    stack = ["event_loop"] + stack[depth:]  # колбэки и внутренности цикла
+                stacks[";".join(stack)] += 1
+            time.sleep(interval)
+
+    async def profile(self, seconds, interval=PROFILE_INTERVAL):
+        """Сэмплирующий профиль потока event loop за seconds секунд в формате collapsed stacks
+        (строка 'кадр;кадр;... число' — вход для flamegraph.pl и speedscope).
+
+        Снимок берётся, когда поток цикла отпускает GIL, поэтому участки короче
+        sys.getswitchinterval() (5 мс) недосчитываются; длинные синхронные вызовы видны всегда."""
+        if self._loop_thread_id is None:
+            self._loop_thread_id = threading.get_ident()
+            self._dispatch = _dispatch_point(sys._getframe())
+        seconds = min(seconds, PROFILE_MAX_SECONDS)
+        stacks = Counter()
+        stop = threading.Event()
+        async with self._profile_lock:
+            try:
+                await asyncio.to_thread(self._sample, seconds, interval, stacks, stop)
+            finally:
+                stop.set()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,61 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Метрики узла для /metrics. Счётчики горячего пути строк наращиваются пачками,
+# отставание считается в момент опроса через set_function — на разбор логов это не влияет.
+
+LOG_LINES = Counter("xray_log_lines_total", "Строки access.log по стадиям обработки", ["source", "stage"])
+XRAY_LINES_READ = LOG_LINES.labels("xray", "read")
+XRAY_LINES_PARSED = LOG_LINES.labels("xray", "parsed")
+XRAY_LINES_UNMATCHED = LOG_LINES.labels("xray", "unmatched")  # строка не разобрана парсером
+SQUID_LINES_READ = LOG_LINES.labels("squid", "read")
+
+SQUID_LOOKUPS = Counter("squid_correlation_lookups_total", "Поиски записи Squid для строки Xray", ["result"])
+SQUID_HITS = SQUID_LOOKUPS.labels("hit")
+SQUID_MISSES = SQUID_LOOKUPS.labels("miss")
+SQUID_LOOKUP_SECONDS = Histogram(
+    "squid_correlation_lookup_seconds", "Время поиска в индексе Squid",
+    buckets=(1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 1e-2),
+)
+
+TAIL_LAG_BYTES = Gauge("log_tail_lag_bytes", "Сколько байт файла ещё не обработано", ["source"])
+TAIL_LAG_SECONDS = Gauge("log_tail_lag_seconds", "Отставание времени последней обработанной строки от текущего", ["source"])
+
+AGGREGATOR_RECORDS = Counter("log_aggregator_records_total", "Записи на входе и выходе агрегатора", ["direction"])
+AGGREGATOR_IN = AGGREGATOR_RECORDS.labels("in")
+AGGREGATOR_OUT = AGGREGATOR_RECORDS.labels("out")
+
+COLLECTOR_POST_SECONDS = Histogram("log_collector_post_seconds", "Длительность POST пачки в центральный коллектор")
+COLLECTOR_RESPONSES = Counter("log_collector_responses_total", "Ответы коллектора по коду ('error' — нет ответа)", ["code"])
+
+CONFIG_IO_SECONDS = Histogram(
+    "xray_config_io_seconds", "Чтение и запись config.json Xray", ["operation"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+CONFIG_SIZE_BYTES = Gauge("xray_config_size_bytes", "Размер config.json Xray")
+CONFIG_CLIENTS = Gauge("xray_config_clients", "Клиентов в inbound", ["tag"])
+
+XRAY_RESTART_SECONDS = Histogram(
+    "xray_restart_seconds", "Длительность перезапуска Xray",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+XRAY_RESTART_FAILURES = Counter("xray_restart_failures_total", "Неудачные перезапуски Xray")
+
+SESSION_USERS = Gauge("xray_online_users", "Пользователи с подключениями за окно трекера сессий")
+SESSION_LIMIT_EXCEEDED = Counter("xray_session_limit_exceeded_total", "Превышения лимита одновременных IP на UUID")
+
+DEST_RULE_MATCHES = Counter("destination_rule_matches_total", "Строки, совпавшие с правилами назначения", ["action"])
+DEST_RULE_DROPPED = Counter("destination_rule_dropped_total", "Строки, отброшенные правилами до корреляции и отправки")
+
+REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "Длительность запросов к API по шаблону маршрута", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUEST_STAGE_SECONDS = Histogram(
+    "http_request_stage_seconds", "Этапы внутри обработчиков: конфиг, htpasswd, применение в Xray", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "Опоздание пробуждения таймера event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+EVENT_LOOP_BLOCKS = Counter("event_loop_blocks_total", "Блокировки event loop дольше LOOP_BLOCK_THRESHOLD")
@@ -1 +1,15 @@
-# Здесь будет логика для JWT, OAuth2
\ No newline at end of file
+# Здесь будет логика для JWT, OAuth2
+import hmac
+import os
+
+from fastapi import Header, HTTPException
+
+# Токен администратора для отладочных эндпоинтов; пока он не задан, эндпоинты выключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+async def require_admin(x_admin_token: str | None = Header(default=None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
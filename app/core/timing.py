@@ -0,0 +1,104 @@
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.core.metrics import REQUEST_SECONDS, REQUEST_STAGE_SECONDS
+
+# Время запросов по маршрутам и по этапам внутри обработчика (чтение конфига, htpasswd, перезапуск Xray).
+# Этапы отмечаются span(...) в сервисах; вне запроса span ничего не делает.
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0.5"))
+SLOW_REQUESTS_KEPT = 200  # последних медленных запросов в кольцевом буфере
+
+_current = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    __slots__ = ("method", "path", "route", "status", "started_at", "started", "duration", "stages")
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.stages = {}  # этап -> [секунд всего, раз]
+
+    def add(self, stage, seconds):
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def as_dict(self):
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "stages": {
+                stage: {"ms": round(seconds * 1000, 2), "count": count}
+                for stage, (seconds, count) in sorted(self.stages.items(), key=lambda item: -item[1][0])
+            },
+        }
+
+
+@contextmanager
+def span(stage):
+    """Засекает этап текущего запроса; работает и в корутинах, и в asyncio.to_thread"""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timing.add(stage, elapsed)
+        REQUEST_STAGE_SECONDS.labels(stage).observe(elapsed)
+
+
+slow_requests = deque(maxlen=SLOW_REQUESTS_KEPT)
+
+
+class TimingMiddleware:
+    """ASGI-middleware: длительность запроса по шаблону маршрута и медленные запросы с разбивкой по этапам"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timing = RequestTiming(scope["method"], scope["path"])
+        token = _current.set(timing)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                timing.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            timing.duration = time.perf_counter() - timing.started
+            route = scope.get("route")
+            # Шаблон, а не путь: /vless/{uuid}/traffic не плодит метки на каждого пользователя
+            timing.route = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.labels(timing.method, timing.route).observe(timing.duration)
+            if timing.duration >= SLOW_REQUEST_SECONDS:
+                slow_requests.append(timing)
+
+
+def slowest(limit=50):
+    return [timing.as_dict() for timing in sorted(slow_requests, key=lambda timing: -timing.duration)[:limit]]
@@ -1,10 +1,17 @@
 from fastapi import FastAPI
-from app.api.v1 import xray, cascade
-from app.api.v1.log_watcher import tailer
+from app.api.v1 import xray, cascade, logs, fleet, subscription, backfill, sessions, rules, debug
+from app.core.leader import forward_to_leader
+from app.core.lifespan import lifespan
+from app.core.timing import TimingMiddleware
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import make_asgi_app
 
-app = FastAPI(title="Xray FastAPI Service")
+app = FastAPI(title="Xray FastAPI Service", lifespan=lifespan)
 
+# Время запросов и этапов; пересланный лидеру запрос замеряется на лидере
+app.add_middleware(TimingMiddleware)
+# При --workers N изменения выполняет только воркер-лидер; CORS добавляется снаружи и к пересланным ответам
+app.middleware("http")(forward_to_leader)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -15,7 +22,13 @@ app.add_middleware(
 
 app.include_router(xray.router, prefix="/api/v1", tags=["Xray"])
 app.include_router(cascade.router, prefix="/api/v1", tags=["Cascade"])
+app.include_router(logs.router, prefix="/api/v1", tags=["Logs"])
+app.include_router(fleet.router, prefix="/api/v1", tags=["Fleet"])
+app.include_router(subscription.router, prefix="/api/v1", tags=["Subscription"])
+app.include_router(backfill.router, prefix="/api/v1", tags=["Backfill"])
+app.include_router(sessions.router, prefix="/api/v1", tags=["Sessions"])
+app.include_router(rules.router, prefix="/api/v1", tags=["Rules"])
+app.include_router(debug.router, prefix="/api/v1", tags=["Debug"])
 
-@app.on_event("startup")
-async def startup_event():
-    await tailer.start()
+# Метрики Prometheus: отставание парсера, коррелятор Squid, коллектор, конфиг и перезапуски Xray
+app.mount("/metrics", make_asgi_app())
@@ -0,0 +1,36 @@
+import threading
+
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table
+
+# Журнал подключений разбит на таблицы по дням: старые дни удаляются через DROP TABLE,
+# без DELETE по миллионам строк и без разрастания файла
+connection_log_metadata = MetaData()
+
+TABLE_PREFIX = "connections_"
+# Таблицы создаются и из потока записи, и из потоков запросов
+_tables_lock = threading.Lock()
+
+
+def connection_log_table(day):
+    """Таблица журнала за день day ('YYYYMMDD')"""
+    name = f"{TABLE_PREFIX}{day}"
+    with _tables_lock:
+        if name in connection_log_metadata.tables:
+            return connection_log_metadata.tables[name]
+        return _define_table(name)
+
+
+def _define_table(name):
+    return Table(
+        name,
+        connection_log_metadata,
+        Column("id", Integer, primary_key=True),
+        Column("ts", String, nullable=False),  # ISO-время из access.log Xray
+        Column("uuid", String, nullable=False),
+        Column("ip", String),
+        Column("destination", String),
+        Column("status", String),
+        Column("bytes_sent", Integer),
+        Index(f"ix_{name}_uuid_ts", "uuid", "ts"),
+        Index(f"ix_{name}_destination", "destination"),
+    )
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+
+from app.core.metrics import AGGREGATOR_IN, AGGREGATOR_OUT
+
+AGGREGATE_WINDOW = float(os.getenv("LOG_AGGREGATE_WINDOW", "0"))  # секунд; 0 — агрегация выключена
+AGGREGATE_MODE = os.getenv("LOG_AGGREGATE_MODE", "tumbling")  # tumbling | sliding
+AGGREGATE_MAX_KEYS = int(os.getenv("LOG_AGGREGATE_MAX_KEYS", "50000"))
+MAX_SPAN_WINDOWS = 10  # sliding: окно одного ключа не растягивается дольше MAX_SPAN_WINDOWS * window
+FLUSH_INTERVAL = 1  # секунд
+
+logger = logging.getLogger("aggregator")
+
+
+class _Bucket:
+    __slots__ = ("first", "window_id", "first_ts", "last_ts", "last_seen", "connections", "bytes_sent", "accepted")
+
+    def __init__(self, payload, ts, window_id):
+        self.first = payload
+        self.window_id = window_id
+        self.first_ts = ts
+        self.last_ts = ts
+        self.last_seen = payload["timestamp"]
+        self.connections = 0
+        self.bytes_sent = None
+        self.accepted = False
+
+    def add(self, payload, ts):
+        self.connections += 1
+        self.last_ts = ts
+        self.last_seen = payload["timestamp"]
+        if payload.get("bytes_sent") is not None:
+            self.bytes_sent = (self.bytes_sent or 0) + payload["bytes_sent"]
+        if payload.get("status") == "accepted":
+            self.accepted = True
+
+    def record(self):
+        return {
+            **self.first,
+            "status": "accepted" if self.accepted else "failed",
+            "bytes_sent": self.bytes_sent,
+            "connections": self.connections,
+            "first_seen": self.first["timestamp"],
+            "last_seen": self.last_seen,
+        }
+
+
+class ConnectionAggregator:
+    """Сворачивает записи подключений по ключу (uuid, ip, destination) в одну запись на окно.
+
+    tumbling — окна фиксированной длины, выровненные по времени событий.
+    sliding — окно ключа сдвигается с каждым событием и закрывается после window секунд тишины
+    (но не длиннее MAX_SPAN_WINDOWS окон). Ключей не больше max_keys: самые старые отдаются досрочно.
+    """
+
+    def __init__(self, sink, window=AGGREGATE_WINDOW, mode=AGGREGATE_MODE, max_keys=AGGREGATE_MAX_KEYS):
+        if mode not in ("tumbling", "sliding"):
+            raise ValueError(f"Unknown aggregation mode {mode}")
+        self.sink = sink
+        self.window = window
+        self.sliding = mode == "sliding"
+        self.max_keys = max_keys
+        # Порядок: tumbling — по началу окна, sliding — по последнему событию; истёкшие всегда в начале
+        self._buckets = OrderedDict()
+        self._watermark = 0.0  # самое свежее время события
+        self._last_event = time.monotonic()
+        self._task = None
+        self.stats = {"received": 0, "emitted": 0, "evicted": 0}
+
+    def submit(self, payload, ts=None):
+        """payload — запись парсера, ts — её unix-время"""
+        if ts is None:
+            ts = time.time()
+        self.stats["received"] += 1
+        AGGREGATOR_IN.inc()
+        self._last_event = time.monotonic()
+        if ts > self._watermark:
+            self._watermark = ts
+
+        key = (payload["uuid"], payload["ip"], payload["destination"])
+        bucket = self._buckets.get(key)
+        window_id = None if self.sliding else math.floor(ts / self.window)
+        if bucket is not None and not self._same_window(bucket, ts, window_id):
+            self._emit(self._buckets.pop(key))
+            bucket = None
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(payload, ts, window_id)
+            if len(self._buckets) > self.max_keys:
+                self.stats["evicted"] += 1
+                self._emit(self._buckets.popitem(last=False)[1])
+        elif self.sliding:
+            self._buckets.move_to_end(key)
+        bucket.add(payload, ts)
+
+    def _same_window(self, bucket, ts, window_id):
+        if self.sliding:
+            return ts - bucket.last_ts < self.window and ts - bucket.first_ts < self.window * MAX_SPAN_WINDOWS
+        return bucket.window_id == window_id
+
+    def _expired(self, bucket, watermark):
+        if self.sliding:
+            return bucket.last_ts + self.window <= watermark
+        return (bucket.window_id + 1) * self.window <= watermark
+
+    def _emit(self, bucket):
+        self.stats["emitted"] += 1
+        AGGREGATOR_OUT.inc()
+        self.sink(bucket.record())
+
+    def flush_expired(self):
+        """Отдаёт закрытые окна; если события перестали приходить, закрывает все"""
+        if time.monotonic() - self._last_event >= self.window:
+            self.flush_all()
+            return
+        buckets = self._buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if not self._expired(bucket, self._watermark):
+                break
+            del buckets[key]
+            self._emit(bucket)
+
+    def flush_all(self):
+        while self._buckets:
+            self._emit(self._buckets.popitem(last=False)[1])
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush_expired()
+            except Exception as e:
+                logger.error(f"Ошибка агрегатора: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Останавливает таймер и отдаёт все незакрытые окна"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush_all()
+        logger.info(f"Агрегатор остановлен: {self.stats}")
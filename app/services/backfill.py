@@ -0,0 +1,499 @@
+"""Догрузка истории из ротированных access.log Xray (в т.ч. .gz) в центральный коллектор.
+
+Сначала логи Squid за один проход раскладываются по срезам времени (BACKFILL_SLICE_SECONDS)
+во временном каталоге задачи. Затем пул процессов разбирает логи Xray (файл или кусок файла
+на задачу) пачками по PART_BATCH_RECORDS записей и подгружает только срезы Squid, нужные
+пачке. Результат каждой задачи пишется во временный JSONL и отправляется тем же LogShipper,
+что и живой поток, с idempotency_key для дедупликации на коллекторе. Неотправленный спул
+в конце передаётся живому шипперу, а временный каталог удаляется.
+
+Запуск из корня репозитория:
+    python -m app.services.backfill --xray /logs/xray/access.log.1 /logs/xray/access.log.2.gz \
+        --squid /logs/squid/access.log* --since 2025-06-14T00:00 --until 2025-06-15T00:00
+"""
+import argparse
+import asyncio
+import bisect
+import glob
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import aiohttp
+
+from app.services.log_parser import collector_payload, parse_squid_line, parse_xray_line
+from app.services.log_shipper import SPOOL_DIR, LogShipper, hand_off_spool
+from app.services.squid_index import MATCH_WINDOW
+
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", str(os.cpu_count() or 2)))
+BACKFILL_DIR = os.path.join(os.getenv("TAILER_STATE_DIR", "/app/state"), "backfill")
+CHUNK_BYTES = 64 * 1024 * 1024  # несжатые файлы режутся на куски такого размера
+READ_BLOCK = 1024 * 1024
+SHIP_READ_LINES = 5000
+PART_BATCH_RECORDS = 20000  # записей Xray в памяти воркера за раз
+BACKFILL_SLICE_SECONDS = int(os.getenv("BACKFILL_SLICE_SECONDS", "300"))  # срез индекса Squid
+SQUID_FLUSH_LINES = 100_000  # строк срезов в памяти, прежде чем дописать их на диск
+WORKER_NICE = 10  # воркеры уступают CPU живому парсеру
+
+logger = logging.getLogger("backfill")
+
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return [path for path in dict.fromkeys(paths) if os.path.isfile(path)]
+
+
+def _local_naive(value):
+    """Время Xray в логах локальное и без зоны — приводим границы к тому же виду"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def plan_parts(paths, chunk_bytes=CHUNK_BYTES):
+    """[(path, start, end, вес в байтах)]: .gz целиком, обычные файлы — кусками по chunk_bytes"""
+    parts = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if path.endswith(".gz") or size <= chunk_bytes:
+            parts.append((path, 0, None, size))
+            continue
+        for start in range(0, size, chunk_bytes):
+            end = min(start + chunk_bytes, size)
+            parts.append((path, start, end, end - start))
+    return parts
+
+
+def iter_lines(path, start=0, end=None):
+    """Строки файла, начинающиеся в [start, end); строка на границе достаётся куску, где она началась.
+
+    Читает блоками по READ_BLOCK и режет их целиком — построчное чтение gzip в разы медленнее.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        if start:
+            f.seek(start - 1)
+            if f.read(1) != b"\n":
+                f.readline()
+        remaining = None if end is None else end - f.tell()
+        partial = b""
+        while remaining is None or remaining > 0:
+            block = f.read(READ_BLOCK if remaining is None else min(READ_BLOCK, remaining))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            data = partial + block
+            cut = data.rfind(b"\n")
+            if cut < 0:
+                partial = data
+                continue
+            partial = data[cut + 1:]
+            yield from data[:cut].decode("utf-8", "replace").split("\n")
+        if partial:
+            # Последняя строка куска началась до end — дочитываем её целиком
+            if remaining is not None and remaining <= 0:
+                partial += f.readline().rstrip(b"\n")
+            yield partial.decode("utf-8", "replace")
+
+
+def _squid_ts(line):
+    """Время строки Squid без полного разбора (первое поле) или None"""
+    try:
+        return float(line[:line.find(" ")])
+    except ValueError:
+        return None
+
+
+def squid_span(path):
+    """(путь, первое, последнее) unix-время в файле Squid или None; несжатый файл читается только с краёв.
+
+    У .gz последнее время без полной распаковки не узнать, поэтому берётся только первое (last = None):
+    файл целиком распакует один проход slice_squid, отбросив записи вне окна.
+    """
+    first = last = None
+    if path.endswith(".gz"):
+        for line in iter_lines(path):
+            first = _squid_ts(line)
+            if first is not None:
+                return path, first, None
+        return None
+    size = os.path.getsize(path)
+    head = iter_lines(path, 0, min(size, READ_BLOCK))
+    lines = head if size <= READ_BLOCK else [*head, *iter_lines(path, size - READ_BLOCK)]
+    for line in lines:
+        ts = _squid_ts(line)
+        if ts is None:
+            continue
+        first = ts if first is None else min(first, ts)
+        last = ts if last is None else max(last, ts)
+    return None if first is None else (path, first, last)
+
+
+def _lower_priority():
+    try:
+        os.nice(WORKER_NICE)
+    except OSError:
+        pass
+
+
+def _slice_path(squid_dir, number, file_no):
+    return os.path.join(squid_dir, f"squid-{number}-{file_no}.tsv")
+
+
+def slice_squid(path, file_no, ts_from, ts_to, squid_dir, slice_seconds=BACKFILL_SLICE_SECONDS):
+    """Задача пула: один проход по файлу Squid, записи в окне раскладываются по срезам времени.
+
+    Строка среза: ts, uuid, домен, статус, байты через табуляцию. Возвращает номера срезов.
+    """
+    buffers = {}
+    buffered = 0
+    written = set()
+
+    def flush():
+        for number, lines in buffers.items():
+            with open(_slice_path(squid_dir, number, file_no), "a") as f:
+                f.write("".join(lines))
+        written.update(buffers)
+        buffers.clear()
+
+    for line in iter_lines(path):
+        ts = _squid_ts(line)
+        if ts is None or (ts_from is not None and ts < ts_from) or (ts_to is not None and ts > ts_to):
+            continue
+        record = parse_squid_line(line)
+        if record is None:
+            continue
+        bytes_sent = "" if record.bytes_sent is None else record.bytes_sent
+        buffers.setdefault(int(record.timestamp // slice_seconds), []).append(
+            f"{record.timestamp}\t{record.user.split('@')[0]}\t{record.host}\t{record.status}\t{bytes_sent}\n"
+        )
+        buffered += 1
+        if buffered >= SQUID_FLUSH_LINES:
+            flush()
+            buffered = 0
+    flush()
+    return written
+
+
+class _SquidSlices:
+    """Срезы Squid, загруженные воркером: номер -> {(uuid, домен): отсортированные [(ts, status, bytes)]}"""
+
+    def __init__(self, squid_dir, slice_seconds=BACKFILL_SLICE_SECONDS, window=MATCH_WINDOW):
+        self.squid_dir = squid_dir
+        self.slice_seconds = slice_seconds
+        self.window = window
+        self.slices = {}
+
+    def _load(self, number):
+        index = {}
+        for path in glob.glob(os.path.join(self.squid_dir, f"squid-{number}-*.tsv")):
+            with open(path) as f:
+                for line in f:
+                    ts, user, host, status, bytes_sent = line.rstrip("\n").split("\t")
+                    index.setdefault((user, host), []).append(
+                        (float(ts), int(status), int(bytes_sent) if bytes_sent else None)
+                    )
+        for entries in index.values():
+            entries.sort(key=lambda entry: entry[0])
+        return index
+
+    def cover(self, ts_from, ts_to):
+        """Оставляет в памяти только срезы, покрывающие [ts_from, ts_to] с окном сопоставления"""
+        needed = range(
+            int((ts_from - self.window) // self.slice_seconds), int((ts_to + self.window) // self.slice_seconds) + 1
+        )
+        self.slices = {number: self.slices.get(number) or self._load(number) for number in needed}
+
+    def lookup(self, key, ts):
+        """Как SquidLogIndex.lookup: самая поздняя запись в пределах окна"""
+        first = int((ts - self.window) // self.slice_seconds)
+        for number in range(int((ts + self.window) // self.slice_seconds), first - 1, -1):
+            status, bytes_sent = _lookup(self.slices.get(number, {}), key, ts, self.window)
+            if status is not None:
+                return status, bytes_sent
+        return None, None
+
+
+def _lookup(index, key, ts, window=MATCH_WINDOW):
+    """Самая поздняя запись ключа в пределах окна внутри одного среза"""
+    entries = index.get(key)
+    if not entries:
+        return None, None
+    pos = bisect.bisect_right(entries, ts + window, key=lambda entry: entry[0])
+    if pos and entries[pos - 1][0] >= ts - window:
+        _, status, bytes_sent = entries[pos - 1]
+        return status, bytes_sent
+    return None, None
+
+
+def process_part(part, squid_dir, since, until, server_ip, out_path):
+    """Задача пула: разбирает кусок лога Xray пачками, сопоставляет со Squid, пишет записи в out_path"""
+    path, start, end, weight = part
+    squid = _SquidSlices(squid_dir)
+    lines = records = matched = 0
+    batch = []
+
+    def write_batch(out):
+        stamps = [record.timestamp.timestamp() for record, _ in batch]
+        squid.cover(min(stamps), max(stamps))
+        found = 0
+        for (record, line), ts in zip(batch, stamps):
+            status, bytes_sent = squid.lookup((record.uuid, record.destination), ts)
+            found += status is not None
+            out.write(json.dumps(collector_payload(record, line, status, bytes_sent, server_ip)) + "\n")
+        batch.clear()
+        return found
+
+    with open(out_path, "w") as out:
+        for line in iter_lines(path, start, end):
+            lines += 1
+            record = parse_xray_line(line)
+            if record is None or record.network != "tcp":
+                continue
+            if (since and record.timestamp < since) or (until and record.timestamp >= until):
+                continue
+            batch.append((record, line))
+            records += 1
+            if len(batch) >= PART_BATCH_RECORDS:
+                matched += write_batch(out)
+        if batch:
+            matched += write_batch(out)
+    if not records:
+        os.remove(out_path)
+    return {
+        "out_path": out_path if records else None,
+        "lines": lines,
+        "records": records,
+        "matched": matched,
+        "bytes": weight,
+    }
+
+
+def _read_chunks(path):
+    with open(path) as f:
+        chunk = []
+        for line in f:
+            chunk.append(json.loads(line))
+            if len(chunk) >= SHIP_READ_LINES:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class BackfillJob:
+    """Одна догрузка: срезы Squid, план кусков, пул процессов, отправка по мере готовности кусков и прогресс.
+
+    local_log — журнал подключений (ConnectionLogStore), куда записи тоже пишутся: для нового узла
+    или потерянной базы; иначе там уже есть записи, сделанные живым парсером.
+    """
+
+    def __init__(self, xray_files, squid_files=(), since=None, until=None, workers=BACKFILL_WORKERS,
+                 server_ip="unknown", collector_url=None, work_dir=BACKFILL_DIR, spool_dir=SPOOL_DIR,
+                 local_log=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.xray_files = expand_paths(xray_files)
+        self.squid_files = expand_paths(squid_files)
+        self.since = _local_naive(since)
+        self.until = _local_naive(until)
+        self.workers = max(1, min(workers, os.cpu_count() or 1))
+        self.server_ip = server_ip
+        self.work_dir = os.path.join(work_dir, self.id)
+        self.squid_dir = os.path.join(self.work_dir, "squid")
+        # Сюда уходит неотправленный спул задачи, его досылает шиппер живого потока
+        self.spool_dir = spool_dir
+        self.local_log = local_log
+        # Без URL коллектора записи только считаются (замер скорости)
+        self.shipper = LogShipper(collector_url, spool_dir=self.work_dir) if collector_url else None
+        self.state = "pending"
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.progress = {
+            "parts_total": 0, "parts_done": 0, "bytes_total": 0, "bytes_done": 0,
+            "lines": 0, "records": 0, "matched": 0, "squid_slices": 0,
+        }
+        self.handed_off = None
+
+    def status(self):
+        elapsed = ((self.finished or time.monotonic()) - self.started) if self.started else 0
+        shipped = self.shipper.stats if self.shipper else {}
+        return {
+            "id": self.id,
+            "state": self.state,
+            "error": self.error,
+            "xray_files": self.xray_files,
+            "squid_files": self.squid_files,
+            "since": self.since.isoformat() if self.since else None,
+            "until": self.until.isoformat() if self.until else None,
+            **self.progress,
+            "sent": shipped.get("sent", 0),
+            "spooled": shipped.get("spooled", 0),
+            "handed_off": self.handed_off,
+            "elapsed": round(elapsed, 1),
+            "lines_per_second": round(self.progress["lines"] / elapsed) if elapsed else 0,
+        }
+
+    async def run(self, session=None):
+        self.state = "running"
+        self.started = time.monotonic()
+        os.makedirs(self.squid_dir, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        if self.shipper:
+            await self.shipper.start(session)
+        try:
+            parts = plan_parts(self.xray_files)
+            self.progress["parts_total"] = len(parts)
+            self.progress["bytes_total"] = sum(part[3] for part in parts)
+            # forkserver: форк процесса с потоками gRPC и event loop небезопасен
+            pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("forkserver"), initializer=_lower_priority
+            )
+            try:
+                spans = await asyncio.gather(
+                    *(loop.run_in_executor(pool, squid_span, path) for path in self.squid_files)
+                )
+                # Squid читается один раз: дальше каждый кусок берёт только свои срезы
+                ts_from = self.since.timestamp() - MATCH_WINDOW if self.since else None
+                ts_to = self.until.timestamp() + MATCH_WINDOW if self.until else None
+                spans = [
+                    span for span in spans
+                    if span and (ts_to is None or span[1] <= ts_to)
+                    and (ts_from is None or span[2] is None or span[2] >= ts_from)
+                ]
+                slices = await asyncio.gather(*(
+                    loop.run_in_executor(pool, slice_squid, path, file_no, ts_from, ts_to, self.squid_dir)
+                    for file_no, (path, _, _) in enumerate(spans)
+                ))
+                self.progress["squid_slices"] = len(set().union(*slices))
+                futures = [
+                    loop.run_in_executor(
+                        pool, process_part, part, self.squid_dir, self.since, self.until, self.server_ip,
+                        os.path.join(self.work_dir, f"part-{i}.jsonl"),
+                    )
+                    for i, part in enumerate(parts)
+                ]
+                # Куски отправляются по мере готовности, пока пул разбирает следующие
+                for future in asyncio.as_completed(futures):
+                    result = await future
+                    for key in ("lines", "records", "matched"):
+                        self.progress[key] += result[key]
+                    self.progress["bytes_done"] += result["bytes"]
+                    self.progress["parts_done"] += 1
+                    if result["out_path"]:
+                        await self._ship(result["out_path"])
+                    logger.info(f"Догрузка {self.id}: кусок {self.progress['parts_done']}/{len(parts)} готов")
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+            self.state = "done"
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+            raise
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Догрузка {self.id} прервана: {e}")
+        finally:
+            if self.shipper:
+                await self.shipper.close()
+            await asyncio.to_thread(self._clean_up)
+            self.finished = time.monotonic()
+            logger.info(f"Догрузка {self.id}: {self.status()}")
+        return self.status()
+
+    async def _ship(self, path):
+        """Отправляет кусок пачками по SHIP_READ_LINES: в памяти не больше одной пачки"""
+        if self.shipper is None and self.local_log is None:
+            os.remove(path)
+            return
+        # Таблицы старше срока хранения журнала удалились бы при ближайшей проверке
+        oldest = (date.today() - timedelta(days=self.local_log.retention_days)).isoformat() if self.local_log else None
+        chunks = _read_chunks(path)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            for record in chunk:
+                if self.shipper:
+                    await self.shipper.put(record)
+                if self.local_log and record["timestamp"] >= oldest:
+                    self.local_log.submit(record)
+            if self.local_log:
+                await self.local_log.flush()
+        os.remove(path)
+
+    def _clean_up(self):
+        """Спул задачи — живому шипперу, остальное (срезы Squid, неотправленные куски) удаляется"""
+        spool = os.path.join(self.work_dir, "central_log.jsonl")
+        if os.path.exists(spool):
+            try:
+                self.handed_off = hand_off_spool(spool, self.spool_dir, f"backfill-{self.id}")
+                logger.warning(f"Догрузка {self.id}: неотправленные записи переданы в спул {self.handed_off}")
+            except OSError as e:
+                logger.error(f"Догрузка {self.id}: спул не передан ({e}), остаётся в {spool}")
+                shutil.rmtree(self.squid_dir, ignore_errors=True)
+                return
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+async def _resolve_server_ip():
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get("https://api.ipify.org", timeout=aiohttp.ClientTimeout(total=5)) as resp:
+                return (await resp.text()).strip()
+    except Exception as e:
+        logger.warning(f"Не удалось получить IP: {e}")
+        return "unknown"
+
+
+async def _run_cli(args):
+    from app.api.v1.log_watcher import CENTRAL_LOG_SERVER
+
+    job = BackfillJob(
+        args.xray, args.squid, since=args.since, until=args.until, workers=args.workers,
+        server_ip=args.server_ip or await _resolve_server_ip(),
+        collector_url=None if args.dry_run else (args.collector or CENTRAL_LOG_SERVER),
+        work_dir=args.work_dir, spool_dir=args.spool_dir,
+    )
+    task = asyncio.create_task(job.run())
+    while not task.done():
+        await asyncio.wait({task}, timeout=2)
+        status = job.status()
+        print(
+            f"{status['state']}: куски {status['parts_done']}/{status['parts_total']}, "
+            f"строк {status['lines']:,} ({status['lines_per_second']:,}/с), записей {status['records']:,}, "
+            f"Squid {status['matched']:,}, отправлено {status['sent']:,}"
+        )
+    return task.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--xray", nargs="+", required=True, help="файлы или маски access.log Xray")
+    parser.add_argument("--squid", nargs="*", default=[], help="файлы или маски access.log Squid")
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--server-ip")
+    parser.add_argument("--collector", help="URL коллектора (по умолчанию как у живого парсера)")
+    parser.add_argument("--work-dir", default=BACKFILL_DIR)
+    parser.add_argument("--spool-dir", default=SPOOL_DIR, help="спул живого потока для недоотправленных записей")
+    parser.add_argument("--dry-run", action="store_true", help="только разобрать и посчитать, не отправлять")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    status = asyncio.run(_run_cli(args))
+    print(json.dumps(status, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import logging
+import os
+import ssl
+import statistics
+import time
+from collections import deque
+
+from app.services.config_store import config_store
+from app.services.reload_scheduler import schedule_reload
+from app.utils.files import atomic_write
+
+# Пул exit-серверов каскада: фоновый зонд меряет TCP/TLS-рукопожатие до каждого, а в конфиг Xray
+# пишется балансировщик по здоровым exit в порядке задержки. Конфиг переписывается (и Xray
+# перезапускается) только при существенном изменении рейтинга.
+CASCADE_EXITS_PATH = os.path.join(os.getenv("TAILER_STATE_DIR", "/app/state"), "cascade_exits.json")
+PROBE_INTERVAL = float(os.getenv("CASCADE_PROBE_INTERVAL", "10"))  # секунд между раундами
+PROBE_CONCURRENCY = int(os.getenv("CASCADE_PROBE_CONCURRENCY", "16"))  # одновременных проб
+PROBE_TIMEOUT = 3  # секунд на подключение и рукопожатие
+PROBE_SAMPLES = 20  # последних проб на exit для статистики
+EWMA_ALPHA = 0.3
+HEALTHY_SUCCESS_RATIO = 0.5  # доля успешных проб в окне
+UNHEALTHY_AFTER = 3  # подряд неудачных проб — exit выводится из балансировщика
+SWITCH_MARGIN = 0.2  # новый лучший exit должен быть быстрее текущего на 20% ...
+SWITCH_MIN_MS = 5  # ... и не меньше чем на 5 мс
+MIN_REWRITE_INTERVAL = 60  # секунд между перезаписями ради скорости; отказ exit применяется сразу
+BALANCER_STRATEGY = os.getenv("CASCADE_BALANCER_STRATEGY", "leastPing")  # leastPing | random | roundRobin
+OBSERVATORY_PROBE_URL = os.getenv("CASCADE_OBSERVATORY_URL", "https://www.google.com/generate_204")
+
+BALANCER_TAG = "cascade-balancer"
+EXIT_TAG_PREFIX = "cascade-exit-"
+# selector балансировщика Xray сравнивает теги по префиксу: без завершающего разделителя exit-1
+# выбрал бы и exit-10. Имя exit — сегмент пути API, поэтому "/" в нём встретиться не может.
+EXIT_TAG_END = "/"
+
+logger = logging.getLogger("cascade_exits")
+
+
+class ExitServer:
+    """Exit-сервер каскада и скользящая статистика его проб"""
+
+    def __init__(self, name, address, port=8443, uuid="", tls=False, server_name=""):
+        self.name = name
+        self.address = address
+        self.port = port
+        self.uuid = uuid
+        self.tls = tls
+        self.server_name = server_name
+        self.samples = deque(maxlen=PROBE_SAMPLES)  # мс или None для неудачной пробы
+        self.ewma = None
+        self.failures = 0  # неудачных проб подряд
+        self.last_error = None
+        self.last_probe = None
+
+    @property
+    def tag(self):
+        return f"{EXIT_TAG_PREFIX}{self.name}{EXIT_TAG_END}"
+
+    def record(self, latency_ms, error=None):
+        self.samples.append(latency_ms)
+        self.last_probe = time.time()
+        if latency_ms is None:
+            self.failures += 1
+            self.last_error = error
+            return
+        self.failures = 0
+        self.ewma = latency_ms if self.ewma is None else EWMA_ALPHA * latency_ms + (1 - EWMA_ALPHA) * self.ewma
+
+    @property
+    def healthy(self):
+        if not self.samples or self.ewma is None or self.failures >= UNHEALTHY_AFTER:
+            return False
+        successes = sum(1 for sample in self.samples if sample is not None)
+        return successes / len(self.samples) >= HEALTHY_SUCCESS_RATIO
+
+    def outbound(self):
+        stream = {"network": "tcp", "security": "tls" if self.tls else "none"}
+        if self.tls:
+            stream["tlsSettings"] = {"serverName": self.server_name or self.address}
+        return {
+            "protocol": "vless",
+            "settings": {
+                "vnext": [
+                    {
+                        "address": self.address,
+                        "port": self.port,
+                        "users": [{"id": self.uuid, "level": 0, "encryption": "none"}],
+                    }
+                ]
+            },
+            "streamSettings": stream,
+            "tag": self.tag,
+        }
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "address": self.address,
+            "port": self.port,
+            "uuid": self.uuid,
+            "tls": self.tls,
+            "server_name": self.server_name,
+        }
+
+    def stats(self):
+        latencies = sorted(sample for sample in self.samples if sample is not None)
+        return {
+            **self.to_dict(),
+            "healthy": self.healthy,
+            "latency_ms": round(self.ewma, 2) if self.ewma is not None else None,
+            "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+            "max_ms": round(latencies[-1], 2) if latencies else None,
+            "success_ratio": round(len(latencies) / len(self.samples), 2) if self.samples else None,
+            "consecutive_failures": self.failures,
+            "last_error": self.last_error,
+            "last_probe": self.last_probe,
+        }
+
+
+def ranking_changed(applied, ranked, exits):
+    """Существенно ли отличается новый рейтинг от применённого: другой состав или заметно более быстрый лидер"""
+    if set(applied) != set(ranked):
+        return True
+    if not ranked or applied[0] == ranked[0]:
+        return False
+    current, best = exits[applied[0]].ewma, exits[ranked[0]].ewma
+    return current - best > max(SWITCH_MIN_MS, current * SWITCH_MARGIN)
+
+
+class CascadeExitPool:
+    def __init__(self, path=CASCADE_EXITS_PATH, interval=PROBE_INTERVAL, concurrency=PROBE_CONCURRENCY):
+        self.path = path
+        self.interval = interval
+        self.concurrency = concurrency
+        self.exits = {}
+        self.applied = []  # имена exit в балансировщике, в порядке рейтинга
+        self.applied_at = None
+        self._loaded = False
+        self._task = None
+        self._ssl_context = ssl.create_default_context()
+        # Меряем задержку, а не подлинность: у exit часто самоподписанный сертификат или reality
+        self._ssl_context.check_hostname = False
+        self._ssl_context.verify_mode = ssl.CERT_NONE
+
+    def load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        self.exits = {exit_server["name"]: ExitServer(**exit_server) for exit_server in state.get("exits", [])}
+        self.applied = [name for name in state.get("applied", []) if name in self.exits]
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        state = {"exits": [exit_server.to_dict() for exit_server in self.exits.values()], "applied": self.applied}
+        atomic_write(self.path, json.dumps(state, indent=2))
+
+    def upsert(self, **fields):
+        self.load()
+        exit_server = ExitServer(**fields)
+        if not exit_server.name or EXIT_TAG_END in exit_server.name:
+            raise ValueError(f"Invalid exit name: {exit_server.name!r}")
+        previous = self.exits.get(exit_server.name)
+        if previous is not None and previous.to_dict() == exit_server.to_dict():
+            return previous
+        self.exits[exit_server.name] = exit_server
+        # Параметры подключения изменились — в балансировщике должен оказаться новый outbound
+        self.applied = [name for name in self.applied if name != exit_server.name]
+        self._save()
+        logger.info(f"Exit {exit_server.name} зарегистрирован: {exit_server.address}:{exit_server.port}")
+        return exit_server
+
+    def remove(self, name):
+        self.load()
+        if self.exits.pop(name, None) is None:
+            return False
+        self._save()
+        return True
+
+    async def probe(self, exit_server):
+        """Время TCP-подключения и, для TLS-exit, рукопожатия TLS в миллисекундах"""
+        started = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    exit_server.address, exit_server.port,
+                    ssl=self._ssl_context if exit_server.tls else None,
+                    server_hostname=(exit_server.server_name or exit_server.address) if exit_server.tls else None,
+                ),
+                PROBE_TIMEOUT,
+            )
+        except (OSError, asyncio.TimeoutError, ssl.SSLError) as e:
+            exit_server.record(None, f"{type(e).__name__}: {e}")
+            return None
+        latency = (time.perf_counter() - started) * 1000
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+        exit_server.record(latency)
+        return latency
+
+    async def probe_all(self):
+        self.load()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(exit_server):
+            async with semaphore:
+                await self.probe(exit_server)
+
+        await asyncio.gather(*(bounded(exit_server) for exit_server in list(self.exits.values())))
+
+    def ranking(self):
+        healthy = [exit_server for exit_server in self.exits.values() if exit_server.healthy]
+        return [exit_server.name for exit_server in sorted(healthy, key=lambda exit_server: exit_server.ewma)]
+
+    async def rebalance(self, force=False):
+        """Применяет рейтинг к конфигу Xray, если он существенно изменился; True — конфиг переписан"""
+        ranked = self.ranking()
+        if not self.exits and self.applied:
+            # Пул опустел — каскад возвращается на единственный outbound cascade-to-server2
+            async with config_store.transaction() as config:
+                remove_balancer(config)
+                await config_store.save(config)
+            self.applied = []
+            self._save()
+            logger.info("Пул exit пуст, балансировщик каскада удалён")
+            await schedule_reload(wait=False)
+            return True
+        if not ranked:
+            if self.exits:
+                logger.warning("Нет здоровых exit, балансировщик каскада оставлен как есть")
+            return False
+        if not force and not ranking_changed(self.applied, ranked, self.exits):
+            return False
+        lost_exit = not set(self.applied) <= set(ranked)
+        recently = self.applied_at is not None and time.monotonic() - self.applied_at < MIN_REWRITE_INTERVAL
+        if not force and not lost_exit and recently:
+            return False
+
+        async with config_store.transaction() as config:
+            apply_balancer(config, [self.exits[name] for name in ranked], list(self.exits.values()))
+            await config_store.save(config)
+        self.applied = ranked
+        self.applied_at = time.monotonic()
+        self._save()
+        logger.info(f"Балансировщик каскада: {' > '.join(ranked)}")
+        await schedule_reload(wait=False)
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_all()
+                await self.rebalance()
+            except Exception as e:
+                logger.error(f"Ошибка проверки exit каскада: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.load()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def status(self):
+        self.load()
+        ranked = self.ranking()
+        return {
+            "strategy": BALANCER_STRATEGY,
+            "applied": self.applied,
+            "ranking": ranked,
+            "pending_change": bool(ranked) and ranking_changed(self.applied, ranked, self.exits),
+            "exits": sorted(
+                (exit_server.stats() for exit_server in self.exits.values()),
+                key=lambda stats: (not stats["healthy"], stats["latency_ms"] or float("inf")),
+            ),
+        }
+
+
+def apply_balancer(config, ranked, exits):
+    """Outbound на каждый exit пула, балансировщик по здоровым в порядке задержки и правило для каскада.
+
+    При стратегии leastPing Xray между перезаписями сам сверяет задержки через observatory,
+    а лучший по нашему рейтингу exit становится fallbackTag.
+    """
+    outbounds = [
+        outbound for outbound in config.get("outbounds", []) if not outbound.get("tag", "").startswith(EXIT_TAG_PREFIX)
+    ]
+    outbounds.extend(exit_server.outbound() for exit_server in exits)
+    config["outbounds"] = outbounds
+
+    routing = config.setdefault("routing", {"domainStrategy": "IPIfNonMatch", "rules": []})
+    balancer = {
+        "tag": BALANCER_TAG,
+        "selector": [exit_server.tag for exit_server in ranked],
+        "strategy": {"type": BALANCER_STRATEGY},
+        "fallbackTag": ranked[0].tag,
+    }
+    routing["balancers"] = [item for item in routing.get("balancers", []) if item.get("tag") != BALANCER_TAG]
+    routing["balancers"].append(balancer)
+    for rule in routing.setdefault("rules", []):
+        if rule.get("inboundTag") == ["vless-cascade"]:
+            rule.pop("outboundTag", None)
+            rule["balancerTag"] = BALANCER_TAG
+
+    if BALANCER_STRATEGY == "leastPing":
+        config["observatory"] = {
+            "subjectSelector": [EXIT_TAG_PREFIX],
+            "probeUrl": OBSERVATORY_PROBE_URL,
+            "probeInterval": f"{int(PROBE_INTERVAL)}s",
+            "enableConcurrency": True,
+        }
+    else:
+        config.pop("observatory", None)
+
+
+def remove_balancer(config):
+    config["outbounds"] = [
+        outbound for outbound in config.get("outbounds", []) if not outbound.get("tag", "").startswith(EXIT_TAG_PREFIX)
+    ]
+    config.pop("observatory", None)
+    routing = config.get("routing", {})
+    routing["balancers"] = [item for item in routing.get("balancers", []) if item.get("tag") != BALANCER_TAG]
+    if not routing["balancers"]:
+        del routing["balancers"]
+    for rule in routing.get("rules", []):
+        if rule.get("balancerTag") == BALANCER_TAG:
+            del rule["balancerTag"]
+            rule["outboundTag"] = "cascade-to-server2"
+
+
+cascade_exits = CascadeExitPool()
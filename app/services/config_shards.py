@@ -0,0 +1,123 @@
+"""Раскладка конфига Xray по каталогу фрагментов (xray run -confdir).
+
+00_base.json — всё, кроме inbounds (log, api, stats, outbounds, routing ...);
+10_inbound_NN_<tag>.json — по одному inbound вместе с его клиентами. Xray читает файлы
+по алфавиту и дописывает inbounds из каждого, поэтому номер NN сохраняет их порядок.
+Остальные *.json каталога (например, 20_routing.json оператора) хранилищу не принадлежат:
+оно их не читает, не переписывает и не удаляет — их собирает сам Xray.
+
+Перевод существующего config.json в каталог:
+    python -m app.services.config_shards migrate xray/config_hybrid.json xray/conf.d
+Обратно в один файл:
+    python -m app.services.config_shards merge xray/conf.d config.json
+"""
+import argparse
+import json
+import os
+import re
+
+from app.utils.files import atomic_write
+
+BASE_FRAGMENT = "00_base.json"
+INBOUND_PREFIX = "10_inbound_"
+
+
+def dumps(obj):
+    """Компактная сериализация: без отступов файл с десятками тысяч клиентов в разы меньше"""
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def inbound_fragment(index, tag):
+    safe_tag = re.sub(r"[^A-Za-z0-9_.-]", "_", tag or "untagged")
+    return f"{INBOUND_PREFIX}{index:02d}_{safe_tag}.json"
+
+
+def split_config(config):
+    """{имя файла: (tag inbound или None для базы, содержимое)}"""
+    base = {key: value for key, value in config.items() if key != "inbounds"}
+    fragments = {BASE_FRAGMENT: (None, base)}
+    for index, inbound in enumerate(config.get("inbounds", [])):
+        fragments[inbound_fragment(index, inbound.get("tag"))] = (inbound.get("tag"), {"inbounds": [inbound]})
+    return fragments
+
+
+def is_owned(name):
+    """Фрагмент из пространства имён хранилища: база или inbound"""
+    return name == BASE_FRAGMENT or (name.startswith(INBOUND_PREFIX) and name.endswith(".json"))
+
+
+def merge_fragments(fragments):
+    """Собирает конфиг из своих фрагментов {имя файла: содержимое}: inbounds по порядку имён"""
+    config = dict(fragments.get(BASE_FRAGMENT, {}))
+    inbounds = []
+    for name in sorted(fragments):
+        if name != BASE_FRAGMENT and is_owned(name):
+            inbounds.extend(fragments[name].get("inbounds", []))
+    config["inbounds"] = inbounds
+    return config
+
+
+def fragment_files(directory):
+    """Фрагменты хранилища в каталоге; чужие *.json сюда не попадают"""
+    return sorted(name for name in os.listdir(directory) if is_owned(name))
+
+
+def foreign_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".json") and not is_owned(name))
+
+
+def read_fragments(directory):
+    """{имя файла: сырые байты} всех фрагментов каталога"""
+    fragments = {}
+    for name in fragment_files(directory):
+        with open(os.path.join(directory, name), "rb") as f:
+            fragments[name] = f.read()
+    return fragments
+
+
+def migrate(source, directory, force=False):
+    with open(source, "rb") as f:
+        config = json.loads(f.read())
+    os.makedirs(directory, exist_ok=True)
+    existing = fragment_files(directory)
+    if existing and not force:
+        raise SystemExit(f"{directory} уже содержит фрагменты ({len(existing)}), используйте --force")
+    fragments = split_config(config)
+    for name in existing:
+        if name not in fragments:
+            os.remove(os.path.join(directory, name))
+    for name, (_, content) in fragments.items():
+        atomic_write(os.path.join(directory, name), dumps(content))
+        clients = sum(len(inbound.get("settings", {}).get("clients", [])) for inbound in content.get("inbounds", []))
+        print(f"{name}: {clients} клиентов" if name != BASE_FRAGMENT else name)
+    print(f"Готово: {source} -> {directory} ({len(fragments)} файлов)")
+
+
+def merge(directory, target):
+    fragments = {name: json.loads(data) for name, data in read_fragments(directory).items()}
+    atomic_write(target, json.dumps(merge_fragments(fragments), indent=2))
+    print(f"Готово: {directory} -> {target}")
+    foreign = foreign_files(directory)
+    if foreign:
+        print(f"Не включены (не фрагменты хранилища, перенесите вручную): {', '.join(foreign)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="config.json -> каталог фрагментов")
+    migrate_parser.add_argument("source")
+    migrate_parser.add_argument("directory")
+    migrate_parser.add_argument("--force", action="store_true", help="перезаписать существующие фрагменты")
+    merge_parser = commands.add_parser("merge", help="каталог фрагментов -> config.json")
+    merge_parser.add_argument("directory")
+    merge_parser.add_argument("target")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(args.source, args.directory, args.force)
+    else:
+        merge(args.directory, args.target)
+
+
+if __name__ == "__main__":
+    main()
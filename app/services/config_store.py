@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from app.core.metrics import CONFIG_CLIENTS, CONFIG_IO_SECONDS, CONFIG_SIZE_BYTES
+from app.core.timing import span
+from app.services.config_shards import (
+    BASE_FRAGMENT, dumps, fragment_files, merge_fragments, read_fragments, split_config,
+)
+from app.utils.files import atomic_write
+
+XRAY_CONFIG_PATH = Path(os.getenv("XRAY_CONFIG_PATH", "/usr/local/etc/xray/config.json"))
+# Каталог фрагментов (xray run -confdir); если задан, конфиг хранится по частям
+XRAY_CONFIG_DIR = os.getenv("XRAY_CONFIG_DIR", "")
+
+logger = logging.getLogger("config_store")
+
+
+class XrayConfigStore:
+    """Разобранный config.json Xray в памяти с индексом клиентов по тегу inbound.
+
+    Кеш сбрасывается при изменении mtime/размера/inode файла, запись идёт под asyncio.Lock
+    через временный файл и rename.
+    """
+
+    def __init__(self, path=XRAY_CONFIG_PATH):
+        self.path = Path(path)
+        self.lock = asyncio.Lock()
+        self.version = 0  # растёт при каждой перезагрузке или записи
+        self._config = None
+        self._stat_key = None
+        # тег inbound -> {uuid: клиент}
+        self._clients = {}
+
+    def _current_stat_key(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _read(self):
+        with CONFIG_IO_SECONDS.labels("read").time():
+            stat_key = self._current_stat_key()
+            with span("config_read"), open(self.path, "rb") as f:
+                data = f.read()
+            with span("config_parse"):
+                return json.loads(data), stat_key
+
+    def _reindex(self):
+        self._clients = {
+            inbound.get("tag"): {client["id"]: client for client in inbound.get("settings", {}).get("clients", [])}
+            for inbound in self._config.get("inbounds", [])
+        }
+        self.version += 1
+        CONFIG_SIZE_BYTES.set(self._config_size())
+        CONFIG_CLIENTS.clear()
+        for tag, clients in self._clients.items():
+            CONFIG_CLIENTS.labels(str(tag)).set(len(clients))
+
+    def _config_size(self):
+        return self._stat_key[1]
+
+    def invalidate(self):
+        self._config = None
+        self._stat_key = None
+
+    async def load(self):
+        """Возвращает конфиг из памяти, перечитывая файл только если он изменился на диске.
+
+        Вне transaction() результат только для чтения.
+        """
+        if self._config is not None and self._current_stat_key() == self._stat_key:
+            return self._config
+        config, stat_key = await asyncio.to_thread(self._read)
+        self._config, self._stat_key = config, stat_key
+        self._reindex()
+        logger.info(f"Конфиг Xray загружен: {self.path}")
+        return self._config
+
+    async def save(self, config, touched=None):
+        """Сохраняет конфиг атомарно; вызывается внутри transaction().
+
+        touched — теги inbound, в которых менялись только клиенты; учитывается в режиме каталога.
+        """
+        started = time.perf_counter()
+        with span("config_serialize"):
+            data = json.dumps(config, indent=2)
+        with span("config_write"):
+            await asyncio.to_thread(atomic_write, self.path, data)
+        CONFIG_IO_SECONDS.labels("write").observe(time.perf_counter() - started)
+        self._config = config
+        self._stat_key = self._current_stat_key()
+        self._reindex()
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Сериализует изменения конфига: load -> изменения -> save под одной блокировкой"""
+        async with self.lock:
+            config = await self.load()
+            try:
+                yield config
+            except BaseException:
+                # В памяти могли остаться частичные изменения — перечитаем с диска
+                self.invalidate()
+                raise
+
+    def inbound(self, tag):
+        for inbound in self._config.get("inbounds", []):
+            if inbound.get("tag") == tag:
+                return inbound
+        return None
+
+    def clients(self, tag):
+        """Индекс {uuid: клиент} для inbound с тегом tag (после load())"""
+        return self._clients.get(tag, {})
+
+    def has_client(self, uuid):
+        """Есть ли UUID хотя бы в одном inbound (после load())"""
+        return any(uuid in clients for clients in self._clients.values())
+
+
+class ShardedXrayConfigStore(XrayConfigStore):
+    """Конфиг в каталоге фрагментов: база и по файлу на inbound.
+
+    Пишутся только фрагменты, содержимое которых изменилось, поэтому добавление клиента стоит
+    сериализации одного inbound, а не всего конфига.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        # имя фрагмента -> байты, которые сейчас лежат на диске
+        self._written = {}
+
+    def _current_stat_key(self):
+        key = []
+        for name in fragment_files(self.path):
+            st = os.stat(self.path / name)
+            key.append((name, st.st_mtime_ns, st.st_size, st.st_ino))
+        return tuple(key)
+
+    def _config_size(self):
+        return sum(entry[2] for entry in self._stat_key)
+
+    def _read(self):
+        with CONFIG_IO_SECONDS.labels("read").time():
+            stat_key = self._current_stat_key()
+            with span("config_read"):
+                raw = read_fragments(self.path)
+            self._written = raw
+            with span("config_parse"):
+                return merge_fragments({name: json.loads(data) for name, data in raw.items()}), stat_key
+
+    def _write(self, changes, removed):
+        for name, data in changes.items():
+            atomic_write(self.path / name, data)
+        for name in removed:
+            try:
+                os.remove(self.path / name)
+            except FileNotFoundError:
+                pass
+
+    async def save(self, config, touched=None):
+        started = time.perf_counter()
+        fragments = split_config(config)
+        changes = {}
+        with span("config_serialize"):
+            for name, (tag, content) in fragments.items():
+                # Не тронутые изменением фрагменты, которые уже есть на диске, даже не сериализуем
+                if touched is not None and name in self._written and (name == BASE_FRAGMENT or tag not in touched):
+                    continue
+                data = dumps(content)
+                if self._written.get(name) != data:
+                    changes[name] = data
+        removed = [name for name in self._written if name not in fragments]
+        if changes or removed:
+            with span("config_write"):
+                await asyncio.to_thread(self._write, changes, removed)
+            for name in removed:
+                del self._written[name]
+            self._written.update(changes)
+        CONFIG_IO_SECONDS.labels("write").observe(time.perf_counter() - started)
+        self._config = config
+        self._stat_key = self._current_stat_key()
+        self._reindex()
+        logger.info(f"Фрагменты конфига записаны: {', '.join(changes) or 'без изменений'}")
+
+
+config_store = ShardedXrayConfigStore(XRAY_CONFIG_DIR) if XRAY_CONFIG_DIR else XrayConfigStore()
@@ -0,0 +1,215 @@
+import asyncio
+import base64
+import logging
+import os
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import and_, create_engine, event, inspect, or_, select
+
+from app.models.connection_log import TABLE_PREFIX, connection_log_metadata, connection_log_table
+
+CONNECTION_LOG_DB = os.path.join(os.getenv("TAILER_STATE_DIR", "/app/state"), "connections.db")
+CONNECTION_LOG_RETENTION_DAYS = int(os.getenv("CONNECTION_LOG_RETENTION_DAYS", "7"))
+FLUSH_INTERVAL = 1  # секунд
+FLUSH_BATCH = 5000
+MAX_PENDING = 200_000  # если диск не успевает, старые записи отбрасываются, а не копятся в памяти
+RETENTION_CHECK_INTERVAL = 3600
+QUERY_LIMIT = 500
+
+logger = logging.getLogger("connection_log")
+
+
+def _day(ts):
+    # '2025-06-15T12:34:56' -> '20250615'
+    return ts[0:4] + ts[5:7] + ts[8:10]
+
+
+def encode_cursor(ts, row_id):
+    return base64.urlsafe_b64encode(f"{ts}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    ts, _, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+    return ts, int(row_id)
+
+
+def _table_days(bind):
+    """Дни, за которые в базе есть таблицы журнала"""
+    return {name[len(TABLE_PREFIX):] for name in inspect(bind).get_table_names() if name.startswith(TABLE_PREFIX)}
+
+
+class ConnectionLogStore:
+    """Локальный журнал подключений в SQLite (WAL).
+
+    Записи копятся в памяти и пишутся пачками в одной транзакции в отдельном потоке,
+    чтобы event loop не ждал диск. Таблицы по дням, хранение — CONNECTION_LOG_RETENTION_DAYS.
+    """
+
+    def __init__(self, path=CONNECTION_LOG_DB, retention_days=CONNECTION_LOG_RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self._engine = None
+        self._days = set()
+        self._buffer = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_retention = 0
+        self.stats = {"queued": 0, "written": 0, "dropped": 0}
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._engine = create_engine(f"sqlite:///{self.path}", connect_args={"check_same_thread": False})
+            event.listen(self._engine, "connect", _sqlite_pragmas)
+            self._days = _table_days(self._engine)
+        return self._engine
+
+    def submit(self, record):
+        """Ставит запись (payload парсера) в очередь на запись; не блокирует"""
+        if len(self._buffer) >= MAX_PENDING:
+            del self._buffer[:FLUSH_BATCH]
+            self.stats["dropped"] += FLUSH_BATCH
+        self._buffer.append((
+            record["timestamp"], record["uuid"], record.get("ip"), record.get("destination"),
+            record.get("status"), record.get("bytes_sent"),
+        ))
+        self.stats["queued"] += 1
+        if len(self._buffer) >= FLUSH_BATCH:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._task is None:
+            await asyncio.to_thread(lambda: self.engine)
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if time.monotonic() - self._last_retention > RETENTION_CHECK_INTERVAL:
+                self._last_retention = time.monotonic()
+                try:
+                    await asyncio.to_thread(self._apply_retention)
+                except Exception as e:
+                    logger.error(f"Не удалось удалить старые таблицы журнала: {e}")
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, rows)
+            self.stats["written"] += len(rows)
+        except Exception as e:
+            self.stats["dropped"] += len(rows)
+            logger.error(f"Не удалось записать {len(rows)} записей в журнал подключений: {e}")
+
+    def _write(self, rows):
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(_day(row[0]), []).append(row)
+        with self.engine.begin() as conn:
+            for day, day_rows in by_day.items():
+                table = connection_log_table(day)
+                if day not in self._days:
+                    connection_log_metadata.create_all(conn, tables=[table])
+                    self._days.add(day)
+                # executemany одним prepared statement — тысячи строк за миллисекунды
+                conn.execute(
+                    table.insert(),
+                    [
+                        {"ts": ts, "uuid": uuid, "ip": ip, "destination": destination,
+                         "status": status, "bytes_sent": bytes_sent}
+                        for ts, uuid, ip, destination, status, bytes_sent in day_rows
+                    ],
+                )
+
+    def _apply_retention(self):
+        oldest = (date.today() - timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        expired = sorted(day for day in self._days if day < oldest)
+        if not expired:
+            return
+        with self.engine.begin() as conn:
+            for day in expired:
+                table = connection_log_table(day)
+                table.drop(conn, checkfirst=True)
+                connection_log_metadata.remove(table)
+                self._days.discard(day)
+        logger.info(f"Удалены таблицы журнала подключений за {', '.join(expired)}")
+
+    def _query(self, uuid, destination, since, until, cursor, limit):
+        engine = self.engine
+        since_ts = since.isoformat(timespec="seconds") if since else None
+        until_ts = until.isoformat(timespec="seconds") if until else None
+        after = decode_cursor(cursor) if cursor else None
+
+        start = max(filter(None, (since_ts and _day(since_ts), after and _day(after[0]))), default=None)
+        end = until_ts and _day(until_ts)
+
+        rows = []
+        with engine.connect() as conn:
+            # Список таблиц читаем из базы на каждый запрос: на ведомом воркере дни добавляет
+            # и удаляет писатель лидера, а _days здесь не обновляется
+            days = sorted(
+                day for day in _table_days(conn) if (start is None or day >= start) and (end is None or day <= end)
+            )
+            for day in days:
+                table = connection_log_table(day)
+                conditions = []
+                if uuid:
+                    conditions.append(table.c.uuid == uuid)
+                if destination:
+                    conditions.append(table.c.destination == destination)
+                if since_ts:
+                    conditions.append(table.c.ts >= since_ts)
+                if until_ts:
+                    conditions.append(table.c.ts < until_ts)
+                if after:
+                    conditions.append(or_(table.c.ts > after[0], and_(table.c.ts == after[0], table.c.id > after[1])))
+                query = (
+                    select(table).where(*conditions)
+                    .order_by(table.c.ts, table.c.id)
+                    .limit(limit + 1 - len(rows))
+                )
+                rows.extend(dict(row._mapping) for row in conn.execute(query))
+                if len(rows) > limit:
+                    break
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["ts"], rows[-1]["id"])
+        for row in rows:
+            row.pop("id")
+        return {"items": rows, "next_cursor": next_cursor}
+
+    async def query(self, uuid=None, destination=None, since=None, until=None, cursor=None, limit=QUERY_LIMIT):
+        """Записи по возрастанию времени; next_cursor продолжает выборку со следующей записи"""
+        return await asyncio.to_thread(self._query, uuid, destination, since, until, cursor, limit)
+
+    async def close(self):
+        """Останавливает фоновую запись и сбрасывает на диск всё накопленное"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._engine is not None:
+            self._engine.dispose()
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: запросы поддержки читают, не блокируя запись парсера
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+connection_log = ConnectionLogStore()
@@ -0,0 +1,276 @@
+"""Правила по адресу назначения: что делать со строкой access.log до корреляции со Squid и отправки.
+
+Файл правил (DEST_RULES_PATH), по правилу на строку, # — комментарий:
+
+    drop       telemetry.example.com     # точное имя
+    drop       .doubleclick.net          # домен и все поддомены
+    sample:100 *.cloudflare.com          # только поддомены, отправляется 1 из 100
+    aggregate  .googlevideo.com          # только свёрнутыми записями за окно
+    keep       api.cloudflare.com        # исключение из более общего правила
+    drop       10.0.0.0/8                # IP-назначения по CIDR
+
+Побеждает самое специфичное правило: для доменов — самое длинное совпадение (точное имя
+важнее маски того же уровня), для IP — самый длинный префикс; при равенстве — последнее в файле.
+Файл перечитывается при изменении без перезапуска.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import time
+
+from app.core.metrics import DEST_RULE_MATCHES
+
+DEST_RULES_PATH = os.getenv("DEST_RULES_PATH", "/app/destination_rules.conf")
+DEST_RULES_RELOAD_INTERVAL = 5  # секунд между проверками mtime файла
+DECISION_CACHE_SIZE = 65536  # назначения сильно повторяются, решение кешируется до перезагрузки правил
+
+ACTIONS = ("keep", "drop", "sample", "aggregate")
+
+logger = logging.getLogger("destination_rules")
+
+
+class Rule:
+    __slots__ = ("line", "pattern", "action", "sample_rate", "hits", "_seen")
+
+    def __init__(self, line, pattern, action, sample_rate=1):
+        self.line = line
+        self.pattern = pattern
+        self.action = action
+        self.sample_rate = sample_rate
+        self.hits = 0
+        self._seen = 0
+
+    def sampled(self):
+        """sample: пропускает каждую sample_rate-ю строку, совпавшую с правилом"""
+        self._seen += 1
+        if self._seen >= self.sample_rate:
+            self._seen = 0
+            return True
+        return False
+
+    def as_dict(self):
+        action = f"sample:{self.sample_rate}" if self.action == "sample" else self.action
+        return {"line": self.line, "pattern": self.pattern, "action": action, "hits": self.hits}
+
+
+class _Node:
+    __slots__ = ("children", "exact", "subdomains")
+
+    def __init__(self):
+        self.children = {}
+        self.exact = None  # правило для имени, оканчивающегося на этом узле
+        self.subdomains = None  # правило для всех имён ниже узла
+
+
+class RuleSet:
+    """Скомпилированные правила: trie по меткам домена в обратном порядке и таблицы CIDR по длине префикса"""
+
+    def __init__(self, rules=()):
+        self.rules = []
+        self._root = _Node()
+        # длина префикса -> {адрес сети: правило}, отдельно для IPv4 и IPv6
+        self._networks = {4: {}, 6: {}}
+        self._prefixes = {4: [], 6: []}
+        self._cache = {}
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule):
+        pattern = rule.pattern
+        if _looks_like_ip(pattern.split("/", 1)[0]):
+            network = ipaddress.ip_network(pattern, strict=False)
+            table = self._networks[network.version].setdefault(network.prefixlen, {})
+            table[int(network.network_address)] = rule
+            self._prefixes[network.version] = sorted(self._networks[network.version], reverse=True)
+            self.rules.append(rule)
+            return
+
+        pattern = pattern.lower().rstrip(".")
+        if pattern.startswith("*."):
+            labels, kind = pattern[2:].split("."), "wildcard"
+        elif pattern.startswith("."):
+            labels, kind = pattern[1:].split("."), "suffix"
+        else:
+            labels, kind = pattern.split("."), "exact"
+        if not all(labels) or any("*" in label for label in labels):
+            raise ValueError(f"Некорректный шаблон {rule.pattern}")
+        node = self._root
+        for label in reversed(labels):
+            node = node.children.setdefault(label, _Node())
+        if kind in ("exact", "suffix"):
+            node.exact = rule
+        if kind in ("wildcard", "suffix"):
+            node.subdomains = rule
+        self.rules.append(rule)
+
+    def match(self, destination):
+        """Правило для назначения или None; O(число меток) для доменов"""
+        cache = self._cache
+        try:
+            return cache[destination]
+        except KeyError:
+            pass
+        rule = self._match_ip(destination) if _looks_like_ip(destination) else self._match_domain(destination)
+        if len(cache) >= DECISION_CACHE_SIZE:
+            cache.clear()
+        cache[destination] = rule
+        return rule
+
+    def _match_domain(self, destination):
+        labels = destination.lower().rstrip(".").split(".")
+        node = self._root
+        best = None
+        for label in reversed(labels):
+            if node.subdomains is not None:
+                best = node.subdomains
+            node = node.children.get(label)
+            if node is None:
+                return best
+        return node.exact if node.exact is not None else best
+
+    def _match_ip(self, destination):
+        try:
+            address = ipaddress.ip_address(destination.strip("[]"))
+        except ValueError:
+            return self._match_domain(destination)
+        value = int(address)
+        bits = address.max_prefixlen
+        networks = self._networks[address.version]
+        for prefixlen in self._prefixes[address.version]:
+            rule = networks[prefixlen].get(value >> (bits - prefixlen) << (bits - prefixlen))
+            if rule is not None:
+                return rule
+        return None
+
+
+def _looks_like_ip(destination):
+    return ":" in destination or destination.replace(".", "").isdigit()
+
+
+def parse_rules(text):
+    rules = []
+    for number, raw in enumerate(text.splitlines(), 1):
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split()
+        if len(parts) != 2:
+            raise ValueError(f"Строка {number}: ожидается '<действие> <шаблон>'")
+        action, pattern = parts
+        sample_rate = 1
+        if action.startswith("sample:"):
+            action, rate = action.split(":", 1)
+            if not rate.isdigit() or int(rate) < 1:
+                raise ValueError(f"Строка {number}: некорректная частота {rate}")
+            sample_rate = int(rate)
+        if action not in ACTIONS:
+            raise ValueError(f"Строка {number}: неизвестное действие {action}")
+        rules.append(Rule(number, pattern, action, sample_rate))
+    return rules
+
+
+def compile_rules(text):
+    ruleset = RuleSet()
+    for rule in parse_rules(text):
+        try:
+            ruleset.add(rule)
+        except ValueError as e:
+            raise ValueError(f"Строка {rule.line}: {e}")
+    return ruleset
+
+
+class DestinationFilter:
+    """Текущий набор правил с перечитыванием файла по mtime; ошибка в файле оставляет прежние правила"""
+
+    def __init__(self, path=DEST_RULES_PATH):
+        self.path = path
+        self.ruleset = RuleSet()
+        self.loaded_at = None
+        self.error = None
+        self._stat_key = None
+        self._task = None
+
+    def decide(self, destination):
+        """(действие, правило): keep без правила, drop/sample-отсев, aggregate или keep"""
+        rule = self.ruleset.match(destination)
+        if rule is None:
+            return "keep", None
+        rule.hits += 1
+        action = rule.action
+        DEST_RULE_MATCHES.labels(action).inc()
+        if action == "sample":
+            return ("keep" if rule.sampled() else "drop"), rule
+        return action, rule
+
+    def _current_stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _compile(self):
+        with open(self.path, encoding="utf-8") as f:
+            return compile_rules(f.read())
+
+    async def reload(self, force=False):
+        """Перечитывает файл, если он изменился; возвращает True, если набор правил заменён"""
+        stat_key = self._current_stat_key()
+        if stat_key == self._stat_key and not force:
+            return False
+        self._stat_key = stat_key
+        if stat_key is None:
+            if self.ruleset.rules:
+                logger.info(f"Файл правил {self.path} удалён, фильтрация выключена")
+            self.ruleset = RuleSet()
+            self.error = None
+            return True
+        try:
+            ruleset = await asyncio.to_thread(self._compile)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            self.error = str(e)
+            logger.error(f"Правила назначения не загружены, действуют прежние: {e}")
+            return False
+        # Счётчики переживают перезагрузку для правил, оставшихся без изменений
+        previous = {(rule.pattern, rule.action, rule.sample_rate): rule.hits for rule in self.ruleset.rules}
+        for rule in ruleset.rules:
+            rule.hits = previous.get((rule.pattern, rule.action, rule.sample_rate), 0)
+        self.ruleset = ruleset
+        self.error = None
+        self.loaded_at = time.time()
+        logger.info(f"Загружено правил назначения: {len(ruleset.rules)} из {self.path}")
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Ошибка перечитывания правил назначения: {e}")
+            await asyncio.sleep(DEST_RULES_RELOAD_INTERVAL)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def status(self, top=None):
+        rules = sorted(self.ruleset.rules, key=lambda rule: rule.hits, reverse=True)
+        if top is not None:
+            rules = rules[:top]
+        return {
+            "path": self.path,
+            "rules": len(self.ruleset.rules),
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+            "items": [rule.as_dict() for rule in rules],
+        }
+
+
+destination_filter = DestinationFilter()
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+
+import aiohttp
+
+# Docker Engine API через смонтированный /var/run/docker.sock — без запуска docker CLI
+DOCKER_SOCKET = os.getenv("DOCKER_SOCKET", "/var/run/docker.sock")
+DOCKER_TIMEOUT = 30  # секунд на обычный запрос; restart ждёт ещё и остановку контейнера
+STOP_TIMEOUT = 10  # секунд, которые Docker даёт контейнеру на остановку при restart
+READY_TIMEOUT = 20
+READY_POLL_INTERVAL = 0.2
+
+logger = logging.getLogger("docker_client")
+
+
+class DockerError(RuntimeError):
+    def __init__(self, status, message):
+        super().__init__(f"Docker API {status}: {message}")
+        self.status = status
+
+
+class DockerClient:
+    """Асинхронный клиент Docker Engine API поверх unix-сокета с пулом соединений"""
+
+    def __init__(self, socket_path=DOCKER_SOCKET):
+        self.socket_path = socket_path
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=self.socket_path, limit=10),
+                timeout=aiohttp.ClientTimeout(total=DOCKER_TIMEOUT),
+            )
+        return self._session
+
+    async def _request(self, method, path, params=None, timeout=None):
+        kwargs = {"params": params}
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        async with self.session.request(method, f"http://docker{path}", **kwargs) as resp:
+            body = await resp.read()
+            if resp.status >= 300:
+                raise DockerError(resp.status, _error_message(body))
+            if resp.content_type == "application/json" and body:
+                return await resp.json()
+            return None
+
+    async def restart(self, name, stop_timeout=STOP_TIMEOUT):
+        await self._request(
+            "POST", f"/containers/{name}/restart", {"t": str(stop_timeout)}, timeout=DOCKER_TIMEOUT + stop_timeout
+        )
+
+    async def kill(self, name, signal="HUP"):
+        """Посылает сигнал процессу контейнера (docker kill -s)"""
+        await self._request("POST", f"/containers/{name}/kill", {"signal": signal})
+
+    async def inspect(self, name):
+        return await self._request("GET", f"/containers/{name}/json")
+
+    async def status(self, name):
+        """Краткое состояние контейнера: статус, health, время старта, число перезапусков"""
+        info = await self.inspect(name)
+        state = info.get("State", {})
+        return {
+            "name": info.get("Name", "").lstrip("/"),
+            "status": state.get("Status"),
+            "running": state.get("Running", False),
+            "health": (state.get("Health") or {}).get("Status"),
+            "started_at": state.get("StartedAt"),
+            "restart_count": info.get("RestartCount", 0),
+            "image": info.get("Config", {}).get("Image"),
+        }
+
+    async def logs(self, name, tail="100", follow=False, since=None):
+        """Строки логов контейнера по мере поступления: (stdout|stderr, строка)"""
+        tty = (await self.inspect(name)).get("Config", {}).get("Tty", False)
+        params = {"stdout": "1", "stderr": "1", "tail": str(tail), "follow": "1" if follow else "0"}
+        if since:
+            params["since"] = str(int(since))
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=5)
+        async with self.session.get(f"http://docker/containers/{name}/logs", params=params, timeout=timeout) as resp:
+            if resp.status >= 300:
+                raise DockerError(resp.status, _error_message(await resp.read()))
+            partial = {"stdout": b"", "stderr": b""}
+            async for stream, data in _demux(resp.content, tty):
+                data = partial[stream] + data
+                *lines, partial[stream] = data.split(b"\n")
+                for line in lines:
+                    yield stream, line.decode("utf-8", "replace")
+            for stream, rest in partial.items():
+                if rest:
+                    yield stream, rest.decode("utf-8", "replace")
+
+    async def wait_ready(self, name, address=None, timeout=READY_TIMEOUT):
+        """Ждёт, пока контейнер запущен (и healthy, если есть healthcheck), а address принимает TCP-соединения"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                state = await self.status(name)
+                if state["running"] and state["health"] in (None, "healthy"):
+                    if address is None or await tcp_accepting(address):
+                        return state
+            except DockerError as e:
+                if e.status != 404:
+                    raise
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"{name} не готов за {timeout} с")
+            await asyncio.sleep(READY_POLL_INTERVAL)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+async def tcp_accepting(address, timeout=0.5):
+    host, _, port = address.rpartition(":")
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    await writer.wait_closed()
+    return True
+
+
+async def _demux(content, tty):
+    """Разбирает поток логов Docker: без TTY он мультиплексирован 8-байтными заголовками кадров"""
+    if tty:
+        async for data in content.iter_any():
+            yield "stdout", data
+        return
+    while True:
+        try:
+            header = await content.readexactly(8)
+        except asyncio.IncompleteReadError:
+            return
+        stream_type, size = struct.unpack(">BxxxI", header)
+        yield ("stderr" if stream_type == 2 else "stdout"), await content.readexactly(size)
+
+
+def _error_message(body):
+    try:
+        return json.loads(body).get("message", body.decode())
+    except (ValueError, AttributeError):
+        return body.decode("utf-8", "replace")
+
+
+docker = DockerClient()
@@ -0,0 +1,241 @@
+import asyncio
+import ctypes
+import ctypes.util
+import json
+import os
+import time
+
+READ_CHUNK = 1024 * 1024
+POLL_INTERVAL = 0.5  # секунд, если inotify недоступен
+INOTIFY_TIMEOUT = 5.0  # страховочный опрос даже при inotify
+COMMIT_INTERVAL = 1.0  # секунд, как часто сбрасываем смещение на диск
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class _Inotify:
+    """Будильник на inotify: срабатывает при любом изменении в каталоге файла"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch {directory}")
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        self.event.set()
+
+    async def wait(self):
+        try:
+            await asyncio.wait_for(self.event.wait(), INOTIFY_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        self.event.clear()
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
+class FileFollower:
+    """Асинхронный аналог tail -F: читает файл крупными блоками, переживает ротацию и усечение,
+    а при заданном state_path сохраняет смещение обработанных строк и продолжает с него после рестарта"""
+
+    def __init__(self, path, state_path=None, prime_bytes=0, use_inotify=True):
+        self.path = path
+        self.state_path = state_path
+        self.prime_bytes = prime_bytes  # без сохранённого смещения начинаем с хвоста такого размера
+        self.use_inotify = use_inotify
+        self.running = False
+        self.fd = None
+        self.inode = None
+        self.offset = 0  # сколько байт прочитано из текущего файла
+        self._partial = b""
+        self._skip_first = False
+        self._started = False
+        self._consumed = None  # (inode, offset) конца последней отданной пачки
+        self._persisted = None
+        self._last_persist = 0.0
+
+    def __aiter__(self):
+        return self.batches()
+
+    def _load_state(self):
+        if not self.state_path:
+            return None
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            return state["inode"], state["offset"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _open(self):
+        """Открывает файл; при первом открытии выбирает стартовое смещение"""
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        st = os.fstat(fd)
+        offset = 0
+        if not self._started:
+            state = self._load_state()
+            if state and state[0] == st.st_ino and state[1] <= st.st_size:
+                offset = state[1]
+            elif state is None:
+                offset = max(0, st.st_size - self.prime_bytes)
+                # Если попали в середину строки — её начало уже не прочитать
+                self._skip_first = offset > 0 and os.pread(fd, 1, offset - 1) != b"\n"
+            # иначе файл ротировали, пока нас не было: читаем новый с начала
+            self._started = True
+        os.lseek(fd, offset, os.SEEK_SET)
+        self.fd, self.inode, self.offset = fd, st.st_ino, offset
+        self._partial = b""
+        self._consumed = (self.inode, self.offset)
+        return True
+
+    def _close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _read(self):
+        data = os.read(self.fd, READ_CHUNK)
+        self.offset += len(data)
+        return data
+
+    def _check_rotation(self):
+        """Вызывается на EOF: хвост старого файла (bytes), если файл заменили или усекли и читать нужно
+        заново, иначе None"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None  # файла нет — держим старый дескриптор и ждём появления нового
+        if st.st_ino != self.inode:
+            # Между последним чтением и rename писатель мог дописать старый файл — дочитываем его до EOF
+            tail = [self._partial]
+            while data := self._read():
+                tail.append(data)
+            self._close()
+            self._started = True
+            self._open()  # если новый файл успел исчезнуть, batches() откроет его, когда появится
+            return b"".join(tail)
+        if st.st_size < self.offset:
+            tail = self._partial
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            self.offset = 0
+            self._partial = b""
+            self._consumed = (self.inode, 0)
+            return tail
+        return None
+
+    def _split(self, data):
+        """Режет блок на строки: одно декодирование на блок, хвост без перевода строки ждёт следующего блока"""
+        if self._partial:
+            data = self._partial + data
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._partial = data
+            return []
+        self._partial = data[end + 1:]
+        lines = str(memoryview(data)[:end], "utf-8", "replace").split("\n")
+        if self._skip_first:
+            self._skip_first = False
+            lines.pop(0)
+        return lines
+
+    def commit(self):
+        """Сохраняет смещение конца последней обработанной пачки (temp-файл + rename)"""
+        if not self.state_path or self._consumed is None or self._consumed == self._persisted:
+            return
+        inode, offset = self._consumed
+        tmp_path = f"{self.state_path}.tmp"
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump({"path": self.path, "inode": inode, "offset": offset}, f)
+        os.replace(tmp_path, self.state_path)
+        self._persisted = self._consumed
+        self._last_persist = time.monotonic()
+
+    def lag_bytes(self):
+        """Сколько байт файла ещё не отдано потребителю"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        if self._consumed is None or self._consumed[0] != st.st_ino:
+            return st.st_size
+        return max(0, st.st_size - self._consumed[1])
+
+    def _make_waiter(self):
+        if self.use_inotify:
+            try:
+                return _Inotify(os.path.dirname(os.path.abspath(self.path)))
+            except (OSError, AttributeError, TypeError):
+                pass
+        return None
+
+    async def _wait(self, waiter):
+        if waiter:
+            await waiter.wait()
+        else:
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def batches(self):
+        """Асинхронный генератор пачек строк; смещение пачки считается обработанным, когда запрошена следующая"""
+        self.running = True
+        waiter = self._make_waiter()
+        try:
+            while self.running:
+                if self.fd is None:
+                    if not await asyncio.to_thread(self._open):
+                        await self._wait(waiter)
+                        continue
+
+                data = await asyncio.to_thread(self._read)
+                if data:
+                    lines = self._split(data)
+                    if lines:
+                        consumed = (self.inode, self.offset - len(self._partial))
+                        yield lines
+                        self._consumed = consumed
+                        if self.state_path and time.monotonic() - self._last_persist >= COMMIT_INTERVAL:
+                            await asyncio.to_thread(self.commit)
+                    continue
+
+                tail = await asyncio.to_thread(self._check_rotation)
+                if tail is not None:
+                    # Как tail -F: хвост старого файла, включая недописанную строку, тоже отдаём
+                    tail = tail.rstrip(b"\n")
+                    if tail:
+                        yield tail.decode(errors="replace").split("\n")
+                    continue
+                await self._wait(waiter)
+        finally:
+            if waiter:
+                waiter.close()
+            self.commit()
+            self._close()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import os
+from uuid import uuid4
+
+import aiohttp
+
+from app.core.http import http_client
+from app.utils.files import atomic_write
+
+FLEET_STATE_PATH = os.path.join(os.getenv("TAILER_STATE_DIR", "/app/state"), "fleet.json")
+NODE_CONCURRENCY = 8  # одновременных запросов к одному узлу
+NODE_TIMEOUT = 15  # секунд на запрос к узлу; перезапуск Xray на узле укладывается в это время
+ROLE_ENTRY = "entry"
+ROLE_EXIT = "exit"
+
+logger = logging.getLogger("fleet")
+
+
+class FleetError(RuntimeError):
+    def __init__(self, node, message):
+        super().__init__(f"{node}: {message}")
+        self.node = node
+
+
+class FleetNode:
+    """Узел флота: такой же FastAPI-сервис рядом со своим Xray"""
+
+    def __init__(self, name, url, role=ROLE_ENTRY, address="", cascade_port=8443,
+                 max_concurrency=NODE_CONCURRENCY, timeout=NODE_TIMEOUT):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.role = role
+        self.address = address  # публичный адрес, на который entry-узлы ведут каскад (для exit)
+        self.cascade_port = cascade_port
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "url": self.url,
+            "role": self.role,
+            "address": self.address,
+            "cascade_port": self.cascade_port,
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout,
+        }
+
+
+def _ok_or_exists(body):
+    """Узел отвечает 200 с success=false, если пользователь уже есть — для повторного вызова это не ошибка"""
+    return body.get("success") or "already exists" in body.get("message", "")
+
+
+class FleetController:
+    """Реестр узлов и параллельная раскатка пользователей по ним.
+
+    Каскад регистрируется на обоих хопах одновременно: UUID связки entry -> exit контроллер
+    выдаёт сам и хранит в реестре, поэтому exit-узлу не нужно ждать ответа entry-узла.
+    На exit-узле UUID связки живёт в inbound на cascade_port (POST /cascade/link) и отзывается,
+    когда на entry-узле не остаётся каскадных пользователей.
+    """
+
+    def __init__(self, path=FLEET_STATE_PATH):
+        self.path = path
+        self.nodes = {}
+        # "entry->exit" -> UUID, которым entry-узел ходит на exit-узел
+        self.links = {}
+        self._loaded = False
+
+    def load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        self.nodes = {node["name"]: FleetNode(**node) for node in state.get("nodes", [])}
+        self.links = state.get("links", {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        state = {"nodes": [node.to_dict() for node in self.nodes.values()], "links": self.links}
+        atomic_write(self.path, json.dumps(state, indent=2))
+
+    def upsert_node(self, **fields):
+        self.load()
+        node = FleetNode(**fields)
+        self.nodes[node.name] = node
+        self._save()
+        logger.info(f"Узел {node.name} ({node.role}) зарегистрирован: {node.url}")
+        return node
+
+    def remove_node(self, name):
+        self.load()
+        if self.nodes.pop(name, None) is None:
+            return False
+        self.links = {pair: uid for pair, uid in self.links.items() if name not in pair.split("->")}
+        self._save()
+        return True
+
+    def node(self, name, role=None):
+        self.load()
+        node = self.nodes.get(name)
+        if node is None:
+            raise KeyError(f"Unknown node {name}")
+        if role and node.role != role:
+            raise KeyError(f"Node {name} is not an {role} node")
+        return node
+
+    def link_uuid(self, entry, exit_node):
+        pair = f"{entry.name}->{exit_node.name}"
+        if pair not in self.links:
+            self.links[pair] = str(uuid4())
+            self._save()
+        return self.links[pair]
+
+    async def call(self, node, method, path, payload=None):
+        """Запрос к API узла с его лимитом параллельности и таймаутом; ошибка сети или HTTP -> FleetError"""
+        timeout = aiohttp.ClientTimeout(total=node.timeout)
+        async with node.semaphore:
+            try:
+                async with http_client.session.request(
+                    method, f"{node.url}/api/v1{path}", json=payload, timeout=timeout
+                ) as resp:
+                    if resp.status >= 300:
+                        raise FleetError(node.name, f"HTTP {resp.status}: {(await resp.text())[:200]}")
+                    return await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise FleetError(node.name, f"{type(e).__name__}: {e}") from e
+
+    async def provision_cascade(self, uuids, entry_name, exit_name):
+        """Регистрирует пользователей каскада на entry-узле и UUID связки на exit-узле параллельно.
+
+        Если один хоп не удался, созданное этим вызовом на другом хопе откатывается.
+        """
+        entry = self.node(entry_name, ROLE_ENTRY)
+        exit_node = self.node(exit_name, ROLE_EXIT)
+        link = self.link_uuid(entry, exit_node)
+        # Куда entry-узел вёл каскад до вызова: при откате outbound возвращается туда же
+        upstream = await self.call(entry, "GET", "/cascade/upstream")
+        cascade_request = {
+            "uuids": uuids,
+            "server2_ip": exit_node.address,
+            "server2_port": exit_node.cascade_port,
+            "server2_uuid": link,
+        }
+        link_request = {"uuid": link, "port": exit_node.cascade_port}
+        entry_result, exit_result = await asyncio.gather(
+            self.call(entry, "POST", "/cascade/bulk", cascade_request),
+            self.call(exit_node, "POST", "/cascade/link", link_request),
+            return_exceptions=True,
+        )
+
+        entry_failed = isinstance(entry_result, Exception)
+        exit_failed = isinstance(exit_result, Exception) or not _ok_or_exists(exit_result)
+        created = [] if entry_failed else [result["uuid"] for result in entry_result["results"] if result["success"]]
+        if not entry_failed and not exit_failed:
+            logger.info(f"Каскад {entry.name} -> {exit_node.name}: создано {len(created)} пользователей")
+            return {"link_uuid": link, "results": entry_result["results"]}
+
+        rollback = []
+        if created:
+            rollback.append(self.call(entry, "DELETE", "/cascade/bulk", {**cascade_request, "uuids": created}))
+        if not entry_failed and upstream and upstream != {key: cascade_request[key] for key in upstream}:
+            # Вызов перенаправил outbound entry-узла на недоступный exit — прежние каскадные пользователи
+            # остались бы без выхода
+            rollback.append(self.call(entry, "PUT", "/cascade/upstream", upstream))
+        # UUID связки общий для всех пользователей пары — удаляем, только если его создал этот вызов
+        if not isinstance(exit_result, Exception) and exit_result.get("success") and entry_failed:
+            rollback.append(self.call(exit_node, "DELETE", "/cascade/link", link_request))
+        rollback_results = await asyncio.gather(*rollback, return_exceptions=True)
+        for result in rollback_results:
+            if isinstance(result, Exception):
+                logger.error(f"Откат каскада {entry.name} -> {exit_node.name} не удался: {result}")
+
+        if entry_failed:
+            error = entry_result
+        elif isinstance(exit_result, Exception):
+            error = exit_result
+        else:
+            error = FleetError(exit_node.name, exit_result.get("message", "registration failed"))
+        raise error
+
+    async def remove_cascade(self, uuids, entry_name, exit_name=""):
+        """Удаляет пользователей каскада с entry-узла; после последнего отзывает UUID связок на exit-узлах.
+
+        Удаление на entry-узле уже сделано, поэтому сбой отдельного exit-узла не прерывает остальные:
+        он попадает в errors, а его связка остаётся в реестре до следующего вызова.
+        """
+        entry = self.node(entry_name, ROLE_ENTRY)
+        result = await self.call(entry, "DELETE", "/cascade/bulk", {"uuids": uuids, "server2_ip": ""})
+        result["links_removed"] = []
+        result["errors"] = {}
+        try:
+            remaining = await self.call(entry, "GET", "/cascade/count")
+        except FleetError as e:
+            result["errors"][entry.name] = str(e)
+            return result
+        if remaining.get("count"):
+            return result
+
+        # UUID связки общий для всех пользователей пары, поэтому живёт, пока они есть
+        pairs = [f"{entry.name}->{exit_name}"] if exit_name else [
+            pair for pair in self.links if pair.split("->")[0] == entry.name
+        ]
+        revoke = []
+        for pair in pairs:
+            link = self.links.get(pair)
+            exit_node = self.nodes.get(pair.split("->")[1])
+            if link is not None and exit_node is not None:
+                revoke.append((pair, exit_node, link))
+        results = await asyncio.gather(
+            *(self.call(exit_node, "DELETE", "/cascade/link", {"uuid": link, "port": exit_node.cascade_port})
+              for _, exit_node, link in revoke),
+            return_exceptions=True,
+        )
+        for (pair, exit_node, _), revoked in zip(revoke, results):
+            if isinstance(revoked, Exception):
+                result["errors"][exit_node.name] = str(revoked)
+                logger.error(f"UUID связки {pair} не отозван: {revoked}")
+                continue
+            # "UUID not found" — связки на узле уже нет, из реестра её тоже убираем
+            del self.links[pair]
+            result["links_removed"].append(exit_node.name)
+            logger.info(f"UUID связки {pair} отозван на {exit_node.name}")
+        if result["links_removed"]:
+            self._save()
+        return result
+
+    async def fan_out(self, method, path, payload, node_names=None):
+        """Один и тот же запрос ко всем узлам сразу: {узел: ответ} и {узел: ошибка}"""
+        self.load()
+        if node_names:
+            nodes = [self.node(name) for name in node_names]
+        else:
+            nodes = [node for node in self.nodes.values() if node.role == ROLE_ENTRY]
+        results = await asyncio.gather(
+            *(self.call(node, method, path, payload) for node in nodes), return_exceptions=True
+        )
+        responses, errors = {}, {}
+        for node, result in zip(nodes, results):
+            if isinstance(result, Exception):
+                errors[node.name] = str(result)
+            else:
+                responses[node.name] = result
+        return responses, errors
+
+
+fleet = FleetController()
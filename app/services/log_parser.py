@@ -0,0 +1,164 @@
+import hashlib
+import re
+from datetime import datetime
+from functools import lru_cache
+
+# Запасные регулярки для строк, которые не прошли быстрый разбор через split
+XRAY_LINE_RE = re.compile(
+    r"(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})\.\d+ from (?:tcp:|udp:)?([\d\.]+):\d+ "
+    r"accepted (tcp|udp):(.+):(\d+) (?:\[([^\]]*)\] )?.*?email: (\S+)"
+)
+# logformat compact из squid/squid.conf:
+# %ts.%03tu %>a %<a %un %>rm %ru %>Hs %<st %Ss/%Sh "%{User-Agent}>h" "%{Host}>h"
+SQUID_COMPACT_RE = re.compile(
+    r'(\d+\.\d+) (\S+) (\S+) (\S+) ([A-Z]+) (\S+) (\d+) (\d+) (\S+) "([^"]*)" "([^"]*)"'
+)
+# Старый формат без %<a и %<st, которым записан logs/squid/access.log
+SQUID_LEGACY_RE = re.compile(r"(\d+\.\d+) (\S+) (\S+) ([A-Z]+) (\S+) (\d+)$")
+
+
+class XrayRecord:
+    __slots__ = ("timestamp", "ip", "network", "destination", "port", "inbound", "outbound", "email", "uuid")
+
+    def __init__(self, timestamp, ip, network, destination, port, inbound, outbound, email):
+        self.timestamp = timestamp
+        self.ip = ip
+        self.network = network
+        self.destination = destination
+        self.port = port
+        self.inbound = inbound
+        self.outbound = outbound
+        self.email = email
+        # Для каскада email имеет вид uuid@cascade
+        self.uuid = email.split("@", 1)[0]
+
+    def __repr__(self):
+        return f"XrayRecord({self.timestamp} {self.ip} -> {self.destination}:{self.port} {self.uuid})"
+
+
+class SquidRecord:
+    __slots__ = ("timestamp", "client_ip", "server_ip", "user", "method", "url", "host", "status",
+                 "bytes_sent", "squid_status", "user_agent")
+
+    def __init__(self, timestamp, client_ip, server_ip, user, method, url, status, bytes_sent,
+                 squid_status=None, user_agent=None):
+        self.timestamp = timestamp
+        self.client_ip = client_ip
+        self.server_ip = server_ip
+        self.user = user
+        self.method = method
+        self.url = url
+        self.host = _url_host(url)
+        self.status = status
+        self.bytes_sent = bytes_sent
+        self.squid_status = squid_status
+        self.user_agent = user_agent
+
+    def __repr__(self):
+        return f"SquidRecord({self.timestamp} {self.user} {self.method} {self.url} {self.status})"
+
+
+@lru_cache(maxsize=4096)
+def parse_xray_time(value):
+    """'2025/06/15 12:34:56' -> datetime; строк в одной секунде много, поэтому кешируем по секундам"""
+    return datetime(
+        int(value[0:4]), int(value[5:7]), int(value[8:10]),
+        int(value[11:13]), int(value[14:16]), int(value[17:19]),
+    )
+
+
+def _url_host(url):
+    if "://" in url:
+        url = url.split("/", 3)[2]
+    return url.rsplit(":", 1)[0] if url.count(":") == 1 else url
+
+
+def parse_xray_line(line):
+    """Разбирает строку access.log Xray вида
+    '2025/06/15 12:34:56.123456 from 1.2.3.4:5555 accepted tcp:example.com:443 [in >> out] email: uuid'"""
+    parts = line.split(" ", 6)
+    if len(parts) == 7 and parts[2] == "from" and parts[4] == "accepted":
+        email_pos = line.rfind(" email: ")
+        if email_pos < 0:
+            return None
+        src = parts[3]
+        if src.startswith(("tcp:", "udp:")):
+            src = src[4:]
+        network, _, dest = parts[5].partition(":")
+        host, _, port = dest.rpartition(":")
+        inbound = outbound = None
+        route = parts[6]
+        if route.startswith("["):
+            end = route.find("]")
+            inbound, _, outbound = route[1:end].partition(" >> ")
+        try:
+            return XrayRecord(
+                parse_xray_time(line[:19]), src.rpartition(":")[0], network, host, int(port),
+                inbound, outbound or None, line[email_pos + 8:].strip(),
+            )
+        except ValueError:
+            pass
+
+    match = XRAY_LINE_RE.search(line)
+    if not match:
+        return None
+    timestamp_str, ip, network, host, port, route, email = match.groups()
+    inbound = outbound = None
+    if route:
+        inbound, _, outbound = route.partition(" >> ")
+    return XrayRecord(parse_xray_time(timestamp_str), ip, network, host, int(port), inbound, outbound or None, email)
+
+
+def idempotency_key(line, server_ip):
+    """Ключ для дедупликации на коллекторе: одинаков у живой отправки и у повторной догрузки строки"""
+    return hashlib.blake2b(f"{server_ip}|{line}".encode(), digest_size=16).hexdigest()
+
+
+def collector_payload(record, line, status, bytes_sent, server_ip):
+    """Запись для центрального коллектора по строке Xray и найденным для неё данным Squid"""
+    line = line.strip()
+    return {
+        "uuid": record.uuid,
+        "ip": record.ip,
+        "destination": record.destination,
+        "timestamp": record.timestamp.isoformat(),
+        # если запись Squid найдена — accepted, иначе failed
+        "status": "accepted" if status is not None else "failed",
+        "bytes_sent": bytes_sent,
+        "server_ip": server_ip,
+        "raw_log": f"{line} server_ip: {server_ip}",
+        "idempotency_key": idempotency_key(line, server_ip),
+    }
+
+
+def parse_squid_line(line):
+    """Разбирает строку access.log Squid в формате compact или в старом 6-польном формате"""
+    parts = line.split(" ", 9)
+    try:
+        if len(parts) == 10 and "/" in parts[8]:
+            tail = parts[9]
+            ua_end = tail.find('" "')
+            return SquidRecord(
+                float(parts[0]), parts[1], parts[2], parts[3], parts[4], parts[5],
+                int(parts[6]), int(parts[7]), parts[8],
+                tail[1:ua_end] if ua_end > 0 else None,
+            )
+        if len(parts) == 6:
+            return SquidRecord(
+                float(parts[0]), parts[1], None, parts[2], parts[3], parts[4],
+                int(parts[5]), None,
+            )
+    except ValueError:
+        pass
+
+    line = line.rstrip()
+    match = SQUID_COMPACT_RE.match(line)
+    if match:
+        ts, client_ip, server_ip, user, method, url, status, bytes_sent, squid_status, ua, _ = match.groups()
+        return SquidRecord(float(ts), client_ip, server_ip, user, method, url, int(status), int(bytes_sent),
+                           squid_status, ua)
+    match = SQUID_LEGACY_RE.match(line)
+    if match:
+        ts, client_ip, user, method, url, status = match.groups()
+        return SquidRecord(float(ts), client_ip, None, user, method, url, int(status), None)
+    return None
@@ -0,0 +1,267 @@
+import asyncio
+import contextlib
+import glob
+import json
+import logging
+import os
+import random
+import shutil
+import time
+
+import aiohttp
+
+from app.core.metrics import COLLECTOR_POST_SECONDS, COLLECTOR_RESPONSES
+from app.utils.files import atomic_write
+
+QUEUE_SIZE = 20000  # записей в очереди перед отправкой
+BATCH_SIZE = 200  # максимум записей в одном POST
+BATCH_MAX_AGE = 1.0  # секунд, сколько ждём добора пачки
+MAX_CONCURRENCY = 4  # одновременных POST к коллектору
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 0.5  # секунд, растёт как 2**attempt
+REQUEST_TIMEOUT = 10
+COLLECTOR_DOWN_PAUSE = 30  # секунд, сколько пишем сразу в спул после неудачи
+SPOOL_DIR = os.getenv("LOG_SPOOL_DIR", "/app/spool")
+SPOOL_MAX_BYTES = 512 * 1024 * 1024
+SPOOL_RETRY_INTERVAL = 15
+HANDOFF_PREFIX = "handoff-"  # спул, переданный шипперу другим процессом (догрузкой)
+
+logger = logging.getLogger("log_shipper")
+
+
+def hand_off_spool(path, spool_dir, name):
+    """Передаёт файл спула шипперу, работающему со spool_dir; он дошлёт его после основного спула"""
+    os.makedirs(spool_dir, exist_ok=True)
+    target = os.path.join(spool_dir, f"{HANDOFF_PREFIX}{name}.jsonl")
+    shutil.move(path, target)
+    return target
+
+
+class LogShipper:
+    """Отправляет записи в центральный коллектор пачками через пул keep-alive соединений"""
+
+    def __init__(self, url, spool_dir=SPOOL_DIR):
+        self.url = url
+        self.spool_dir = spool_dir
+        self.spool_path = os.path.join(spool_dir, "central_log.jsonl")
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.stats = {"queued": 0, "sent": 0, "dropped": 0, "retried": 0, "spooled": 0}
+        self.session = None
+        self._owns_session = False
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        self._inflight = set()
+        self._batcher_task = None
+        self._spool_task = None
+        self._closing = False
+        self._down_until = 0.0
+
+    def submit(self, record):
+        """Ставит запись в очередь, не блокируя чтение логов; при переполнении запись теряется"""
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    async def put(self, record):
+        """Как submit, но ждёт места в очереди — для догрузки истории, где терять записи нельзя"""
+        await self.queue.put(record)
+        self.stats["queued"] += 1
+
+    async def start(self, session=None):
+        """session — общий пул приложения; без него шиппер создаёт и закрывает свой"""
+        if self._batcher_task:
+            return
+        if session is not None:
+            self.session = session
+        elif self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=MAX_CONCURRENCY, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+            self._owns_session = True
+        self._closing = False
+        self._batcher_task = asyncio.create_task(self._batcher())
+        self._spool_task = asyncio.create_task(self._drain_spool())
+
+    async def close(self):
+        """Досылает очередь и ожидающие пачки, остаток уходит в спул"""
+        self._closing = True
+        if self._spool_task:
+            self._spool_task.cancel()
+            await asyncio.gather(self._spool_task, return_exceptions=True)
+            self._spool_task = None
+        if self._batcher_task:
+            await self._batcher_task
+            self._batcher_task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self.session and self._owns_session:
+            await self.session.close()
+        self.session = None
+        self._owns_session = False
+
+    async def _next_batch(self):
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self.queue.get(), timeout=BATCH_MAX_AGE))
+        except asyncio.TimeoutError:
+            return batch
+        deadline = time.monotonic() + BATCH_MAX_AGE
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._closing:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batcher(self):
+        while not (self._closing and self.queue.empty()):
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._send_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _post(self, batch):
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        started = time.perf_counter()
+        try:
+            async with self.session.post(self.url, json=batch, timeout=timeout) as resp:
+                COLLECTOR_RESPONSES.labels(str(resp.status)).inc()
+                if resp.status >= 300:
+                    raise RuntimeError(f"HTTP {resp.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            COLLECTOR_RESPONSES.labels("error").inc()
+            raise
+        finally:
+            COLLECTOR_POST_SECONDS.observe(time.perf_counter() - started)
+
+    async def _send_batch(self, batch):
+        try:
+            if time.monotonic() < self._down_until:
+                await asyncio.to_thread(self._spool, batch)
+                return
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    await self._post(batch)
+                    self.stats["sent"] += len(batch)
+                    self._down_until = 0.0
+                    return
+                except Exception as e:
+                    if attempt == MAX_RETRIES or self._closing:
+                        logger.warning(f"Коллектор недоступен ({e}), {len(batch)} записей в спул")
+                        break
+                    self.stats["retried"] += len(batch)
+                    delay = RETRY_BASE_DELAY * 2 ** attempt
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            self._down_until = time.monotonic() + COLLECTOR_DOWN_PAUSE
+            await asyncio.to_thread(self._spool, batch)
+        finally:
+            self._semaphore.release()
+
+    def _spool(self, batch):
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        try:
+            size = os.path.getsize(self.spool_path)
+        except FileNotFoundError:
+            size = 0
+        if size >= SPOOL_MAX_BYTES:
+            self.stats["dropped"] += len(batch)
+            return
+        with open(self.spool_path, "a") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in batch))
+        self.stats["spooled"] += len(batch)
+
+    def _claim_spool(self):
+        """Путь к файлу спула для досылки или None.
+
+        Сначала недосланный после остановки .sending, затем основной спул (переименованием, чтобы новые
+        записи шли в свежий файл), затем один переданный файл (hand_off_spool) за проход.
+        """
+        sending = sorted(glob.glob(os.path.join(self.spool_dir, "*.sending")))
+        if sending:
+            return sending[0]
+        path = self.spool_path
+        if not os.path.exists(path):
+            handed_off = sorted(glob.glob(os.path.join(self.spool_dir, f"{HANDOFF_PREFIX}*.jsonl")))
+            if not handed_off:
+                return None
+            path = handed_off[0]
+        sending_path = path + ".sending"
+        os.replace(path, sending_path)
+        return sending_path
+
+    @staticmethod
+    def _read_chunk(path, offset):
+        """До BATCH_SIZE записей с позиции offset: (записи, позиция после них)"""
+        records = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while len(records) < BATCH_SIZE:
+                line = f.readline()
+                if not line:
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Битая строка спула пропущена: {line[:200]!r}")
+        return records, offset
+
+    @staticmethod
+    def _sent_offset(path):
+        try:
+            with open(path + ".offset") as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _finish_spool(path):
+        os.remove(path)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path + ".offset")
+
+    async def _send_spool(self, path):
+        """Досылает файл спула пачками, читая его потоком; позиция отправленного хранится в path.offset,
+        так что остановка посреди досылки не теряет и не дублирует уже отправленные пачки"""
+        offset = await asyncio.to_thread(self._sent_offset, path)
+        while True:
+            if time.monotonic() < self._down_until:
+                return  # коллектор снова лёг — остаток дошлём на следующем проходе с сохранённой позиции
+            records, next_offset = await asyncio.to_thread(self._read_chunk, path, offset)
+            if not records:
+                break
+            await self._semaphore.acquire()
+            # При отказе коллектора пачка уходит в основной спул — из этого файла она считается отправленной
+            await self._send_batch(records)
+            offset = next_offset
+            await asyncio.to_thread(atomic_write, path + ".offset", str(offset))
+        await asyncio.to_thread(self._finish_spool, path)
+
+    async def _drain_spool(self):
+        while True:
+            await asyncio.sleep(SPOOL_RETRY_INTERVAL)
+            if time.monotonic() < self._down_until:
+                continue
+            try:
+                path = await asyncio.to_thread(self._claim_spool)
+                if path is not None:
+                    await self._send_spool(path)
+            except Exception as e:
+                logger.error(f"Ошибка досылки спула: {e}")
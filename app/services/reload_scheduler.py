@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+import time
+
+from app.core.timing import span
+from app.services.xray_control import restart_xray
+
+RELOAD_DEBOUNCE = float(os.getenv("XRAY_RELOAD_DEBOUNCE", "1.0"))  # секунд, окно склейки изменений
+
+logger = logging.getLogger("reload_scheduler")
+
+
+class ReloadScheduler:
+    """Склеивает запросы на перезапуск Xray: все изменения внутри окна debounce покрываются одним перезапуском.
+
+    Окно открывается первым запросом и не продлевается, поэтому изменение ждёт не дольше
+    debounce + длительность перезапуска, а частота перезапусков ограничена сверху.
+    """
+
+    def __init__(self, reload_func=restart_xray, debounce=RELOAD_DEBOUNCE):
+        self.reload_func = reload_func
+        self.debounce = debounce
+        self._pending = None  # future перезапуска, который покроет ещё не применённые изменения
+        self._pending_requests = 0
+        self._running_requests = 0
+        self._task = None
+        self.stats = {
+            "requested": 0,
+            "reloads": 0,
+            "failures": 0,
+            "last_duration": None,
+            "last_reload_at": None,
+            "last_error": None,
+        }
+
+    def request(self):
+        """Регистрирует изменение конфига; возвращает future, который завершится после покрывающего его перезапуска"""
+        if self._pending is None:
+            self._pending = asyncio.get_running_loop().create_future()
+            # Ошибку увидят только те, кто ждёт; остальным не нужен "exception was never retrieved"
+            self._pending.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._pending_requests = 0
+        self._pending_requests += 1
+        self.stats["requested"] += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._worker())
+        return self._pending
+
+    async def _worker(self):
+        try:
+            while self._pending is not None:
+                await asyncio.sleep(self.debounce)
+                future, self._pending = self._pending, None
+                self._running_requests, self._pending_requests = self._pending_requests, 0
+                logger.info(f"Перезапуск Xray для {self._running_requests} изменений")
+                started = time.monotonic()
+                try:
+                    await self.reload_func()
+                except Exception as e:
+                    self.stats["failures"] += 1
+                    self.stats["last_error"] = str(e)
+                    future.set_exception(e)
+                else:
+                    self.stats["reloads"] += 1
+                    future.set_result(None)
+                finally:
+                    self.stats["last_duration"] = round(time.monotonic() - started, 3)
+                    self.stats["last_reload_at"] = time.time()
+                    self._running_requests = 0
+        finally:
+            self._task = None
+
+    async def close(self):
+        """Дожидается перезапуска для уже принятых изменений, чтобы они не потерялись при остановке"""
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception as e:
+                logger.error(f"Перезапуск Xray при остановке не удался: {e}")
+
+    def status(self):
+        return {
+            "queue_depth": self._pending_requests,
+            "in_progress": self._running_requests,
+            "debounce": self.debounce,
+            **self.stats,
+        }
+
+
+reload_scheduler = ReloadScheduler()
+
+
+async def schedule_reload(wait=True):
+    """Просит перезапуск Xray. При wait=True ждёт его завершения; возвращает True, если перезапуск ещё впереди"""
+    future = reload_scheduler.request()
+    if not wait:
+        return True
+    # shield: обрыв HTTP-запроса не должен отменять общий для всех перезапуск
+    with span("xray_restart"):
+        await asyncio.shield(future)
+    return False
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from app.core.http import http_client
+from app.core.metrics import SESSION_LIMIT_EXCEEDED, SESSION_USERS
+
+SESSION_WINDOW = int(os.getenv("SESSION_WINDOW", "300"))  # секунд; IP считается активным столько после подключения
+SESSION_IP_LIMIT = int(os.getenv("SESSION_IP_LIMIT", "0"))  # одновременных IP на UUID; 0 — без ограничения
+SESSION_LIMIT_WEBHOOK = os.getenv("SESSION_LIMIT_WEBHOOK", "")  # POST при превышении лимита
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "100000"))
+SESSION_MAX_IPS = 256  # IP одного UUID в памяти; самый давний вытесняется
+WEBHOOK_TIMEOUT = 5
+
+logger = logging.getLogger("sessions")
+
+
+class _UserSessions:
+    __slots__ = ("ips", "rate", "last_seen", "alerted_at")
+
+    def __init__(self):
+        # ip -> [first_seen, last_seen, connections, last_destination]; порядок — по last_seen
+        self.ips = OrderedDict()
+        # [секунда, подключений] за окно — счётчик частоты с памятью O(окно)
+        self.rate = deque()
+        self.last_seen = 0.0
+        self.alerted_at = None
+
+    def add(self, ip, destination, ts, window):
+        session = self.ips.get(ip)
+        if session is None:
+            session = self.ips[ip] = [ts, ts, 0, destination]
+            if len(self.ips) > SESSION_MAX_IPS:
+                self.ips.popitem(last=False)
+        else:
+            self.ips.move_to_end(ip)
+        session[1] = max(session[1], ts)
+        session[2] += 1
+        session[3] = destination
+        self.last_seen = max(self.last_seen, ts)
+
+        second = int(ts)
+        if self.rate and self.rate[-1][0] >= second:
+            self.rate[-1][1] += 1
+        else:
+            self.rate.append([second, 1])
+        self.expire(ts - window)
+
+    def expire(self, horizon):
+        while self.ips and next(iter(self.ips.values()))[1] < horizon:
+            self.ips.popitem(last=False)
+        while self.rate and self.rate[0][0] < horizon:
+            self.rate.popleft()
+
+    def connections(self):
+        return sum(count for _, count in self.rate)
+
+
+class SessionTracker:
+    """Активные сессии по строкам access.log Xray: различные IP и частота подключений UUID за скользящее окно.
+
+    Пользователи хранятся в LRU по последнему подключению, поэтому истёкшие всегда в начале и
+    удаляются за O(1) на событие; пользователей не больше max_users. При превышении ip_limit
+    вызываются обработчики on_limit (и webhook из SESSION_LIMIT_WEBHOOK) — не чаще раза в окно на UUID.
+    """
+
+    def __init__(self, window=SESSION_WINDOW, ip_limit=SESSION_IP_LIMIT, max_users=SESSION_MAX_USERS,
+                 webhook=SESSION_LIMIT_WEBHOOK):
+        self.window = window
+        self.ip_limit = ip_limit
+        self.max_users = max_users
+        self.webhook = webhook
+        self._users = OrderedDict()
+        self._callbacks = []
+        self._tasks = set()
+        SESSION_USERS.set_function(lambda: len(self._users))
+
+    def on_limit(self, callback):
+        """callback(uuid, сведения о сессиях) — обычная функция или корутина"""
+        self._callbacks.append(callback)
+        return callback
+
+    def submit(self, uuid, ip, destination=None, ts=None):
+        now = time.time()
+        if ts is None:
+            ts = now
+        if ts < now - self.window:
+            return  # строка старше окна, например дочитывание после рестарта
+        user = self._users.get(uuid)
+        if user is None:
+            user = self._users[uuid] = _UserSessions()
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(uuid)
+        user.add(ip, destination, ts, self.window)
+        self._expire(now)
+
+        if self.ip_limit and len(user.ips) > self.ip_limit:
+            if user.alerted_at is None or ts - user.alerted_at >= self.window:
+                user.alerted_at = ts
+                self._limit_exceeded(uuid, user)
+
+    def _expire(self, now):
+        horizon = now - self.window
+        users = self._users
+        while users:
+            uuid, user = next(iter(users.items()))
+            if user.last_seen >= horizon:
+                break
+            del users[uuid]
+
+    def _limit_exceeded(self, uuid, user):
+        SESSION_LIMIT_EXCEEDED.inc()
+        info = self._describe(uuid, user)
+        logger.warning(f"UUID {uuid}: {len(user.ips)} IP за {self.window} с (лимит {self.ip_limit})")
+        for callback in self._callbacks:
+            try:
+                result = callback(uuid, info)
+                if asyncio.iscoroutine(result):
+                    self._spawn(result)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика превышения лимита: {e}")
+        if self.webhook:
+            self._spawn(self._post_webhook(info))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _post_webhook(self, info):
+        try:
+            async with http_client.session.post(
+                self.webhook, json={"event": "session_limit_exceeded", **info}, timeout=WEBHOOK_TIMEOUT
+            ) as resp:
+                if resp.status >= 300:
+                    logger.warning(f"Webhook лимита сессий ответил {resp.status}")
+        except Exception as e:
+            logger.warning(f"Webhook лимита сессий недоступен: {e}")
+
+    def _describe(self, uuid, user):
+        return {
+            "uuid": uuid,
+            "window": self.window,
+            "ip_limit": self.ip_limit or None,
+            "over_limit": bool(self.ip_limit) and len(user.ips) > self.ip_limit,
+            "connections": user.connections(),
+            "last_seen": _iso(user.last_seen),
+            "sessions": [
+                {
+                    "ip": ip,
+                    "first_seen": _iso(first_seen),
+                    "last_seen": _iso(last_seen),
+                    "connections": connections,
+                    "last_destination": destination,
+                }
+                for ip, (first_seen, last_seen, connections, destination) in reversed(user.ips.items())
+            ],
+        }
+
+    def sessions(self, uuid):
+        """Активные IP пользователя за окно или None, если он не подключался"""
+        now = time.time()
+        self._expire(now)
+        user = self._users.get(uuid)
+        if user is None:
+            return None
+        user.expire(now - self.window)
+        return self._describe(uuid, user)
+
+    def online(self, min_ips=1, limit=None):
+        """Пользователи, подключавшиеся за окно; самые недавние первыми"""
+        now = time.time()
+        self._expire(now)
+        horizon = now - self.window
+        items = []
+        for uuid, user in reversed(self._users.items()):
+            user.expire(horizon)
+            if len(user.ips) < min_ips:
+                continue
+            items.append({
+                "uuid": uuid,
+                "ips": len(user.ips),
+                "connections": user.connections(),
+                "last_seen": _iso(user.last_seen),
+                "over_limit": bool(self.ip_limit) and len(user.ips) > self.ip_limit,
+            })
+            if limit and len(items) >= limit:
+                break
+        return {"window": self.window, "ip_limit": self.ip_limit or None, "online": len(self._users), "users": items}
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds")
+
+
+session_tracker = SessionTracker()
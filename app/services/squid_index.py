@@ -0,0 +1,95 @@
+import os
+from collections import deque
+
+from app.core.metrics import SQUID_LINES_READ, TAIL_LAG_BYTES
+from app.services.file_follower import FileFollower
+from app.services.log_parser import parse_squid_line
+
+SQUID_LOG_PATH = os.getenv("SQUID_LOG_PATH", "/logs/squid/access.log")
+
+MATCH_WINDOW = 10  # секунд, окно сопоставления строк Xray и Squid
+RETENTION = 60  # секунд, сколько храним записи Squid в индексе
+MAX_ENTRIES_PER_KEY = 64  # защита от одного "шумного" (uuid, домен)
+PRIME_BYTES = 1024 * 1024  # сколько хвоста файла читаем при старте
+
+
+class SquidLogIndex:
+    """Следит за access.log Squid и держит индекс (uuid, домен) -> записи за последние RETENTION секунд"""
+
+    def __init__(self, path=SQUID_LOG_PATH, retention=RETENTION, match_window=MATCH_WINDOW):
+        self.path = path
+        self.retention = retention
+        self.match_window = match_window
+        self.running = False
+        # (uuid, домен) -> deque[(unix_ts, status, bytes_sent)], по возрастанию времени
+        self._index = {}
+        # Общая очередь на вытеснение: (unix_ts, ключ) в порядке поступления
+        self._expiry = deque()
+        self._latest_ts = 0.0
+        # Смещение не сохраняем: после рестарта индексу нужен только свежий хвост
+        self.follower = FileFollower(path, prime_bytes=PRIME_BYTES)
+        TAIL_LAG_BYTES.labels("squid").set_function(self.follower.lag_bytes)
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def add_line(self, line):
+        record = parse_squid_line(line)
+        if record is None:
+            return
+        ts = record.timestamp
+        key = (record.user.split("@")[0], record.host)
+
+        entries = self._index.get(key)
+        if entries is None:
+            entries = self._index[key] = deque(maxlen=MAX_ENTRIES_PER_KEY)
+        entries.append((ts, record.status, record.bytes_sent))
+        self._expiry.append((ts, key))
+
+        if ts > self._latest_ts:
+            self._latest_ts = ts
+        self._expire()
+
+    def _expire(self):
+        """Выкидывает записи старше RETENTION относительно самой свежей строки лога"""
+        border = self._latest_ts - self.retention
+        expiry = self._expiry
+        index = self._index
+        while expiry and expiry[0][0] < border:
+            ts, key = expiry.popleft()
+            entries = index.get(key)
+            if not entries:
+                continue
+            # deque по ключу мог уже вытеснить запись по maxlen
+            if entries[0][0] <= ts:
+                entries.popleft()
+            if not entries:
+                del index[key]
+
+    def lookup(self, uuid, domain, xray_timestamp=None):
+        """Возвращает (status, bytes_sent) самой свежей подходящей записи или (None, None)"""
+        entries = self._index.get((uuid, domain))
+        if not entries:
+            return None, None
+        if xray_timestamp is None:
+            _, status, bytes_sent = entries[-1]
+            return status, bytes_sent
+        xray_time = xray_timestamp.timestamp()
+        for ts, status, bytes_sent in reversed(entries):
+            if abs(ts - xray_time) <= self.match_window:
+                return status, bytes_sent
+            if ts < xray_time - self.match_window:
+                break
+        return None, None
+
+    async def run(self):
+        self.running = True
+        print(f"🦑 Запущен индекс Squid access.log: {self.path}")
+        async for lines in self.follower:
+            SQUID_LINES_READ.inc(len(lines))
+            for line in lines:
+                self.add_line(line)
+
+    def stop(self):
+        self.running = False
+        self.follower.stop()
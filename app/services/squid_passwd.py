@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.core.timing import span
+from app.utils.files import atomic_write
+from app.utils.hashing import hash_htpasswd
+
+SQUID_PASSWD_FILE = Path(os.getenv("SQUID_PASSWD_FILE", "/etc/squid/passwd"))
+HASH_WORKERS = 4
+
+logger = logging.getLogger("squid_passwd")
+
+
+class SquidPasswdManager:
+    """Файл паролей Squid (формат htpasswd) с индексом пользователей в памяти.
+
+    Хеши считаются в пуле потоков, изменения применяются пачками и записываются атомарно.
+    """
+
+    def __init__(self, path=SQUID_PASSWD_FILE):
+        self.path = Path(path)
+        self.lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="htpasswd")
+        self._entries = {}  # пользователь -> хеш, в порядке строк файла
+        self._stat_key = None
+
+    def _current_stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _read(self):
+        entries = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    user, sep, hashed = line.rstrip("\n").partition(":")
+                    if sep and user:
+                        entries[user] = hashed
+        except FileNotFoundError:
+            pass
+        return entries
+
+    async def _load(self):
+        stat_key = self._current_stat_key()
+        if stat_key != self._stat_key or stat_key is None:
+            self._entries = await asyncio.to_thread(self._read)
+            self._stat_key = stat_key
+        return self._entries
+
+    async def _save(self):
+        data = "".join(f"{user}:{hashed}\n" for user, hashed in self._entries.items())
+        await asyncio.to_thread(atomic_write, self.path, data)
+        self._stat_key = self._current_stat_key()
+
+    async def upsert(self, users, password):
+        """Добавляет или обновляет пользователей с общим паролем одной перезаписью файла"""
+        users = list(dict.fromkeys(users))
+        if not users:
+            return
+        loop = asyncio.get_running_loop()
+        with span("passwd_hash"):
+            hashes = await asyncio.gather(
+                *(loop.run_in_executor(self._executor, hash_htpasswd, password) for _ in users)
+            )
+        with span("passwd_write"):
+            async with self.lock:
+                entries = await self._load()
+                entries.update(zip(users, hashes))
+                await self._save()
+        logger.info(f"В {self.path} записано пользователей: {len(users)}")
+
+    async def delete(self, users):
+        """Удаляет пользователей; файл перезаписывается, только если кто-то из них в нём был"""
+        with span("passwd_write"):
+            async with self.lock:
+                entries = await self._load()
+                removed = [user for user in users if entries.pop(user, None) is not None]
+                if removed:
+                    await self._save()
+        if removed:
+            logger.info(f"Из {self.path} удалено пользователей: {len(removed)}")
+        return removed
+
+    async def contains(self, user):
+        return user in await self._load()
+
+
+squid_passwd = SquidPasswdManager()
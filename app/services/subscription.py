@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+from urllib.parse import quote, urlencode
+
+from app.services.config_store import config_store
+
+# Адрес узла для клиентов; inbound с ws и заголовком Host получают адрес из него
+PUBLIC_HOST = os.getenv("PUBLIC_HOST", "indonesia.admin.anonixvpn.space")
+REALITY_FINGERPRINT = "chrome"
+# Служебные inbound: API Xray и приём связок каскада на exit-узле — не для клиентов
+INTERNAL_INBOUND_TAGS = {"api", "cascade-link-in"}
+LINK_EMAIL_SUFFIX = "@link"  # UUID связки entry -> exit может стоять и в общем inbound на порту каскада
+
+logger = logging.getLogger("subscription")
+
+
+def build_link(inbound, client, host=PUBLIC_HOST):
+    """vless:// ссылка клиента по настройкам inbound (reality/tls, tcp/ws/grpc); None для прочих протоколов"""
+    if inbound.get("protocol") != "vless":
+        return None
+    stream = inbound.get("streamSettings", {})
+    network = stream.get("network", "tcp")
+    security = stream.get("security", "none")
+    params = {"encryption": "none", "security": security, "type": network}
+    address = host
+
+    if client.get("flow"):
+        params["flow"] = client["flow"]
+    if security == "reality":
+        reality = stream.get("realitySettings", {})
+        params["sni"] = (reality.get("serverNames") or [""])[0]
+        params["fp"] = REALITY_FINGERPRINT
+        params["pbk"] = reality.get("publicKey", "")
+        params["sid"] = (reality.get("shortIds") or [""])[0]
+        if reality.get("spiderX"):
+            params["spx"] = reality["spiderX"]
+    elif security == "tls":
+        server_name = stream.get("tlsSettings", {}).get("serverName")
+        if server_name:
+            params["sni"] = server_name
+
+    if network == "ws":
+        ws = stream.get("wsSettings", {})
+        ws_host = ws.get("headers", {}).get("Host")
+        if ws_host:
+            params["host"] = ws_host
+            address = ws_host
+        params["path"] = ws.get("path", "/")
+    elif network == "grpc":
+        params["serviceName"] = stream.get("grpcSettings", {}).get("serviceName", "")
+
+    return f"vless://{client['id']}@{address}:{inbound.get('port')}?{urlencode(params, quote_via=quote)}#{quote(inbound.get('tag') or address)}"
+
+
+class SubscriptionCache:
+    """Готовые тела подписок по UUID; пересобираются целиком, когда меняется версия конфига.
+
+    Сборка идёт в отдельном потоке по снимку inbound'ов, снятому в event loop: транзакции
+    config_store меняют закешированный конфиг только в loop, так что снимок согласован.
+    """
+
+    def __init__(self, store=config_store):
+        self.store = store
+        self.version = None
+        # uuid -> (base64-тело, ETag)
+        self._subscriptions = {}
+        self._rebuild_lock = asyncio.Lock()
+
+    @staticmethod
+    def _snapshot(config):
+        """[(inbound без settings, список клиентов)] клиентских inbound'ов"""
+        snapshot = []
+        for inbound in config.get("inbounds", []):
+            if inbound.get("protocol") != "vless" or inbound.get("tag") in INTERNAL_INBOUND_TAGS:
+                continue
+            clients = [
+                client for client in inbound.get("settings", {}).get("clients", [])
+                if not client.get("email", "").endswith(LINK_EMAIL_SUFFIX)
+            ]
+            snapshot.append(({key: value for key, value in inbound.items() if key != "settings"}, clients))
+        return snapshot
+
+    @staticmethod
+    def _build(snapshot):
+        links = {}
+        for inbound, clients in snapshot:
+            for client in clients:
+                link = build_link(inbound, client)
+                if link:
+                    links.setdefault(client["id"], []).append(link)
+        subscriptions = {}
+        for uid, user_links in links.items():
+            body = base64.b64encode("\n".join(user_links).encode())
+            subscriptions[uid] = (body, f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"')
+        return subscriptions
+
+    async def get(self, uid):
+        """(тело, ETag) подписки пользователя или None, если его нет ни в одном inbound"""
+        await self.store.load()
+        if self.version != self.store.version:
+            async with self._rebuild_lock:
+                config = await self.store.load()
+                version = self.store.version
+                if self.version != version:
+                    snapshot = self._snapshot(config)
+                    self._subscriptions = await asyncio.to_thread(self._build, snapshot)
+                    self.version = version
+                    logger.info(f"Подписки пересобраны: {len(self._subscriptions)} пользователей")
+        return self._subscriptions.get(uid)
+
+
+subscriptions = SubscriptionCache()
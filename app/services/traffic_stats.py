@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+from app.services.xray_api import xray_api, XrayApiError
+
+STATS_POLL_INTERVAL = 10  # секунд между опросами StatsService
+# Последний час храним с точностью опроса, более старые точки сворачиваем в почасовые суммы за неделю:
+# не больше 360 + 168 точек на пользователя
+HISTORY_RAW_SECONDS = 3600
+HISTORY_BUCKET_SECONDS = 3600
+HISTORY_BUCKETS = 168
+TRAFFIC_MAX_USERS = int(os.getenv("TRAFFIC_MAX_USERS", "50000"))  # вытесняются давно не активные
+
+logger = logging.getLogger("traffic_stats")
+
+
+class _UserTraffic:
+    __slots__ = ("uplink", "downlink", "recent", "buckets")
+
+    def __init__(self):
+        self.uplink = 0
+        self.downlink = 0
+        # (unix_ts, uplink, downlink) за последние HISTORY_RAW_SECONDS; только интервалы с трафиком
+        self.recent = deque()
+        # [начало часа, uplink, downlink]
+        self.buckets = deque(maxlen=HISTORY_BUCKETS)
+
+    def add(self, ts, uplink, downlink):
+        self.uplink += uplink
+        self.downlink += downlink
+        self.recent.append((ts, uplink, downlink))
+        self.compact(ts)
+
+    def compact(self, now):
+        horizon = now - HISTORY_RAW_SECONDS
+        while self.recent and self.recent[0][0] < horizon:
+            ts, uplink, downlink = self.recent.popleft()
+            start = ts - ts % HISTORY_BUCKET_SECONDS
+            if self.buckets and self.buckets[-1][0] == start:
+                self.buckets[-1][1] += uplink
+                self.buckets[-1][2] += downlink
+            else:
+                self.buckets.append([start, uplink, downlink])
+
+    def series(self, since=None):
+        points = [tuple(bucket) for bucket in self.buckets]
+        points.extend(self.recent)
+        return [point for point in points if since is None or point[0] >= since]
+
+
+class TrafficCollector:
+    """Опрашивает StatsService Xray одним QueryStats с reset и копит трафик по UUID в памяти.
+
+    Пользователи лежат в LRU по последнему трафику, их не больше max_users; удалённых
+    из конфига убирает forget().
+    """
+
+    def __init__(self, api=xray_api, interval=STATS_POLL_INTERVAL, max_users=TRAFFIC_MAX_USERS):
+        self.api = api
+        self.interval = interval
+        self.max_users = max_users
+        self.task = None
+        self.last_poll = None
+        # uuid -> _UserTraffic с момента запуска
+        self._users = OrderedDict()
+
+    async def poll_once(self):
+        stats = await self.api.query_stats("user>>>", reset=True)
+        deltas = {}
+        for name, value in stats.items():
+            # user>>>{email}>>>traffic>>>uplink|downlink
+            parts = name.split(">>>")
+            if len(parts) != 4 or not value:
+                continue
+            uuid = parts[1].split("@", 1)[0]
+            delta = deltas.setdefault(uuid, [0, 0])
+            delta[0 if parts[3] == "uplink" else 1] += value
+
+        now = int(time.time())
+        for uuid, (uplink, downlink) in deltas.items():
+            user = self._users.get(uuid)
+            if user is None:
+                user = self._users[uuid] = _UserTraffic()
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(uuid)
+            user.add(now, uplink, downlink)
+        self.last_poll = now
+        return deltas
+
+    def forget(self, uuids):
+        for uuid in uuids:
+            self._users.pop(uuid, None)
+
+    async def run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except XrayApiError as e:
+                logger.warning(f"Не удалось получить статистику Xray: {e}")
+            except Exception as e:
+                logger.error(f"Ошибка сбора статистики Xray: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if not self.task:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def traffic(self, uuid, since=None):
+        user = self._users.get(uuid)
+        if user is None:
+            return {"uuid": uuid, "uplink": 0, "downlink": 0, "series": []}
+        user.compact(int(time.time()))
+        return {
+            "uuid": uuid,
+            "uplink": user.uplink,
+            "downlink": user.downlink,
+            "series": user.series(since),
+        }
+
+    def export(self):
+        return {
+            "last_poll": self.last_poll,
+            "interval": self.interval,
+            "users": {
+                uuid: {"uplink": user.uplink, "downlink": user.downlink}
+                for uuid, user in self._users.items()
+            },
+        }
+
+
+traffic_collector = TrafficCollector()
@@ -0,0 +1,167 @@
+import logging
+import os
+
+import grpc
+
+# gRPC API Xray (inbound "api", dokodemo-door). Protobuf-сообщения Xray собираем вручную:
+# нужно всего несколько полей, а тянуть сгенерированные *_pb2 ради этого не хочется.
+XRAY_API_ADDRESS = os.getenv("XRAY_API_ADDRESS", "127.0.0.1:10085")
+XRAY_API_TIMEOUT = 3
+
+HANDLER_ALTER_INBOUND = "/xray.app.proxyman.command.HandlerService/AlterInbound"
+STATS_QUERY = "/xray.app.stats.command.StatsService/QueryStats"
+ADD_USER_OPERATION = "xray.app.proxyman.command.AddUserOperation"
+REMOVE_USER_OPERATION = "xray.app.proxyman.command.RemoveUserOperation"
+VLESS_ACCOUNT = "xray.proxy.vless.Account"
+
+logger = logging.getLogger("xray_api")
+
+
+class XrayApiError(RuntimeError):
+    pass
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _field_bytes(number, value):
+    if isinstance(value, str):
+        value = value.encode()
+    if not value:
+        return b""
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def _field_varint(number, value):
+    if not value:
+        return b""
+    return _varint(number << 3) + _varint(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(data):
+    """Разбирает protobuf-сообщение на (номер поля, значение); поддерживаются varint и length-delimited"""
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise XrayApiError(f"Неподдерживаемый wire type {wire_type}")
+        yield number, value
+
+
+def _typed_message(type_name, value):
+    # xray.common.serial.TypedMessage { string type = 1; bytes value = 2; }
+    return _field_bytes(1, type_name) + _field_bytes(2, value)
+
+
+def encode_vless_user(uuid, email, flow="", level=0):
+    # xray.proxy.vless.Account { string id = 1; string flow = 2; string encryption = 3; }
+    account = _field_bytes(1, uuid) + _field_bytes(2, flow) + _field_bytes(3, "none")
+    # xray.common.protocol.User { uint32 level = 1; string email = 2; TypedMessage account = 3; }
+    return (
+        _field_varint(1, level)
+        + _field_bytes(2, email)
+        + _field_bytes(3, _typed_message(VLESS_ACCOUNT, account))
+    )
+
+
+class XrayApi:
+    """Клиент HandlerService Xray: добавление и удаление пользователей без перезапуска"""
+
+    def __init__(self, address=XRAY_API_ADDRESS):
+        self.address = address
+        self._channel = None
+
+    def _get_channel(self):
+        if self._channel is None:
+            self._channel = grpc.aio.insecure_channel(self.address)
+        return self._channel
+
+    async def _call(self, method, request):
+        call = self._get_channel().unary_unary(method)
+        try:
+            return await call(request, timeout=XRAY_API_TIMEOUT)
+        except grpc.aio.AioRpcError as e:
+            raise XrayApiError(f"{method}: {e.code().name} {e.details()}") from e
+
+    async def _alter_inbound(self, tag, operation_type, operation):
+        # AlterInboundRequest { string tag = 1; TypedMessage operation = 2; }
+        request = _field_bytes(1, tag) + _field_bytes(2, _typed_message(operation_type, operation))
+        await self._call(HANDLER_ALTER_INBOUND, request)
+
+    async def add_vless_user(self, tag, uuid, email, flow="", level=0):
+        # AddUserOperation { User user = 1; }
+        operation = _field_bytes(1, encode_vless_user(uuid, email, flow, level))
+        try:
+            await self._alter_inbound(tag, ADD_USER_OPERATION, operation)
+        except XrayApiError as e:
+            if "already exists" not in str(e):
+                raise
+        logger.info(f"Клиент {email} добавлен в inbound {tag} через API Xray")
+
+    async def remove_user(self, tag, email):
+        # RemoveUserOperation { string email = 1; }
+        operation = _field_bytes(1, email)
+        try:
+            await self._alter_inbound(tag, REMOVE_USER_OPERATION, operation)
+        except XrayApiError as e:
+            if "not found" not in str(e):
+                raise
+        logger.info(f"Клиент {email} удалён из inbound {tag} через API Xray")
+
+    async def query_stats(self, pattern="", reset=False):
+        """Все счётчики StatsService по шаблону одним вызовом: {имя: значение}"""
+        # QueryStatsRequest { string pattern = 1; bool reset = 2; }
+        request = _field_bytes(1, pattern) + _field_varint(2, int(reset))
+        response = await self._call(STATS_QUERY, request)
+        stats = {}
+        # QueryStatsResponse { repeated Stat stat = 1; }, Stat { string name = 1; int64 value = 2; }
+        for number, stat in _iter_fields(response):
+            if number != 1:
+                continue
+            name, value = "", 0
+            for field, field_value in _iter_fields(stat):
+                if field == 1:
+                    name = field_value.decode()
+                elif field == 2:
+                    value = field_value
+            stats[name] = value
+        return stats
+
+    async def close(self):
+        if self._channel is not None:
+            await self._channel.close()
+            self._channel = None
+
+
+xray_api = XrayApi()
@@ -0,0 +1,35 @@
+import logging
+import os
+import time
+
+from app.core.metrics import XRAY_RESTART_FAILURES, XRAY_RESTART_SECONDS
+from app.services.docker_client import docker, tcp_accepting
+from app.services.xray_api import XRAY_API_ADDRESS
+
+XRAY_CONTAINER_NAME = "xray"
+# Порт, по которому судим, что Xray снова принимает соединения (по умолчанию gRPC API)
+XRAY_READY_ADDRESS = os.getenv("XRAY_READY_ADDRESS", XRAY_API_ADDRESS)
+
+logger = logging.getLogger("xray_control")
+
+
+async def restart_xray():
+    """Перезапуск контейнера Xray через Docker Engine API; возвращается, когда Xray снова готов"""
+    started = time.perf_counter()
+    try:
+        logger.info(f"Перезапуск контейнера {XRAY_CONTAINER_NAME}")
+        # Ждать порт после перезапуска имеет смысл, только если он был открыт до него
+        probe = XRAY_READY_ADDRESS if XRAY_READY_ADDRESS and await tcp_accepting(XRAY_READY_ADDRESS) else None
+        await docker.restart(XRAY_CONTAINER_NAME)
+        try:
+            await docker.wait_ready(XRAY_CONTAINER_NAME, probe)
+        except TimeoutError as e:
+            logger.warning(f"Контейнер {XRAY_CONTAINER_NAME} перезапущен, но готовность не подтверждена: {e}")
+        else:
+            logger.info(f"Контейнер {XRAY_CONTAINER_NAME} перезапущен")
+    except Exception as e:
+        XRAY_RESTART_FAILURES.inc()
+        logger.error(f"Ошибка перезапуска Xray: {e}")
+        raise
+    finally:
+        XRAY_RESTART_SECONDS.observe(time.perf_counter() - started)
@@ -0,0 +1,36 @@
+import errno
+import os
+import tempfile
+
+
+def atomic_write(path, data):
+    """Записывает файл через временный файл и rename, чтобы читатели не видели его наполовину записанным.
+
+    Файл, смонтированный в контейнер по отдельности (bind mount), заменить через rename нельзя (EBUSY) —
+    тогда пишем поверх на месте.
+    """
+    path = os.fspath(path)
+    if isinstance(data, str):
+        data = data.encode()
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if e.errno not in (errno.EBUSY, errno.EXDEV, errno.EACCES, errno.EPERM):
+            raise
+        with open(path, "r+b") as f:
+            f.write(data)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
@@ -1 +1,10 @@
-# Здесь может быть логика для хеширования паролей
\ No newline at end of file
+from passlib.hash import apr_md5_crypt
+
+
+def hash_htpasswd(password: str) -> str:
+    """Хеш пароля в формате htpasswd -m ($apr1$), который понимает basic_ncsa_auth Squid"""
+    return apr_md5_crypt.hash(password)
+
+
+def verify_htpasswd(password: str, hashed: str) -> bool:
+    return apr_md5_crypt.verify(password, hashed)
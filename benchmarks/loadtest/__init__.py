@@ -0,0 +1,10 @@
+"""Нагрузочный стенд: сервис целиком на ноутбуке, без Docker, Xray и центрального коллектора.
+
+Запуск из корня репозитория:
+    python -m benchmarks.loadtest [--rate 2000] [--duration 30] [--users 200] [--workers 1]
+
+Поднимает подставные коллектор (HTTP) и Docker Engine API (unix-сокет), запускает uvicorn с
+app.main:app во временном каталоге, пишет синтетические access.log Xray и Squid с ротацией и
+одновременно гоняет создание/удаление пользователей. В конце — пропускная способность,
+p50/p99 задержки эндпоинтов и доставки строк в коллектор, отставание парсера по /metrics.
+"""
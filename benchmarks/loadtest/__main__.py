@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+from benchmarks.loadtest import __doc__ as DOC
+from benchmarks.loadtest.collector import FakeCollector
+from benchmarks.loadtest.driver import ProvisioningDriver, percentile
+from benchmarks.loadtest.fake_docker import FakeDocker
+from benchmarks.loadtest.loggen import LogGenerator
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+SAMPLE_CONFIG = REPO_ROOT / "xray" / "config.json"
+STARTUP_TIMEOUT = 30
+SCRAPE_INTERVAL = 1
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare_workdir(root):
+    for directory in ("logs/xray", "logs/squid", "state", "spool"):
+        (root / directory).mkdir(parents=True, exist_ok=True)
+    for log in ("logs/xray/access.log", "logs/squid/access.log", "passwd"):
+        (root / log).touch()
+    shutil.copy(SAMPLE_CONFIG, root / "config.json")
+
+
+def app_env(root, collector_url, docker_socket):
+    return {
+        **os.environ,
+        "PYTHONUNBUFFERED": "1",
+        "XRAY_CONFIG_PATH": str(root / "config.json"),
+        "XRAY_LOG_PATH": str(root / "logs/xray/access.log"),
+        "SQUID_LOG_PATH": str(root / "logs/squid/access.log"),
+        "SQUID_PASSWD_FILE": str(root / "passwd"),
+        "TAILER_STATE_DIR": str(root / "state"),
+        "LOG_SPOOL_DIR": str(root / "spool"),
+        "DEST_RULES_PATH": str(root / "destination_rules.conf"),
+        "CENTRAL_LOG_SERVER": collector_url,
+        "SERVER_PUBLIC_IP": "203.0.113.1",
+        "DOCKER_SOCKET": docker_socket,
+        # gRPC API Xray нет: изменения применяются перезапуском через подставной Docker
+        "XRAY_API_ADDRESS": f"127.0.0.1:{free_port()}",
+        "XRAY_READY_ADDRESS": "",
+        "BACKFILL_ROOT": str(root / "logs"),
+    }
+
+
+async def wait_ready(session, base_url, process):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.returncode is not None:
+            raise RuntimeError(f"Сервис завершился с кодом {process.returncode}")
+        try:
+            async with session.get(f"{base_url}/api/v1/vless/count") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Сервис не поднялся за отведённое время")
+
+
+def parse_metrics(text):
+    """Текст Prometheus -> {'имя{метки}': значение}"""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            try:
+                values[name] = float(value)
+            except ValueError:
+                pass
+    return values
+
+
+class MetricsScraper:
+    def __init__(self, base_url):
+        self.url = f"{base_url}/metrics/"
+        self.lag_seconds = []
+        self.lag_bytes = []
+        self.last = {}
+
+    async def scrape(self, session):
+        async with session.get(self.url) as resp:
+            self.last = parse_metrics(await resp.text())
+        self.lag_seconds.append(self.last.get('log_tail_lag_seconds{source="xray"}', 0))
+        self.lag_bytes.append(self.last.get('log_tail_lag_bytes{source="xray"}', 0))
+
+    async def run(self, session, stop):
+        while not stop.is_set():
+            try:
+                await self.scrape(session)
+            except aiohttp.ClientError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), SCRAPE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def drain(collector, expected, timeout):
+    """Ждёт, пока коллектор получит все строки или поток записей остановится на timeout секунд"""
+    started = time.monotonic()
+    while collector.records < expected:
+        last = collector.last_received or started
+        if time.time() - last > timeout and time.monotonic() - started > timeout:
+            break
+        await asyncio.sleep(0.2)
+    return time.monotonic() - started
+
+
+async def run(args):
+    root = Path(tempfile.mkdtemp(prefix="xray-loadtest-"))
+    prepare_workdir(root)
+    collector = FakeCollector(delay=args.collector_delay, fail_ratio=args.collector_fail)
+    docker = FakeDocker(str(root / "docker.sock"), restart_delay=args.restart_delay)
+    collector_url = await collector.start()
+    await docker.start()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers), "--log-level", "warning",
+        cwd=REPO_ROOT, env=app_env(root, collector_url, str(root / "docker.sock")),
+        stdout=open(root / "app.log", "wb"), stderr=asyncio.subprocess.STDOUT,
+    )
+    report = {"workdir": str(root)}
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            await wait_ready(session, base_url, process)
+            generator = LogGenerator(
+                str(root / "logs/xray/access.log"), str(root / "logs/squid/access.log"), args.rate,
+                squid_ratio=args.squid_ratio, rotate_every=args.rotate_every,
+            )
+            driver = ProvisioningDriver(
+                base_url, users=args.users, concurrency=args.concurrency, wait=args.wait
+            )
+            scraper = MetricsScraper(base_url)
+            stop = asyncio.Event()
+            scrape_task = asyncio.create_task(scraper.run(session, stop))
+
+            started = time.monotonic()
+            written, provisioning = await asyncio.gather(generator.run(args.duration), driver.run())
+            generated_for = time.monotonic() - started
+            drain_seconds = await drain(collector, written, args.drain_timeout)
+            stop.set()
+            await scrape_task
+            await scraper.scrape(session)
+
+        metrics = scraper.last
+        hits = metrics.get('squid_correlation_lookups_total{result="hit"}', 0)
+        misses = metrics.get('squid_correlation_lookups_total{result="miss"}', 0)
+        report.update({
+            "log_pipeline": {
+                "lines_written": written,
+                "write_rate": round(written / generated_for),
+                "rotations": generator.rotations,
+                "records_received": collector.records,
+                "duplicates": collector.duplicates,
+                "batches": collector.batches,
+                "injected_failures": collector.failed,
+                "drain_seconds": round(drain_seconds, 2),
+                "throughput": round(collector.records / (generated_for + drain_seconds)),
+                "delivery_p50_ms": _ms(percentile(collector.latencies, 50)),
+                "delivery_p99_ms": _ms(percentile(collector.latencies, 99)),
+                "tail_lag_p99_s": percentile(scraper.lag_seconds, 99),
+                "tail_lag_max_s": max(scraper.lag_seconds, default=None),
+                "tail_lag_max_bytes": max(scraper.lag_bytes, default=None),
+                "squid_hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+            },
+            "provisioning": provisioning,
+            "xray_restarts": docker.restarts,
+        })
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), 30)
+            except asyncio.TimeoutError:
+                process.kill()
+        await collector.close()
+        await docker.close()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+            report.pop("workdir")
+    return report
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=DOC.splitlines()[0])
+    parser.add_argument("--rate", type=int, default=2000, help="строк access.log в секунду")
+    parser.add_argument("--duration", type=float, default=30, help="секунд записи логов")
+    parser.add_argument("--rotate-every", type=float, default=10, help="секунд между ротациями, 0 — без ротации")
+    parser.add_argument("--squid-ratio", type=float, default=0.9, help="доля подключений со строкой Squid")
+    parser.add_argument("--users", type=int, default=200, help="пользователей создать и удалить")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных запросов к API")
+    parser.add_argument("--wait", action="store_true", help="эндпоинты ждут перезапуска Xray (wait=true)")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--collector-delay", type=float, default=0, help="секунд задержки ответа коллектора")
+    parser.add_argument("--collector-fail", type=float, default=0, help="доля ответов коллектора 503")
+    parser.add_argument("--restart-delay", type=float, default=0.5, help="секунд на перезапуск Xray")
+    parser.add_argument("--drain-timeout", type=float, default=15, help="секунд ждать досылки после записи")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочий каталог (логи сервиса в app.log)")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
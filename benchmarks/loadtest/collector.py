@@ -0,0 +1,74 @@
+"""Подставной центральный коллектор: принимает пачки записей, умеет тормозить и отвечать ошибками"""
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+
+from aiohttp import web
+
+
+def line_time(raw_log):
+    """Время строки Xray с микросекундами из raw_log: '2025/06/15 12:34:56.123456 from ...'"""
+    try:
+        return datetime.strptime(raw_log[:26], "%Y/%m/%d %H:%M:%S.%f").timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class FakeCollector:
+    def __init__(self, delay=0.0, fail_ratio=0.0, seed=1):
+        self.delay = delay
+        self.fail_ratio = fail_ratio
+        self.random = random.Random(seed)
+        self.records = 0
+        self.batches = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.accepted = 0  # записей со status=accepted (нашлась строка Squid)
+        self.latencies = []  # секунд от записи строки в лог до приёма коллектором
+        self.last_received = None
+        self._keys = set()
+        self._runner = None
+        self.url = None
+
+    async def handle(self, request):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail_ratio and self.random.random() < self.fail_ratio:
+            self.failed += 1
+            return web.json_response({"detail": "injected failure"}, status=503)
+        batch = json.loads(await request.read())
+        if isinstance(batch, dict):
+            batch = [batch]
+        now = time.time()
+        self.batches += 1
+        for record in batch:
+            key = record.get("idempotency_key")
+            if key in self._keys:
+                self.duplicates += 1
+                continue
+            self._keys.add(key)
+            self.records += 1
+            if record.get("status") == "accepted":
+                self.accepted += 1
+            written = line_time(record.get("raw_log"))
+            if written is not None:
+                self.latencies.append(now - written)
+        self.last_received = now
+        return web.json_response({"received": len(batch)})
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/{tail:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/proxylogs/receive-log/"
+        return self.url
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
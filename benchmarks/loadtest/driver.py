@@ -0,0 +1,98 @@
+"""Нагрузка на эндпоинты выдачи доступа: параллельные create/delete для /vless и /cascade"""
+import asyncio
+import time
+import uuid
+
+import aiohttp
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.first = None
+        self.last = None
+
+    def add(self, started, finished, ok):
+        self.first = started if self.first is None else min(self.first, started)
+        self.last = finished if self.last is None else max(self.last, finished)
+        if ok:
+            self.latencies.append(finished - started)
+        else:
+            self.errors += 1
+
+    def summary(self):
+        span = (self.last - self.first) if self.first is not None else 0
+        count = len(self.latencies)
+        return {
+            "ok": count,
+            "errors": self.errors,
+            "rps": count / span if span else None,
+            "p50_ms": _ms(percentile(self.latencies, 50)),
+            "p99_ms": _ms(percentile(self.latencies, 99)),
+            "max_ms": _ms(max(self.latencies) if self.latencies else None),
+        }
+
+
+class ProvisioningDriver:
+    """Каждый виртуальный клиент создаёт пользователя и удаляет его; concurrency клиентов одновременно.
+
+    wait=False — эндпоинты не ждут перезапуска Xray (режим, в котором работает панель).
+    """
+
+    def __init__(self, base_url, users=200, concurrency=16, cascade_ratio=0.25, wait=False,
+                 server2_ip="192.0.2.10", server2_port=8443):
+        self.base_url = base_url.rstrip("/")
+        self.users = users
+        self.concurrency = concurrency
+        self.cascade_ratio = cascade_ratio
+        self.wait = wait
+        self.server2 = {"server2_ip": server2_ip, "server2_port": server2_port}
+        self.stats = {}
+
+    async def _call(self, session, name, method, path, payload):
+        started = time.perf_counter()
+        ok = False
+        try:
+            async with session.request(
+                method, f"{self.base_url}/api/v1{path}", json=payload,
+                params={"wait": "true" if self.wait else "false"},
+            ) as resp:
+                body = await resp.json(content_type=None)
+                ok = resp.status == 200 and body.get("success", False)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            pass
+        self.stats.setdefault(name, EndpointStats()).add(started, time.perf_counter(), ok)
+        return ok
+
+    async def _user(self, session, index):
+        uid = str(uuid.uuid4())
+        cascade = index < self.users * self.cascade_ratio
+        path, extra = ("/cascade", self.server2) if cascade else ("/vless", {})
+        name = path.strip("/")
+        if await self._call(session, f"POST {name}", "POST", path, {"uuid": uid, **extra}):
+            await self._call(session, f"DELETE {name}", "DELETE", path, {"uuid": uid, **extra})
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=120)
+
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async def bounded(index):
+                async with semaphore:
+                    await self._user(session, index)
+
+            await asyncio.gather(*(bounded(index) for index in range(self.users)))
+        return {name: stats.summary() for name, stats in sorted(self.stats.items())}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
@@ -0,0 +1,73 @@
+"""Подставной Docker Engine API на unix-сокете: restart/kill/inspect/logs контейнера xray"""
+import asyncio
+import struct
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+
+class FakeDocker:
+    def __init__(self, socket_path, restart_delay=0.5, containers=("xray",)):
+        self.socket_path = socket_path
+        self.restart_delay = restart_delay
+        self.containers = {name: {"restarts": 0, "started_at": _now()} for name in containers}
+        self.restarts = 0
+        self.signals = 0
+        self._runner = None
+
+    def _container(self, request):
+        container = self.containers.get(request.match_info["name"])
+        if container is None:
+            raise web.HTTPNotFound(
+                text='{"message": "No such container"}', content_type="application/json"
+            )
+        return container
+
+    async def restart(self, request):
+        container = self._container(request)
+        await asyncio.sleep(self.restart_delay)
+        container["restarts"] += 1
+        container["started_at"] = _now()
+        self.restarts += 1
+        return web.Response(status=204)
+
+    async def kill(self, request):
+        self._container(request)
+        self.signals += 1
+        return web.Response(status=204)
+
+    async def inspect(self, request):
+        container = self._container(request)
+        return web.json_response({
+            "Name": f"/{request.match_info['name']}",
+            "RestartCount": container["restarts"],
+            "State": {"Status": "running", "Running": True, "StartedAt": container["started_at"]},
+            "Config": {"Image": "teddysun/xray", "Tty": False},
+        })
+
+    async def logs(self, request):
+        self._container(request)
+        response = web.StreamResponse(headers={"Content-Type": "application/vnd.docker.raw-stream"})
+        await response.prepare(request)
+        for line in (b"Xray 1.8.24 (Xray, Penetrates Everything.)\n", b"[Warning] core: Xray started\n"):
+            await response.write(struct.pack(">BxxxI", 1, len(line)) + line)
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/containers/{name}/restart", self.restart)
+        app.router.add_post("/containers/{name}/kill", self.kill)
+        app.router.add_get("/containers/{name}/json", self.inspect)
+        app.router.add_get("/containers/{name}/logs", self.logs)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.UnixSite(self._runner, self.socket_path).start()
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
@@ -0,0 +1,102 @@
+"""Генератор access.log Xray и Squid в боевых форматах с заданной скоростью и ротацией"""
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+
+TICK = 0.01  # секунд между пачками записи
+DESTINATIONS = [
+    "www.google.com", "api.telegram.org", "www.youtube.com", "rr3---sn-4g5e6nzs.googlevideo.com",
+    "graph.facebook.com", "www.cloudflare.com", "api.github.com", "cdn.jsdelivr.net",
+    "telemetry.example.com", "mail.yandex.ru", "www.wikipedia.org", "discord.com",
+]
+
+
+class LogGenerator:
+    """Пишет пары строк: сначала Squid (как прокси второго шага), затем Xray.
+
+    squid_ratio — доля подключений, для которых есть строка Squid (остальные уйдут как failed).
+    rotate_every — секунд между ротациями (rename + новый файл, как logrotate без copytruncate).
+    """
+
+    def __init__(self, xray_path, squid_path, rate, users=200, squid_ratio=0.9, rotate_every=0, seed=1):
+        self.xray_path = xray_path
+        self.squid_path = squid_path
+        self.rate = rate
+        self.squid_ratio = squid_ratio
+        self.rotate_every = rotate_every
+        self.random = random.Random(seed)
+        self.users = [str(uuid.UUID(int=self.random.getrandbits(128), version=4)) for _ in range(users)]
+        self.clients = [f"10.{self.random.randrange(256)}.{self.random.randrange(256)}.{i % 250 + 1}" for i in range(users)]
+        self.written = 0
+        self.rotations = 0
+        self._xray = None
+        self._squid = None
+
+    def _open(self):
+        self._xray = open(self.xray_path, "a", buffering=1 << 16)
+        self._squid = open(self.squid_path, "a", buffering=1 << 16)
+
+    def _close(self):
+        for f in (self._xray, self._squid):
+            if f:
+                f.close()
+
+    def rotate(self):
+        self._close()
+        for path in (self.xray_path, self.squid_path):
+            os.replace(path, f"{path}.1")
+        self._open()
+        self.rotations += 1
+
+    def lines(self, now):
+        """Строка Xray и (если есть) строка Squid для одного подключения в момент now"""
+        i = self.random.randrange(len(self.users))
+        user, client = self.users[i], self.clients[i]
+        destination = self.random.choice(DESTINATIONS)
+        stamp = datetime.fromtimestamp(now).strftime("%Y/%m/%d %H:%M:%S.%f")
+        xray = (
+            f"{stamp} from {client}:{self.random.randrange(20000, 65000)} accepted tcp:{destination}:443 "
+            f"[reality-vless >> direct] email: {user}\n"
+        )
+        squid = None
+        if self.random.random() < self.squid_ratio:
+            squid = (
+                f'{now:.3f} {client} 104.16.1.1 {user} CONNECT {destination}:443 200 '
+                f'{self.random.randrange(500, 200000)} TCP_TUNNEL/200 "Mozilla/5.0 (X11; Linux x86_64)" '
+                f'"{destination}:443"\n'
+            )
+        return xray, squid
+
+    async def run(self, duration):
+        """Пишет rate строк/с в течение duration секунд; возвращает число строк Xray"""
+        self._open()
+        started = last_rotation = time.monotonic()
+        try:
+            while True:
+                elapsed = time.monotonic() - started
+                if elapsed >= duration:
+                    break
+                due = int(elapsed * self.rate) - self.written
+                if due > 0:
+                    now = time.time()
+                    xray_lines, squid_lines = [], []
+                    for _ in range(due):
+                        xray, squid = self.lines(now)
+                        xray_lines.append(xray)
+                        if squid:
+                            squid_lines.append(squid)
+                    self._squid.write("".join(squid_lines))
+                    self._squid.flush()
+                    self._xray.write("".join(xray_lines))
+                    self._xray.flush()
+                    self.written += due
+                if self.rotate_every and time.monotonic() - last_rotation >= self.rotate_every:
+                    self.rotate()
+                    last_rotation = time.monotonic()
+                await asyncio.sleep(TICK)
+        finally:
+            self._close()
+        return self.written
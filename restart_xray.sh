@@ -1,3 +1,7 @@
 #!/bin/bash
-echo "[+] Перезапускаем Xray через systemctl..."
-sudo systemctl restart xray
+# Перезапуск контейнера Xray через Docker Engine API на смонтированном сокете
+CONTAINER="${XRAY_CONTAINER_NAME:-xray}"
+SOCKET="${DOCKER_SOCKET:-/var/run/docker.sock}"
+echo "[+] Перезапускаем ${CONTAINER} через Docker API..."
+curl -sf --unix-socket "$SOCKET" -X POST "http://docker/containers/${CONTAINER}/restart?t=10" \
+    && echo "[+] Готово" || { echo "[-] Не удалось перезапустить ${CONTAINER}"; exit 1; }
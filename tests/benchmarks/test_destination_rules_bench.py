@@ -0,0 +1,93 @@
+"""Замер правил назначения: компиляция и поиск при десятках тысяч правил (pytest-benchmark).
+
+Запуск из корня репозитория:
+    python -m pytest tests/benchmarks -m benchmark --benchmark-group-by=group
+
+Назначения берутся из пула уникальных адресов: в реальном access.log они сильно повторяются,
+и на этом держится кеш решений RuleSet.match.
+"""
+import random
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.services.destination_rules import _looks_like_ip, compile_rules  # noqa: E402
+
+RULES = 50000
+DESTINATIONS = 100000
+UNIQUE = 20000
+
+
+def make_rules(count):
+    rules = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            rules.append(f"drop .t{i}.example{i % 500}.com")
+        elif kind == 1:
+            rules.append(f"sample:10 *.cdn{i}.net")
+        elif kind == 2:
+            rules.append(f"keep host{i}.service{i % 50}.org")
+        else:
+            rules.append(f"drop 10.{i % 256}.{i // 256 % 256}.0/24")
+    return "\n".join(rules)
+
+
+def make_destinations(count, unique, rules):
+    rnd = random.Random(1)
+    pool = []
+    for _ in range(unique):
+        i = rnd.randrange(rules)
+        choice = rnd.randrange(5)
+        if choice == 0:
+            pool.append(f"api.t{i}.example{i % 500}.com")
+        elif choice == 1:
+            pool.append(f"edge{i}.cdn{i}.net")
+        elif choice == 2:
+            pool.append(f"10.{i % 256}.{rnd.randrange(256)}.{rnd.randrange(256)}")
+        else:
+            pool.append(f"www.site{i}.example.org")
+    return [rnd.choice(pool) for _ in range(count)]
+
+
+@pytest.fixture(scope="module")
+def rules_text():
+    return make_rules(RULES)
+
+
+@pytest.fixture(scope="module")
+def ruleset(rules_text):
+    return compile_rules(rules_text)
+
+
+@pytest.fixture(scope="module")
+def destinations():
+    return make_destinations(DESTINATIONS, UNIQUE, RULES)
+
+
+def match_all(match, destinations):
+    return sum(match(destination) is not None for destination in destinations)
+
+
+@pytest.mark.benchmark(group="destination_rules")
+def test_compile(benchmark, rules_text):
+    ruleset = benchmark.pedantic(compile_rules, args=(rules_text,), rounds=3)
+    assert len(ruleset.rules) == RULES
+
+
+@pytest.mark.benchmark(group="destination_rules")
+def test_match_uncached(benchmark, ruleset, destinations):
+    def uncached(destination):
+        return ruleset._match_ip(destination) if _looks_like_ip(destination) else ruleset._match_domain(destination)
+
+    matched = benchmark(match_all, uncached, destinations)
+    assert 0 < matched < len(destinations)
+
+
+@pytest.mark.benchmark(group="destination_rules")
+def test_match_cached(benchmark, ruleset, destinations):
+    matched = benchmark(match_all, ruleset.match, destinations)
+    # Кеш решений не меняет ответов
+    assert matched == match_all(lambda d: ruleset._match_ip(d) if _looks_like_ip(d) else ruleset._match_domain(d),
+                                destinations)
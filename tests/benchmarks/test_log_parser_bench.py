@@ -0,0 +1,82 @@
+"""Замер скорости разбора access.log Xray и Squid (pytest-benchmark).
+
+Запуск из корня репозитория:
+    python -m pytest tests/benchmarks -m benchmark --benchmark-group-by=group
+
+Squid берётся из logs/squid/access.log как есть (старый формат) и в пересчёте
+в logformat compact; строки Xray синтезируются из тех же записей, т.к. образец
+logs/xray/access.log пустой. Для сравнения рядом замеряется прежний разбор на re.
+"""
+import re
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.services.log_parser import parse_squid_line, parse_xray_line, parse_xray_time  # noqa: E402
+
+SQUID_SAMPLE = Path(__file__).resolve().parents[2] / "logs" / "squid" / "access.log"
+
+# Старый код для сравнения: литералы в re.match/re.search и strptime на каждую строку
+OLD_SQUID_PATTERN = r"(\d+\.\d+) [^ ]+ [^ ]+ ([^ ]+) ([A-Z]+) ([^ ]+) (\d+) (\d+) "
+OLD_XRAY_PATTERN = (
+    r"(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})\.\d+ from ([\d\.]+):\d+ accepted tcp:([^:]+):\d+ .*email: ([a-f0-9\-]+)"
+)
+
+
+def load_samples():
+    legacy = SQUID_SAMPLE.read_text().splitlines()
+    compact, xray = [], []
+    for line in legacy:
+        ts, client, user, method, url, status = line.split(" ")
+        compact.append(
+            f'{ts} {client} 104.16.1.1 {user} {method} {url} {status} 4821 TCP_TUNNEL/{status} '
+            f'"Mozilla/5.0 (X11; Linux x86_64)" "{url}"'
+        )
+        stamp = datetime.fromtimestamp(float(ts)).strftime("%Y/%m/%d %H:%M:%S")
+        xray.append(
+            f"{stamp}.{ts[-3:]}512 from 91.108.4.12:51234 accepted tcp:{url} "
+            f"[reality-vless >> direct] email: {user}"
+        )
+    return {"squid_legacy": legacy, "squid_compact": compact, "xray": xray}
+
+
+def old_squid(line):
+    match = re.match(OLD_SQUID_PATTERN, line)
+    if match:
+        unix_ts, user, method, url, status, bytes_sent = match.groups()
+        float(unix_ts), user.split("@")[0], url.split(":")[0], int(bytes_sent)
+    return match
+
+
+def old_xray(line):
+    match = re.search(OLD_XRAY_PATTERN, line)
+    if match:
+        datetime.strptime(match.group(1), "%Y/%m/%d %H:%M:%S")
+    return match
+
+
+def parse_all(parse, lines):
+    return sum(1 for line in lines if parse(line) is not None)
+
+
+@pytest.fixture(scope="module")
+def samples():
+    return load_samples()
+
+
+@pytest.mark.benchmark(group="log_parser")
+@pytest.mark.parametrize("sample, parse", [
+    ("squid_legacy", parse_squid_line),
+    ("squid_compact", parse_squid_line),
+    ("squid_compact", old_squid),
+    ("xray", parse_xray_line),
+    ("xray", old_xray),
+], ids=["squid-legacy", "squid-compact", "squid-compact-old-re", "xray", "xray-old-re-strptime"])
+def test_parse(benchmark, samples, sample, parse):
+    lines = samples[sample]
+    parse_xray_time.cache_clear()
+    parsed = benchmark(parse_all, parse, lines)
+    assert parsed == len(lines)
@@ -0,0 +1,82 @@
+import asyncio
+import gzip
+import os
+from datetime import datetime
+
+import httpx
+from fastapi import FastAPI
+
+from app.api.v1 import backfill as backfill_api
+from app.services import backfill
+from app.services.backfill import BackfillJob, squid_span
+
+USER = "74b741f9-ea44-4f16-8599-90bcc31ae3cc"
+START = 1750012000  # 2025-06-15 18:26:40 UTC
+
+
+def xray_line(ts, host):
+    stamp = datetime.fromtimestamp(ts).strftime("%Y/%m/%d %H:%M:%S")
+    return f"{stamp}.123456 from 91.108.4.12:51234 accepted tcp:{host}:443 [reality-vless >> direct] email: {USER}\n"
+
+
+def squid_line(ts, host, status=200):
+    return f"{ts:.3f} 127.0.0.1 {USER} CONNECT {host}:443 {status}\n"
+
+
+def test_squid_span_of_gz_reads_only_the_head(tmp_path, monkeypatch):
+    path = tmp_path / "access.log.1.gz"
+    with gzip.open(path, "wt") as f:
+        f.write("мусор\n" + "".join(squid_line(START + i, "a.example") for i in range(1000)))
+    read = []
+    iter_lines = backfill.iter_lines
+
+    def counting_iter_lines(*args):
+        for line in iter_lines(*args):
+            read.append(line)
+            yield line
+
+    monkeypatch.setattr(backfill, "iter_lines", counting_iter_lines)
+    assert squid_span(str(path)) == (str(path), START, None)
+    assert len(read) == 2
+
+    plain = tmp_path / "access.log"
+    plain.write_text("".join(squid_line(START + i, "a.example") for i in range(10)))
+    assert squid_span(str(plain)) == (str(plain), START, START + 9)
+
+
+def test_backfill_matches_xray_with_squid_from_plain_and_gz(tmp_path):
+    xray_path = tmp_path / "access.log.1"
+    xray_path.write_text("".join(xray_line(START + i, f"h{i % 5}.example") for i in range(200)))
+    # Первая половина Squid — в ротированном .gz, вторая — в текущем файле
+    with gzip.open(tmp_path / "squid.log.1.gz", "wt") as f:
+        f.write("".join(squid_line(START + i, f"h{i % 5}.example") for i in range(100)))
+    (tmp_path / "squid.log").write_text("".join(squid_line(START + i, f"h{i % 5}.example") for i in range(100, 150)))
+
+    job = BackfillJob(
+        [str(xray_path)], [str(tmp_path / "squid.log*")], workers=2,
+        work_dir=str(tmp_path / "work"), spool_dir=str(tmp_path / "spool"),
+    )
+    status = asyncio.run(job.run())
+    assert status["state"] == "done", status["error"]
+    assert (status["lines"], status["records"]) == (200, 200)
+    # Пара находится для записей в пределах MATCH_WINDOW (10 с) от последней строки Squid: 150 + 10
+    assert status["matched"] == 160
+    assert not os.path.exists(job.work_dir)
+
+
+def test_backfill_workers_are_bounded(tmp_path):
+    job = BackfillJob([], workers=10_000, work_dir=str(tmp_path))
+    assert job.workers == (os.cpu_count() or 1)
+
+    app = FastAPI()
+    app.include_router(backfill_api.router, prefix="/api/v1")
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for workers in (0, (os.cpu_count() or 1) + 1):
+                resp = await client.post("/api/v1/backfill", json={"workers": workers, "dry_run": True})
+                assert resp.status_code == 422
+
+    asyncio.run(main())
+    assert backfill_api.BackfillRequest(workers=1).workers == 1
+
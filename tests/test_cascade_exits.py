@@ -0,0 +1,157 @@
+import asyncio
+import json
+import socket
+
+import pytest
+
+from app.services import cascade_exits
+from app.services.cascade_exits import BALANCER_TAG, CascadeExitPool, apply_balancer
+from app.services.config_store import XrayConfigStore
+
+UUID = "22222222-2222-4222-8222-222222222222"
+CASCADE_CONFIG = {
+    "inbounds": [{"tag": "vless-cascade", "port": 10443, "protocol": "vless", "settings": {"clients": []}}],
+    "outbounds": [{"protocol": "freedom", "tag": "direct"}, {"protocol": "vless", "tag": "cascade-to-server2"}],
+    "routing": {"rules": [{"type": "field", "inboundTag": ["vless-cascade"], "outboundTag": "cascade-to-server2"}]},
+}
+
+
+def closed_port():
+    """Порт, на котором заведомо никто не слушает"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start_listener():
+    """Локальный exit: принимает TCP-подключение и сразу закрывает его"""
+
+    async def handle(reader, writer):
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def make_pool(tmp_path, monkeypatch):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(CASCADE_CONFIG))
+    reloads = []
+
+    async def schedule_reload(wait=True):
+        reloads.append(wait)
+        return False
+
+    monkeypatch.setattr(cascade_exits, "config_store", XrayConfigStore(config_path))
+    monkeypatch.setattr(cascade_exits, "schedule_reload", schedule_reload)
+    return CascadeExitPool(path=str(tmp_path / "cascade_exits.json")), config_path, reloads
+
+
+def selected(config, prefix):
+    """Теги outbound, которые Xray выберет по префиксу из selector"""
+    return [outbound["tag"] for outbound in config["outbounds"] if outbound["tag"].startswith(prefix)]
+
+
+def test_exit_ewma_and_health():
+    exit_server = cascade_exits.ExitServer("exit-a", "127.0.0.1")
+    assert not exit_server.healthy
+    exit_server.record(10)
+    exit_server.record(20)
+    assert exit_server.ewma == pytest.approx(13.0)
+    assert exit_server.healthy
+    for _ in range(cascade_exits.UNHEALTHY_AFTER):
+        exit_server.record(None, "timeout")
+    assert not exit_server.healthy
+    # Успешная проба сбрасывает серию отказов, EWMA продолжает копиться
+    exit_server.record(10)
+    assert exit_server.healthy and exit_server.failures == 0
+    assert exit_server.ewma == pytest.approx(12.1)
+
+
+def test_probe_all_against_local_listeners(tmp_path, monkeypatch):
+    pool, _, _ = make_pool(tmp_path, monkeypatch)
+
+    async def main():
+        server, port = await start_listener()
+        try:
+            pool.upsert(name="live", address="127.0.0.1", port=port, uuid=UUID)
+            pool.upsert(name="dead", address="127.0.0.1", port=closed_port(), uuid=UUID)
+            for _ in range(cascade_exits.UNHEALTHY_AFTER):
+                await pool.probe_all()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(main())
+    live, dead = pool.exits["live"], pool.exits["dead"]
+    assert live.healthy and live.ewma is not None and len(live.samples) == cascade_exits.UNHEALTHY_AFTER
+    assert not dead.healthy and dead.failures == cascade_exits.UNHEALTHY_AFTER
+    assert dead.last_error.startswith("ConnectionRefusedError")
+    assert pool.ranking() == ["live"]
+    stats = {item["name"]: item for item in pool.status()["exits"]}
+    assert stats["live"]["success_ratio"] == 1.0 and stats["dead"]["success_ratio"] == 0.0
+
+
+def test_rebalance_writes_balancer_and_removes_it(tmp_path, monkeypatch):
+    pool, config_path, reloads = make_pool(tmp_path, monkeypatch)
+
+    async def main():
+        servers = [await start_listener() for _ in range(2)]
+        try:
+            for name, (_, port) in zip(["slow", "fast"], servers):
+                pool.upsert(name=name, address="127.0.0.1", port=port, uuid=UUID)
+            await pool.probe_all()
+        finally:
+            for server, _ in servers:
+                server.close()
+                await server.wait_closed()
+        # Задержки до localhost неразличимы — порядок задаём явно
+        pool.exits["slow"].ewma, pool.exits["fast"].ewma = 50.0, 5.0
+        assert await pool.rebalance()
+        assert pool.applied == ["fast", "slow"]
+        # Рейтинг не изменился — конфиг не переписывается
+        assert not await pool.rebalance()
+
+        config = json.loads(config_path.read_text())
+        balancer = config["routing"]["balancers"][0]
+        assert balancer["tag"] == BALANCER_TAG
+        assert balancer["selector"] == [pool.exits["fast"].tag, pool.exits["slow"].tag]
+        assert balancer["fallbackTag"] == pool.exits["fast"].tag
+        assert config["routing"]["rules"][0] == {
+            "type": "field", "inboundTag": ["vless-cascade"], "balancerTag": BALANCER_TAG,
+        }
+        assert {outbound["tag"] for outbound in config["outbounds"]} == {
+            "direct", "cascade-to-server2", pool.exits["fast"].tag, pool.exits["slow"].tag,
+        }
+
+        pool.remove("fast")
+        pool.remove("slow")
+        assert await pool.rebalance()
+
+    asyncio.run(main())
+    config = json.loads(config_path.read_text())
+    assert config == CASCADE_CONFIG
+    assert reloads == [False, False]
+    assert json.loads((tmp_path / "cascade_exits.json").read_text()) == {"exits": [], "applied": []}
+
+
+def test_balancer_selector_does_not_match_exit_with_longer_name():
+    config = json.loads(json.dumps(CASCADE_CONFIG))
+    exits = [
+        cascade_exits.ExitServer(name, "127.0.0.1", uuid=UUID) for name in ["exit-1", "exit-10", "exit-1-eu"]
+    ]
+    apply_balancer(config, exits[:1], exits)
+    balancer = config["routing"]["balancers"][0]
+    assert balancer["selector"] == [exits[0].tag]
+    assert selected(config, balancer["selector"][0]) == [exits[0].tag]
+    # Каждый exit выбирается только своим тегом, а observatory по-прежнему видит весь пул
+    for exit_server in exits:
+        assert selected(config, exit_server.tag) == [exit_server.tag]
+    assert selected(config, config["observatory"]["subjectSelector"][0]) == [exit_server.tag for exit_server in exits]
+
+
+def test_exit_name_with_tag_separator_is_rejected(tmp_path, monkeypatch):
+    pool, _, _ = make_pool(tmp_path, monkeypatch)
+    with pytest.raises(ValueError):
+        pool.upsert(name="exit-1/x", address="127.0.0.1", uuid=UUID)
+    assert pool.exits == {}
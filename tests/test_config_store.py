@@ -0,0 +1,48 @@
+import asyncio
+import json
+import shutil
+from pathlib import Path
+
+from app.services.config_shards import migrate
+from app.services.config_store import ShardedXrayConfigStore
+
+SAMPLE_CONFIG = Path(__file__).resolve().parent.parent / "xray" / "config.json"
+OPERATOR_ROUTING = {"routing": {"rules": [{"type": "field", "domain": ["geosite:ads"], "outboundTag": "block"}]}}
+
+
+def make_confdir(tmp_path):
+    source = tmp_path / "config.json"
+    shutil.copy(SAMPLE_CONFIG, source)
+    directory = tmp_path / "conf.d"
+    migrate(str(source), str(directory))
+    (directory / "20_routing.json").write_text(json.dumps(OPERATOR_ROUTING))
+    return directory
+
+
+def test_sharded_store_leaves_foreign_fragments_alone(tmp_path):
+    directory = make_confdir(tmp_path)
+    store = ShardedXrayConfigStore(directory)
+
+    async def main():
+        async with store.transaction() as config:
+            # Чужой фрагмент не подмешивается в конфиг хранилища
+            assert config["routing"] != OPERATOR_ROUTING["routing"]
+            inbound = config["inbounds"][0]
+            inbound["settings"]["clients"].append({"id": "11111111-1111-4111-8111-111111111111", "email": "new"})
+            await store.save(config, touched=[inbound["tag"]])
+        async with store.transaction() as config:
+            # Перестановка inbounds удаляет устаревшие свои фрагменты, но не чужие
+            config["inbounds"].reverse()
+            await store.save(config)
+
+    asyncio.run(main())
+    assert json.loads((directory / "20_routing.json").read_text()) == OPERATOR_ROUTING
+    assert sorted(path.name for path in directory.iterdir()) == [
+        "00_base.json", "10_inbound_00_api.json", "10_inbound_01_reality-vless.json", "20_routing.json",
+    ]
+
+
+def test_migrate_force_keeps_foreign_fragments(tmp_path):
+    directory = make_confdir(tmp_path)
+    migrate(str(tmp_path / "config.json"), str(directory), force=True)
+    assert (directory / "20_routing.json").exists()
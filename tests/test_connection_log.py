@@ -0,0 +1,110 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from app.services import connection_log
+from app.services.connection_log import ConnectionLogStore, _table_days
+
+USER = "74b741f9-ea44-4f16-8599-90bcc31ae3cc"
+OTHER = "33333333-3333-4333-8333-333333333333"
+
+
+def record(ts, uuid=USER, destination="a.example"):
+    return {"timestamp": ts, "uuid": uuid, "ip": "10.0.0.2", "destination": destination,
+            "status": "accepted", "bytes_sent": 100}
+
+
+def test_records_span_day_tables_and_paginate(tmp_path):
+    store = ConnectionLogStore(str(tmp_path / "connections.db"))
+    for ts in ("2025-06-14T23:59:58", "2025-06-14T23:59:59", "2025-06-15T00:00:00", "2025-06-15T00:00:00",
+               "2025-06-16T12:00:00"):
+        store.submit(record(ts))
+    store.submit(record("2025-06-15T10:00:00", uuid=OTHER, destination="b.example"))
+
+    async def main():
+        await store.flush()
+        pages, cursor = [], None
+        while True:
+            page = await store.query(uuid=USER, cursor=cursor, limit=2)
+            pages.append([item["ts"] for item in page["items"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    pages = asyncio.run(main())
+    assert _table_days(store.engine) == {"20250614", "20250615", "20250616"}
+    # Курсор переходит через границу дня и не теряет записи с одинаковым временем
+    assert pages == [
+        ["2025-06-14T23:59:58", "2025-06-14T23:59:59"],
+        ["2025-06-15T00:00:00", "2025-06-15T00:00:00"],
+        ["2025-06-16T12:00:00"],
+    ]
+    assert store.stats == {"queued": 6, "written": 6, "dropped": 0}
+
+
+def test_query_filters(tmp_path):
+    store = ConnectionLogStore(str(tmp_path / "connections.db"))
+    store.submit(record("2025-06-14T10:00:00"))
+    store.submit(record("2025-06-15T10:00:00", destination="b.example"))
+    store.submit(record("2025-06-15T11:00:00", uuid=OTHER))
+    store.submit(record("2025-06-16T10:00:00"))
+
+    async def main():
+        await store.flush()
+        by_destination = await store.query(destination="b.example")
+        window = await store.query(since=datetime(2025, 6, 15), until=datetime(2025, 6, 16))
+        return by_destination, window
+
+    by_destination, window = asyncio.run(main())
+    assert by_destination == {"items": [{
+        "ts": "2025-06-15T10:00:00", "uuid": USER, "ip": "10.0.0.2", "destination": "b.example",
+        "status": "accepted", "bytes_sent": 100,
+    }], "next_cursor": None}
+    # until не включается
+    assert [(item["ts"], item["uuid"]) for item in window["items"]] == [
+        ("2025-06-15T10:00:00", USER), ("2025-06-15T11:00:00", OTHER),
+    ]
+
+
+def test_reader_sees_tables_of_another_writer_and_retention(tmp_path):
+    path = str(tmp_path / "connections.db")
+    writer, reader = ConnectionLogStore(path, retention_days=7), ConnectionLogStore(path)
+    today = date.today()
+    old = (today - timedelta(days=8)).isoformat() + "T10:00:00"
+    fresh = today.isoformat() + "T10:00:00"
+
+    async def main():
+        # Читатель открыл базу до того, как писатель создал таблицы
+        assert (await reader.query())["items"] == []
+        writer.submit(record(old))
+        writer.submit(record(fresh))
+        await writer.flush()
+        before = await reader.query()
+        await asyncio.to_thread(writer._apply_retention)
+        after = await reader.query()
+        await writer.close()
+        await reader.close()
+        return before, after
+
+    before, after = asyncio.run(main())
+    assert [item["ts"] for item in before["items"]] == [old, fresh]
+    assert [item["ts"] for item in after["items"]] == [fresh]
+
+
+def test_pending_records_are_bounded_and_flushed_on_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(connection_log, "MAX_PENDING", 10)
+    monkeypatch.setattr(connection_log, "FLUSH_BATCH", 4)
+    store = ConnectionLogStore(str(tmp_path / "connections.db"))
+    for i in range(12):
+        store.submit(record(f"2025-06-15T10:00:{i:02d}"))
+    # Переполнение выкидывает самые старые записи пачкой FLUSH_BATCH
+    assert len(store._buffer) == 8
+    assert store.stats["dropped"] == 4
+
+    async def main():
+        await store.start()
+        await store.close()
+        return await store.query()
+
+    items = asyncio.run(main())["items"]
+    assert [item["ts"][-2:] for item in items] == [f"{i:02d}" for i in range(4, 12)]
+    assert store.stats["written"] == 8
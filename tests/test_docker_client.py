@@ -0,0 +1,149 @@
+import asyncio
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+
+from app.services import docker_client, xray_control
+from app.services.docker_client import DockerClient, DockerError
+
+RESTART_SCRIPT = Path(__file__).resolve().parent.parent / "restart_xray.sh"
+
+
+class FakeDockerSocket:
+    """Docker Engine API на unix-сокете: контейнер xray; mode задаёт ответ на restart"""
+
+    def __init__(self, socket_path, mode="ok"):
+        self.socket_path = socket_path
+        self.mode = mode
+        self.restarts = []
+        self.runner = None
+        self.released = asyncio.Event()  # отпускает зависший restart при остановке
+
+    async def restart(self, request):
+        name = request.match_info["name"]
+        if name != "xray":
+            return web.json_response({"message": f"No such container: {name}"}, status=404)
+        if self.mode == "error":
+            return web.json_response({"message": "driver failed programming external connectivity"}, status=500)
+        if self.mode == "hang":
+            await self.released.wait()
+        self.restarts.append(request.query.get("t"))
+        return web.Response(status=204)
+
+    async def inspect(self, request):
+        name = request.match_info["name"]
+        if name != "xray":
+            return web.json_response({"message": f"No such container: {name}"}, status=404)
+        return web.json_response({
+            "Name": "/xray",
+            "RestartCount": len(self.restarts),
+            "State": {"Status": "running", "Running": True, "StartedAt": "2025-06-15T12:00:00Z"},
+            "Config": {"Image": "teddysun/xray", "Tty": False},
+        })
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/containers/{name}/restart", self.restart)
+        app.router.add_get("/containers/{name}/json", self.inspect)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.UnixSite(self.runner, self.socket_path).start()
+
+    async def close(self):
+        self.released.set()
+        await self.runner.cleanup()
+
+
+def run_with_docker(tmp_path, mode, scenario):
+    async def main():
+        fake = FakeDockerSocket(str(tmp_path / "docker.sock"), mode)
+        await fake.start()
+        client = DockerClient(fake.socket_path)
+        try:
+            return await scenario(fake, client)
+        finally:
+            await client.close()
+            await fake.close()
+
+    return asyncio.run(main())
+
+
+def test_restart_success(tmp_path):
+    async def scenario(fake, client):
+        await client.restart("xray", stop_timeout=3)
+        assert fake.restarts == ["3"]
+        state = await client.wait_ready("xray")
+        assert state["running"] and state["restart_count"] == 1
+
+    run_with_docker(tmp_path, "ok", scenario)
+
+
+def test_restart_xray_waits_for_container(tmp_path, monkeypatch):
+    async def scenario(fake, client):
+        monkeypatch.setattr(xray_control, "docker", client)
+        monkeypatch.setattr(xray_control, "XRAY_READY_ADDRESS", "")
+        await xray_control.restart_xray()
+        assert len(fake.restarts) == 1
+
+    run_with_docker(tmp_path, "ok", scenario)
+
+
+def test_restart_unknown_container_is_404(tmp_path):
+    async def scenario(fake, client):
+        with pytest.raises(DockerError) as error:
+            await client.restart("missing")
+        assert error.value.status == 404
+        assert "No such container" in str(error.value)
+
+    run_with_docker(tmp_path, "ok", scenario)
+
+
+def test_restart_server_error(tmp_path):
+    async def scenario(fake, client):
+        with pytest.raises(DockerError) as error:
+            await client.restart("xray")
+        assert error.value.status == 500
+        assert "external connectivity" in str(error.value)
+        assert fake.restarts == []
+
+    run_with_docker(tmp_path, "error", scenario)
+
+
+def test_restart_socket_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(docker_client, "DOCKER_TIMEOUT", 0.2)
+
+    async def scenario(fake, client):
+        with pytest.raises(asyncio.TimeoutError):
+            await client.restart("xray", stop_timeout=0)
+
+    run_with_docker(tmp_path, "hang", scenario)
+
+
+def test_restart_without_socket(tmp_path):
+    async def main():
+        client = DockerClient(str(tmp_path / "missing.sock"))
+        try:
+            with pytest.raises(OSError):
+                await client.restart("xray")
+        finally:
+            await client.close()
+
+    asyncio.run(main())
+
+
+@pytest.mark.skipif(shutil.which("curl") is None, reason="нет curl")
+@pytest.mark.parametrize("container, code", [("xray", 0), ("missing", 1)])
+def test_restart_script(tmp_path, container, code):
+    async def scenario(fake, client):
+        env = {**os.environ, "DOCKER_SOCKET": fake.socket_path, "XRAY_CONTAINER_NAME": container}
+        process = await asyncio.create_subprocess_exec(
+            "bash", str(RESTART_SCRIPT), env=env, stdout=subprocess.DEVNULL,
+        )
+        assert await process.wait() == code
+        assert fake.restarts == (["10"] if code == 0 else [])
+
+    run_with_docker(tmp_path, "ok", scenario)
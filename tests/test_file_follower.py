@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+from app.services import file_follower
+from app.services.file_follower import FileFollower
+
+WHOLE_FILE = 1 << 20  # prime_bytes: без сохранённого смещения читать файл с начала
+
+
+def follower_for(path, **kwargs):
+    return FileFollower(str(path), prime_bytes=kwargs.pop("prime_bytes", WHOLE_FILE), use_inotify=False, **kwargs)
+
+
+def collect(follower, count, on_eof=None):
+    """Собирает count строк из follower; on_eof вызывается на первом EOF (до проверки ротации)"""
+    read = follower._read
+    hooked = [on_eof]
+
+    def read_with_hook():
+        data = read()
+        if not data and hooked[0] is not None:
+            hooked.pop()()
+            hooked.append(None)
+        return data
+
+    follower._read = read_with_hook
+
+    async def main():
+        lines = []
+        async for batch in follower:
+            lines.extend(batch)
+            if len(lines) >= count:
+                follower.stop()
+        return lines
+
+    return asyncio.run(asyncio.wait_for(main(), 5))
+
+
+def test_rotation_drains_lines_written_to_old_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_follower, "POLL_INTERVAL", 0.01)
+    path = tmp_path / "access.log"
+    writer = open(path, "w", buffering=1)
+    writer.write("a1\na2\n")
+
+    def rotate():
+        # Писатель дописывает старый файл уже после нашего EOF, затем logrotate переименовывает его
+        writer.write("b1\nb2")
+        writer.flush()
+        os.rename(path, tmp_path / "access.log.1")
+        path.write_text("c1\n")
+
+    try:
+        lines = collect(follower_for(path), 5, on_eof=rotate)
+    finally:
+        writer.close()
+    assert lines == ["a1", "a2", "b1", "b2", "c1"]
+
+
+def test_truncated_file_is_read_from_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_follower, "POLL_INTERVAL", 0.01)
+    path = tmp_path / "access.log"
+    path.write_text("old-1\nold-2\n")
+
+    def truncate():
+        with open(path, "r+") as f:
+            f.truncate(0)
+            f.write("new\n")
+
+    assert collect(follower_for(path), 3, on_eof=truncate) == ["old-1", "old-2", "new"]
+
+
+def test_resumes_from_committed_offset(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_follower, "POLL_INTERVAL", 0.01)
+    path = tmp_path / "access.log"
+    state_path = tmp_path / "state" / "offset.json"
+    path.write_text("1\n2\n")
+    assert collect(follower_for(path, state_path=str(state_path)), 2) == ["1", "2"]
+
+    with open(path, "a") as f:
+        f.write("3\n")
+    assert collect(follower_for(path, state_path=str(state_path)), 1) == ["3"]
+
+
+def test_prime_bytes_skips_cut_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_follower, "POLL_INTERVAL", 0.01)
+    path = tmp_path / "access.log"
+    path.write_text("first-line\nsecond\nthird\n")
+    follower = follower_for(path, prime_bytes=len("ine\nsecond\nthird\n"))
+    assert collect(follower, 2) == ["second", "third"]
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import shutil
+import socket
+from pathlib import Path
+from uuid import uuid4
+
+import aiohttp
+import pytest
+import uvicorn
+from aiohttp import web
+from fastapi import FastAPI
+
+from app.api.v1 import cascade
+from app.core.http import http_client
+from app.services.config_store import XrayConfigStore
+from app.services.fleet import FleetController, FleetError
+
+EXIT_CONFIG = Path(__file__).resolve().parent.parent / "xray" / "config_server2_hybrid.json"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class EntryNode:
+    """Подставной entry-узел: помнит каскадных пользователей и параметры второго хопа"""
+
+    def __init__(self):
+        self.users = set()
+        self.server2 = None
+        self.runner = None
+
+    async def create(self, request):
+        data = await request.json()
+        self.server2 = (data["server2_ip"], data["server2_port"], data["server2_uuid"])
+        self.users.update(data["uuids"])
+        results = [{"uuid": uid, "success": True} for uid in data["uuids"]]
+        return web.json_response({"success": True, "results": results, "cascade_uuid": data["server2_uuid"]})
+
+    async def delete(self, request):
+        data = await request.json()
+        self.users.difference_update(data["uuids"])
+        return web.json_response({"success": True, "results": []})
+
+    async def count(self, request):
+        return web.json_response({"count": len(self.users)})
+
+    async def upstream(self, request):
+        if self.server2 is None:
+            return web.json_response({})
+        return web.json_response(dict(zip(["server2_ip", "server2_port", "server2_uuid"], self.server2)))
+
+    async def set_upstream(self, request):
+        data = await request.json()
+        self.server2 = (data["server2_ip"], data["server2_port"], data["server2_uuid"])
+        return web.json_response({"success": True})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/api/v1/cascade/bulk", self.create)
+        app.router.add_delete("/api/v1/cascade/bulk", self.delete)
+        app.router.add_get("/api/v1/cascade/count", self.count)
+        app.router.add_get("/api/v1/cascade/upstream", self.upstream)
+        app.router.add_put("/api/v1/cascade/upstream", self.set_upstream)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        port = free_port()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        return f"http://127.0.0.1:{port}"
+
+
+async def start_exit_node(monkeypatch, config_path):
+    """Exit-узел — настоящий роутер каскада поверх копии конфига server2; Xray не трогаем"""
+    hot_applied = []
+
+    async def hot_apply(tag, client, wait=True):
+        hot_applied.append((tag, client["id"]))
+        return False
+
+    async def schedule_reload(wait=True):
+        return False
+
+    monkeypatch.setattr(cascade, "config_store", XrayConfigStore(config_path))
+    monkeypatch.setattr(cascade, "hot_add_client", hot_apply)
+    monkeypatch.setattr(cascade, "hot_remove_client", hot_apply)
+    monkeypatch.setattr(cascade, "schedule_reload", schedule_reload)
+
+    app = FastAPI()
+    app.include_router(cascade.router, prefix="/api/v1")
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+def clients_by_inbound(config_path):
+    config = json.loads(config_path.read_text())
+    return {
+        (inbound["port"], inbound.get("streamSettings", {}).get("security")): inbound["settings"].get("clients", [])
+        for inbound in config["inbounds"] if inbound["protocol"] == "vless"
+    }
+
+
+def run_cascade(monkeypatch, tmp_path, scenario):
+    config_path = tmp_path / "config.json"
+    shutil.copy(EXIT_CONFIG, config_path)
+
+    async def main():
+        entry = EntryNode()
+        entry_url = await entry.start()
+        server, task, exit_url = await start_exit_node(monkeypatch, config_path)
+        controller = FleetController(path=str(tmp_path / "fleet.json"))
+        controller.upsert_node(name="entry", url=entry_url, role="entry")
+        controller.upsert_node(name="exit", url=exit_url, role="exit", address="203.0.113.2", cascade_port=8443)
+        try:
+            await scenario(controller, entry, config_path)
+        finally:
+            await http_client.close()
+            server.should_exit = True
+            await task
+            await entry.runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_link_uuid_lands_in_cascade_port_inbound_without_flow(monkeypatch, tmp_path):
+    users = [str(uuid4()), str(uuid4())]
+
+    async def scenario(controller, entry, config_path):
+        before = clients_by_inbound(config_path)[(443, "reality")]
+        result = await controller.provision_cascade(users, "entry", "exit")
+        link = result["link_uuid"]
+
+        assert entry.server2 == ("203.0.113.2", 8443, link)
+        inbounds = clients_by_inbound(config_path)
+        # Связка — в inbound, на который ходит outbound entry-узла (8443, без шифрования), и без flow
+        assert [client["id"] for client in inbounds[(8443, "none")]] == [link]
+        assert "flow" not in inbounds[(8443, "none")][0]
+        # Reality-inbound клиентов с xtls-rprx-vision не меняется
+        assert inbounds[(443, "reality")] == before
+
+        removed = await controller.remove_cascade(users, "entry")
+        assert removed["links_removed"] == ["exit"]
+        assert (8443, "none") not in clients_by_inbound(config_path)
+        assert controller.links == {}
+
+    run_cascade(monkeypatch, tmp_path, scenario)
+
+
+def test_link_uuid_stays_while_entry_has_cascade_users(monkeypatch, tmp_path):
+    users = [str(uuid4()), str(uuid4())]
+
+    async def scenario(controller, entry, config_path):
+        link = (await controller.provision_cascade(users, "entry", "exit"))["link_uuid"]
+
+        removed = await controller.remove_cascade(users[:1], "entry", "exit")
+        assert removed["links_removed"] == []
+        assert [client["id"] for client in clients_by_inbound(config_path)[(8443, "none")]] == [link]
+
+        removed = await controller.remove_cascade(users[1:], "entry", "exit")
+        assert removed["links_removed"] == ["exit"]
+        assert (8443, "none") not in clients_by_inbound(config_path)
+
+    run_cascade(monkeypatch, tmp_path, scenario)
+
+
+def test_duplicate_link_leaves_cached_config_in_sync(monkeypatch, tmp_path):
+    link = str(uuid4())
+
+    async def scenario(controller, entry, config_path):
+        url = f"{controller.nodes['exit'].url}/api/v1/cascade/link"
+        async with aiohttp.ClientSession() as session:
+            for port, success in [(8443, True), (8443, False), (9443, True), (9443, False)]:
+                async with session.post(url, json={"uuid": link, "port": port}) as resp:
+                    assert (await resp.json())["success"] is success
+                # Кеш хранилища совпадает с файлом и после отказа по дубликату
+                assert await cascade.config_store.load() == json.loads(config_path.read_text())
+        inbounds = clients_by_inbound(config_path)
+        assert (8443, "none") not in inbounds
+        assert [client["id"] for client in inbounds[(9443, "none")]] == [link]
+
+    run_cascade(monkeypatch, tmp_path, scenario)
+
+
+def test_exit_failure_restores_entry_upstream(monkeypatch, tmp_path):
+    users = [str(uuid4())]
+    previous = ("198.51.100.7", 8443, str(uuid4()))
+
+    async def scenario(controller, entry, config_path):
+        entry.server2 = previous
+        controller.upsert_node(
+            name="down", url=f"http://127.0.0.1:{free_port()}", role="exit", address="203.0.113.9", timeout=2,
+        )
+        with pytest.raises(FleetError) as error:
+            await controller.provision_cascade(users, "entry", "down")
+        assert error.value.node == "down"
+        # Созданные пользователи удалены, outbound entry-узла снова ведёт на прежний exit
+        assert entry.users == set()
+        assert entry.server2 == previous
+
+    run_cascade(monkeypatch, tmp_path, scenario)
+
+
+def test_remove_cascade_revokes_every_link_despite_failures(monkeypatch, tmp_path):
+    users = [str(uuid4())]
+
+    async def scenario(controller, entry, config_path):
+        await controller.provision_cascade(users, "entry", "exit")
+        controller.upsert_node(
+            name="down", url=f"http://127.0.0.1:{free_port()}", role="exit", address="203.0.113.9", timeout=2,
+        )
+        controller.links["entry->down"] = str(uuid4())
+
+        removed = await controller.remove_cascade(users, "entry")
+        assert removed["success"]
+        assert removed["links_removed"] == ["exit"]
+        assert list(removed["errors"]) == ["down"]
+        # Связка на недоступном узле остаётся в реестре, чтобы отозвать её позже
+        assert list(controller.links) == ["entry->down"]
+        assert (8443, "none") not in clients_by_inbound(config_path)
+
+    run_cascade(monkeypatch, tmp_path, scenario)
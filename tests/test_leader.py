@@ -0,0 +1,84 @@
+import asyncio
+import os
+
+import httpx
+from aiohttp import web
+from fastapi import FastAPI
+
+from app.core import leader as leader_module
+from app.core.leader import FORWARDED_HEADER, LeaderElection, forward_to_leader
+
+
+class FakeLeader:
+    """Лидер на unix-сокете: отвечает на любой запрос и помнит, что пришло"""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.requests = []
+        self.runner = None
+
+    async def handle(self, request):
+        self.requests.append((request.method, request.path, request.headers.get(FORWARDED_HEADER)))
+        return web.json_response({"handled_by": "leader"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.UnixSite(self.runner, self.socket_path).start()
+
+    async def close(self):
+        await self.runner.cleanup()
+
+
+def follower_app():
+    app = FastAPI()
+    app.middleware("http")(forward_to_leader)
+
+    @app.post("/api/v1/vless")
+    async def create():
+        return {"handled_by": "follower"}
+
+    @app.get("/api/v1/vless")
+    async def listing():
+        return {"handled_by": "follower"}
+
+    return app
+
+
+def run_follower(tmp_path, monkeypatch, scenario):
+    follower = LeaderElection(str(tmp_path / "leader.lock"), str(tmp_path / "leader.sock"))
+    monkeypatch.setattr(leader_module, "leader", follower)
+
+    async def main():
+        fake = FakeLeader(follower.socket_path)
+        await fake.start()
+        transport = httpx.ASGITransport(app=follower_app())
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                return await scenario(fake, client)
+        finally:
+            await follower.close()
+            await fake.close()
+
+    return asyncio.run(main())
+
+
+def test_follower_forwards_mutation_despite_spoofed_marker(tmp_path, monkeypatch):
+    async def scenario(fake, client):
+        resp = await client.post("/api/v1/vless", json={}, headers={FORWARDED_HEADER: "1"})
+        assert resp.json() == {"handled_by": "leader"}
+        # Маркер перезаписан pid ведомого, который переслал запрос
+        assert fake.requests == [("POST", "/api/v1/vless", str(os.getpid()))]
+
+    run_follower(tmp_path, monkeypatch, scenario)
+
+
+def test_follower_serves_reads_locally(tmp_path, monkeypatch):
+    async def scenario(fake, client):
+        resp = await client.get("/api/v1/vless")
+        assert resp.json() == {"handled_by": "follower"}
+        assert fake.requests == []
+
+    run_follower(tmp_path, monkeypatch, scenario)
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+from app.services.log_parser import collector_payload, parse_squid_line, parse_xray_line
+
+USER = "74b741f9-ea44-4f16-8599-90bcc31ae3cc"
+
+
+def test_xray_line_fast_path():
+    record = parse_xray_line(
+        f"2025/06/15 12:34:56.123456 from 91.108.4.12:51234 accepted tcp:example.com:443 "
+        f"[reality-vless >> direct] email: {USER}"
+    )
+    assert record.timestamp == datetime(2025, 6, 15, 12, 34, 56)
+    assert (record.ip, record.network, record.destination, record.port) == ("91.108.4.12", "tcp", "example.com", 443)
+    assert (record.inbound, record.outbound, record.uuid) == ("reality-vless", "direct", USER)
+
+
+@pytest.mark.parametrize("line, expected", [
+    # Источник с префиксом сети и IPv6-назначение
+    (f"2025/06/15 12:34:56.1 from tcp:10.0.0.2:4000 accepted tcp:[2001:db8::1]:443 [in >> out] email: {USER}",
+     ("10.0.0.2", "tcp", "[2001:db8::1]", 443, "in", "out", USER)),
+    # Без маршрута в квадратных скобках
+    (f"2025/06/15 12:34:56.1 from 10.0.0.2:4000 accepted udp:8.8.8.8:53 email: {USER}",
+     ("10.0.0.2", "udp", "8.8.8.8", 53, None, None, USER)),
+    # Каскадный клиент: email вида uuid@cascade
+    (f"2025/06/15 12:34:56.1 from 10.0.0.2:4000 accepted tcp:a.example:80 [vless-cascade >> cascade-to-server2] "
+     f"email: {USER}@cascade",
+     ("10.0.0.2", "tcp", "a.example", 80, "vless-cascade", "cascade-to-server2", USER)),
+])
+def test_xray_line_variants(line, expected):
+    record = parse_xray_line(line)
+    assert (record.ip, record.network, record.destination, record.port,
+            record.inbound, record.outbound, record.uuid) == expected
+
+
+@pytest.mark.parametrize("line", [
+    "",
+    "2025/06/15 12:34:56.1 from 10.0.0.2:4000 rejected tcp:a.example:80 [in >> out] email: x",
+    "2025/06/15 12:34:56.1 from 10.0.0.2:4000 accepted tcp:a.example:80 [in >> out]",
+    "[Info] app/dispatcher: taking detour [direct] for [tcp:a.example:80]",
+])
+def test_xray_line_rejects_other_lines(line):
+    assert parse_xray_line(line) is None
+
+
+def test_squid_compact_line():
+    record = parse_squid_line(
+        f'1750012042.065 10.0.0.2 104.16.1.1 {USER} CONNECT ipwho.is:443 200 4821 TCP_TUNNEL/200 '
+        f'"Mozilla/5.0 (X11; Linux x86_64)" "ipwho.is:443"'
+    )
+    assert (record.timestamp, record.client_ip, record.server_ip, record.user) == (
+        1750012042.065, "10.0.0.2", "104.16.1.1", USER,
+    )
+    assert (record.method, record.host, record.status, record.bytes_sent) == ("CONNECT", "ipwho.is", 200, 4821)
+    assert (record.squid_status, record.user_agent) == ("TCP_TUNNEL/200", "Mozilla/5.0 (X11; Linux x86_64)")
+
+
+def test_squid_legacy_line_and_url_hosts():
+    record = parse_squid_line(f"1750012042.065 127.0.0.1 {USER} GET http://example.com:8080/path 407")
+    assert (record.server_ip, record.host, record.status, record.bytes_sent) == (None, "example.com", 407, None)
+    # IPv6 в CONNECT без скобок не режется по двоеточию
+    assert parse_squid_line(f"1750012042.065 127.0.0.1 {USER} CONNECT 2001:db8::1 200").host == "2001:db8::1"
+    assert parse_squid_line("not a squid line") is None
+
+
+def test_collector_payload_is_stable_for_the_same_line():
+    line = f"2025/06/15 12:34:56.1 from 10.0.0.2:4000 accepted tcp:a.example:80 [in >> out] email: {USER}\n"
+    record = parse_xray_line(line)
+    found = collector_payload(record, line, 200, 512, "203.0.113.1")
+    missing = collector_payload(record, line.strip(), None, None, "203.0.113.1")
+    assert (found["status"], missing["status"]) == ("accepted", "failed")
+    assert found["raw_log"] == f"{line.strip()} server_ip: 203.0.113.1"
+    # Живая отправка и повторная догрузка той же строки дают один ключ, другой сервер — другой
+    assert found["idempotency_key"] == missing["idempotency_key"]
+    assert collector_payload(record, line, 200, 512, "203.0.113.2")["idempotency_key"] != found["idempotency_key"]
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import socket
+
+from aiohttp import web
+
+from app.services import log_shipper
+from app.services.log_shipper import BATCH_SIZE, LogShipper, hand_off_spool
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeCollector:
+    """Центральный коллектор: принимает пачки; status — код ответа, hang_after — после скольких пачек зависнуть"""
+
+    def __init__(self, status=200, hang_after=None):
+        self.status = status
+        self.hang_after = hang_after
+        self.batches = []
+        self.released = asyncio.Event()
+        self.runner = None
+
+    @property
+    def records(self):
+        return [record for batch in self.batches for record in batch]
+
+    async def receive(self, request):
+        batch = await request.json()
+        if self.hang_after is not None and len(self.batches) >= self.hang_after:
+            await self.released.wait()
+            return web.Response(status=503)
+        if self.status < 300:
+            self.batches.append(batch)
+        return web.Response(status=self.status)
+
+    async def start(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/logs", self.receive)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        port = free_port()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        return f"http://127.0.0.1:{port}/logs"
+
+    async def close(self):
+        self.released.set()
+        await self.runner.cleanup()
+
+
+def write_spool(path, records):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("".join(json.dumps(record) + "\n" for record in records))
+
+
+async def wait_for(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "условие не выполнилось"
+        await asyncio.sleep(0.01)
+
+
+def test_shipper_batches_and_flushes_on_close(tmp_path):
+    async def main():
+        collector = FakeCollector()
+        shipper = LogShipper(await collector.start(), spool_dir=str(tmp_path))
+        await shipper.start()
+        for i in range(BATCH_SIZE * 2 + 50):
+            assert shipper.submit({"n": i})
+        await shipper.close()
+        await collector.close()
+        return collector, shipper
+
+    collector, shipper = asyncio.run(main())
+    assert sorted(record["n"] for record in collector.records) == list(range(BATCH_SIZE * 2 + 50))
+    assert max(len(batch) for batch in collector.batches) <= BATCH_SIZE
+    assert shipper.stats["sent"] == BATCH_SIZE * 2 + 50
+    assert not os.path.exists(shipper.spool_path)
+
+
+def test_failed_batches_go_to_spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_shipper, "MAX_RETRIES", 1)
+    monkeypatch.setattr(log_shipper, "RETRY_BASE_DELAY", 0.01)
+
+    async def main():
+        collector = FakeCollector(status=500)
+        shipper = LogShipper(await collector.start(), spool_dir=str(tmp_path))
+        await shipper.start()
+        for i in range(10):
+            shipper.submit({"n": i})
+        await shipper.close()
+        await collector.close()
+        return shipper
+
+    shipper = asyncio.run(main())
+    with open(shipper.spool_path) as f:
+        assert [json.loads(line)["n"] for line in f] == list(range(10))
+    assert shipper.stats["spooled"] == 10 and shipper.stats["sent"] == 0
+
+
+def test_spool_is_drained_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_shipper, "SPOOL_RETRY_INTERVAL", 0.01)
+    total = BATCH_SIZE * 5 + 7
+
+    async def main():
+        collector = FakeCollector()
+        shipper = LogShipper(await collector.start(), spool_dir=str(tmp_path))
+        write_spool(shipper.spool_path, [{"n": i} for i in range(total)])
+        with open(shipper.spool_path, "a") as f:
+            f.write("{не json\n")
+        await shipper.start()
+        await wait_for(lambda: not os.listdir(tmp_path))
+        await shipper.close()
+        await collector.close()
+        return collector
+
+    collector = asyncio.run(main())
+    assert [record["n"] for record in collector.records] == list(range(total))
+    assert all(len(batch) <= BATCH_SIZE for batch in collector.batches)
+
+
+def test_drain_resumes_after_stop_without_resending(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_shipper, "SPOOL_RETRY_INTERVAL", 0.01)
+    total = BATCH_SIZE * 4
+
+    async def main():
+        # Коллектор принимает две пачки досылки и зависает на третьей — в этот момент шиппер останавливают
+        collector = FakeCollector(hang_after=2)
+        shipper = LogShipper(await collector.start(), spool_dir=str(tmp_path))
+        write_spool(shipper.spool_path, [{"n": i} for i in range(total)])
+        await shipper.start()
+        await wait_for(lambda: len(collector.batches) == 2)
+        await asyncio.sleep(0.05)
+        await shipper.close()
+        await collector.close()
+        first = collector.records
+        assert os.path.exists(shipper.spool_path + ".sending")
+
+        collector = FakeCollector()
+        shipper = LogShipper(await collector.start(), spool_dir=str(tmp_path))
+        await shipper.start()
+        await wait_for(lambda: not os.listdir(tmp_path))
+        await shipper.close()
+        await collector.close()
+        return first, collector.records
+
+    first, second = asyncio.run(main())
+    assert [record["n"] for record in first] == list(range(BATCH_SIZE * 2))
+    assert [record["n"] for record in second] == list(range(BATCH_SIZE * 2, total))
+
+
+def test_handed_off_spool_is_delivered(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_shipper, "SPOOL_RETRY_INTERVAL", 0.01)
+    job_spool = tmp_path / "job" / "central_log.jsonl"
+    write_spool(str(job_spool), [{"job": i} for i in range(30)])
+    spool_dir = tmp_path / "spool"
+    hand_off_spool(str(job_spool), str(spool_dir), "job-1")
+
+    async def main():
+        collector = FakeCollector()
+        shipper = LogShipper(await collector.start(), spool_dir=str(spool_dir))
+        await shipper.start()
+        await wait_for(lambda: not os.listdir(spool_dir))
+        await shipper.close()
+        await collector.close()
+        return collector
+
+    collector = asyncio.run(main())
+    assert [record["job"] for record in collector.records] == list(range(30))
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timezone
+
+from app.services import file_follower, squid_index
+from app.services.squid_index import SquidLogIndex
+
+USER = "74b741f9-ea44-4f16-8599-90bcc31ae3cc"
+START = 1750012000
+
+
+def squid_line(ts, host, status=200, bytes_sent=100):
+    return f'{ts:.3f} 10.0.0.2 104.16.1.1 {USER} CONNECT {host}:443 {status} {bytes_sent} TCP_TUNNEL/{status} "-" "-"'
+
+
+def at(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def test_lookup_matches_within_window(tmp_path):
+    index = SquidLogIndex(str(tmp_path / "access.log"))
+    index.add_line(squid_line(START, "a.example", 200, 10))
+    index.add_line(squid_line(START + 5, "a.example", 403, 20))
+    index.add_line("мусор")
+
+    assert len(index) == 2
+    # Без времени — самая свежая запись, со временем — самая свежая в пределах окна
+    assert index.lookup(USER, "a.example") == (403, 20)
+    assert index.lookup(USER, "a.example", at(START + 15)) == (403, 20)
+    assert index.lookup(USER, "a.example", at(START - 8)) == (200, 10)
+    assert index.lookup(USER, "a.example", at(START + 16)) == (None, None)
+    assert index.lookup(USER, "b.example") == (None, None)
+    assert index.lookup("other", "a.example") == (None, None)
+
+
+def test_entries_expire_by_latest_log_time(tmp_path):
+    index = SquidLogIndex(str(tmp_path / "access.log"), retention=60)
+    index.add_line(squid_line(START, "old.example"))
+    index.add_line(squid_line(START + 30, "a.example"))
+    assert index.lookup(USER, "old.example") == (200, 100)
+
+    # Вытеснение идёт по времени строк лога, а не по часам процесса
+    index.add_line(squid_line(START + 61, "a.example"))
+    assert index.lookup(USER, "old.example") == (None, None)
+    assert "old.example" not in {key[1] for key in index._index}
+    assert len(index) == 2
+
+
+def test_entries_per_key_are_capped(tmp_path):
+    index = SquidLogIndex(str(tmp_path / "access.log"))
+    for i in range(squid_index.MAX_ENTRIES_PER_KEY + 10):
+        index.add_line(squid_line(START + i * 0.01, "noisy.example", 200, i))
+    assert len(index._index[(USER, "noisy.example")]) == squid_index.MAX_ENTRIES_PER_KEY
+    assert index.lookup(USER, "noisy.example") == (200, squid_index.MAX_ENTRIES_PER_KEY + 9)
+
+    # Вытеснение по общей очереди не трогает записи, которые deque ключа уже выкинул по maxlen
+    index.add_line(squid_line(START + 1000, "a.example"))
+    assert (USER, "noisy.example") not in index._index
+    assert len(index) == 1
+
+
+def test_run_indexes_appended_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_follower, "POLL_INTERVAL", 0.01)
+    path = tmp_path / "access.log"
+    path.write_text(squid_line(START, "a.example") + "\n")
+    index = SquidLogIndex(str(path))
+    index.follower.use_inotify = False
+
+    async def main():
+        task = asyncio.create_task(index.run())
+        while index.lookup(USER, "a.example") == (None, None):
+            await asyncio.sleep(0.01)
+        with open(path, "a") as f:
+            f.write(squid_line(START + 1, "b.example", 404, 0) + "\n")
+        while index.lookup(USER, "b.example") == (None, None):
+            await asyncio.sleep(0.01)
+        index.stop()
+        await task
+
+    asyncio.run(asyncio.wait_for(main(), 5))
+    assert index.lookup(USER, "b.example") == (404, 0)
@@ -0,0 +1,63 @@
+import asyncio
+import base64
+import json
+import shutil
+from pathlib import Path
+
+from app.services.config_store import XrayConfigStore
+from app.services.subscription import SubscriptionCache
+
+EXIT_CONFIG = Path(__file__).resolve().parent.parent / "xray" / "config_server2_hybrid.json"
+USER = "33333333-3333-4333-8333-333333333333"
+LINK = "44444444-4444-4444-8444-444444444444"
+
+
+def make_store(tmp_path):
+    config_path = tmp_path / "config.json"
+    shutil.copy(EXIT_CONFIG, config_path)
+    config = json.loads(config_path.read_text())
+    config["inbounds"][0]["settings"]["clients"].append({"id": USER, "email": USER, "flow": "xtls-rprx-vision"})
+    config["inbounds"].append({
+        "tag": "cascade-link-in", "port": 8443, "protocol": "vless",
+        "settings": {"clients": [{"id": LINK, "level": 0, "email": f"{LINK}@link"}], "decryption": "none"},
+        "streamSettings": {"network": "tcp", "security": "none"},
+    })
+    config_path.write_text(json.dumps(config))
+    return XrayConfigStore(config_path)
+
+
+def decode(subscription):
+    body, _ = subscription
+    return base64.b64decode(body).decode().split("\n")
+
+
+def test_subscription_has_client_inbounds_only(tmp_path):
+    cache = SubscriptionCache(make_store(tmp_path))
+
+    async def main():
+        return await cache.get(USER), await cache.get(LINK)
+
+    user, link = asyncio.run(main())
+    links = decode(user)
+    assert len(links) == 1
+    assert links[0].startswith(f"vless://{USER}@") and "security=reality" in links[0] and "pbk=" in links[0]
+    assert "flow=xtls-rprx-vision" in links[0]
+    # UUID связки каскада не получает подписку, а inbound связок не попадает в тела пользователей
+    assert link is None
+
+
+def test_subscription_rebuilds_after_config_change(tmp_path):
+    store = make_store(tmp_path)
+    cache = SubscriptionCache(store)
+
+    async def main():
+        first = await cache.get(USER)
+        assert await cache.get(USER) is first
+        async with store.transaction() as config:
+            config["inbounds"][0]["port"] = 8444
+            await store.save(config)
+        return first, await cache.get(USER)
+
+    first, second = asyncio.run(main())
+    assert first[1] != second[1]
+    assert ":8444?" in decode(second)[0]
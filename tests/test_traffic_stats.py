@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+
+from app.api.v1 import cascade, xray
+from app.services.config_store import XrayConfigStore
+from app.services.traffic_stats import TrafficCollector
+
+CASCADE_USERS = ["11111111-1111-4111-8111-111111111111", "22222222-2222-4222-8222-222222222222"]
+
+
+class FakeStatsApi:
+    def __init__(self):
+        self.stats = {}
+
+    async def query_stats(self, pattern, reset=False):
+        stats, self.stats = self.stats, {}
+        return stats
+
+
+def user_stats(email, uplink, downlink):
+    return {f"user>>>{email}>>>traffic>>>uplink": uplink, f"user>>>{email}>>>traffic>>>downlink": downlink}
+
+
+def test_collector_sums_by_uuid_and_evicts_least_recent():
+    api = FakeStatsApi()
+    collector = TrafficCollector(api=api, max_users=2)
+
+    async def main():
+        # Один UUID в vless и каскаде — трафик складывается
+        api.stats = {**user_stats("a", 10, 20), **user_stats("a@cascade", 1, 2), **user_stats("b", 5, 0)}
+        await collector.poll_once()
+        api.stats = user_stats("a", 1, 1)
+        await collector.poll_once()
+        api.stats = user_stats("c", 7, 7)
+        await collector.poll_once()
+
+    asyncio.run(main())
+    traffic = collector.traffic("a")
+    assert (traffic["uplink"], traffic["downlink"]) == (12, 23)
+    assert sum(point[1] for point in traffic["series"]) == 12
+    # b дольше всех без трафика — вытеснен при появлении c
+    assert set(collector.export()["users"]) == {"a", "c"}
+    collector.forget(["a"])
+    assert collector.traffic("a")["uplink"] == 0
+
+
+def test_cascade_bulk_delete_forgets_traffic(tmp_path, monkeypatch):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({
+        "inbounds": [
+            {"tag": "reality-vless", "port": 443, "protocol": "vless", "settings": {"clients": []}},
+            {
+                "tag": "vless-cascade", "port": 10443, "protocol": "vless",
+                "settings": {"clients": [{"id": uid, "level": 0, "email": f"{uid}@cascade"} for uid in CASCADE_USERS]},
+            },
+        ],
+        "outbounds": [{"protocol": "freedom", "tag": "direct"}],
+        "routing": {"rules": [{"type": "field", "inboundTag": ["vless-cascade"], "outboundTag": "direct"}]},
+    }))
+    store = XrayConfigStore(config_path)
+    api = FakeStatsApi()
+    collector = TrafficCollector(api=api)
+
+    async def schedule_reload(wait=True):
+        return False
+
+    monkeypatch.setattr(cascade, "config_store", store)
+    monkeypatch.setattr(xray, "config_store", store)
+    monkeypatch.setattr(xray, "traffic_collector", collector)
+    monkeypatch.setattr(cascade, "schedule_reload", schedule_reload)
+    app = FastAPI()
+    app.include_router(cascade.router, prefix="/api/v1")
+
+    async def main():
+        api.stats = {key: value for uid in CASCADE_USERS for key, value in user_stats(f"{uid}@cascade", 1, 1).items()}
+        await collector.poll_once()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            # Удаление всех каскадных клиентов убирает inbound целиком и идёт мимо hot_remove_clients
+            body = {"uuids": CASCADE_USERS, "server2_ip": ""}
+            resp = await client.request("DELETE", "/api/v1/cascade/bulk", json=body)
+            assert resp.json()["success"]
+
+    asyncio.run(main())
+    assert collector.export()["users"] == {}
+    assert "vless-cascade" not in [inbound["tag"] for inbound in json.loads(config_path.read_text())["inbounds"]]
@@ -0,0 +1,137 @@
+import asyncio
+
+import grpc
+import pytest
+
+from app.services.xray_api import (
+    ADD_USER_OPERATION, REMOVE_USER_OPERATION, VLESS_ACCOUNT, XrayApi, XrayApiError,
+    _field_bytes, _field_varint, _iter_fields, _varint, encode_vless_user,
+)
+
+USER = "74b741f9-ea44-4f16-8599-90bcc31ae3cc"
+
+
+def fields(data):
+    return dict(_iter_fields(data))
+
+
+@pytest.mark.parametrize("value, encoded", [
+    (0, b"\x00"), (1, b"\x01"), (127, b"\x7f"), (128, b"\x80\x01"), (300, b"\xac\x02"),
+    (2 ** 63 - 1, b"\xff\xff\xff\xff\xff\xff\xff\xff\x7f"),
+])
+def test_varint(value, encoded):
+    assert _varint(value) == encoded
+    assert list(_iter_fields(b"\x08" + encoded)) == [(1, value)]
+
+
+def test_encode_vless_user():
+    # Эталон собран по .proto Xray: User{level=1, email=2, account=3 TypedMessage{type=1, value=2 Account}}
+    account = b"\x0a\x24" + USER.encode() + b"\x12\x10xtls-rprx-vision\x1a\x04none"
+    typed = b"\x0a\x18" + VLESS_ACCOUNT.encode() + b"\x12" + bytes([len(account)]) + account
+    expected = b"\x08\x02\x12\x0euser@cascade.x\x1a" + bytes([len(typed)]) + typed
+    assert encode_vless_user(USER, "user@cascade.x", "xtls-rprx-vision", 2) == expected
+
+    # Поля со значением по умолчанию (level 0, пустой flow) по правилам proto3 не пишутся
+    user = fields(encode_vless_user(USER, USER))
+    assert set(user) == {2, 3}
+    assert set(fields(fields(user[3])[2])) == {1, 3}
+
+
+def test_iter_fields_rejects_group_wire_type():
+    with pytest.raises(XrayApiError):
+        list(_iter_fields(b"\x0b"))
+
+
+class FakeXray:
+    """gRPC-сервер с сырыми байтами вместо сгенерированных сообщений: проверяет то, что уходит в Xray"""
+
+    def __init__(self):
+        self.requests = []
+        self.error = None
+        self.stats = {}
+
+    async def alter_inbound(self, request, context):
+        self.requests.append(request)
+        if self.error:
+            await context.abort(grpc.StatusCode.UNKNOWN, self.error)
+        return b""
+
+    async def query_stats(self, request, context):
+        self.requests.append(request)
+        return b"".join(
+            _field_bytes(1, _field_bytes(1, name) + _field_varint(2, value)) for name, value in self.stats.items()
+        )
+
+    async def start(self):
+        self.server = grpc.aio.server()
+        self.server.add_generic_rpc_handlers((
+            grpc.method_handlers_generic_handler("xray.app.proxyman.command.HandlerService", {
+                "AlterInbound": grpc.unary_unary_rpc_method_handler(self.alter_inbound),
+            }),
+            grpc.method_handlers_generic_handler("xray.app.stats.command.StatsService", {
+                "QueryStats": grpc.unary_unary_rpc_method_handler(self.query_stats),
+            }),
+        ))
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        await self.server.start()
+        return XrayApi(f"127.0.0.1:{port}")
+
+
+def run_with_xray(scenario):
+    async def main():
+        xray = FakeXray()
+        api = await xray.start()
+        try:
+            await scenario(xray, api)
+        finally:
+            await api.close()
+            await xray.server.stop(None)
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+
+
+def test_add_and_remove_user_requests():
+    async def scenario(xray, api):
+        await api.add_vless_user("reality-vless", USER, USER, "xtls-rprx-vision")
+        await api.remove_user("reality-vless", USER)
+
+        add, remove = (fields(request) for request in xray.requests)
+        assert add[1] == b"reality-vless"
+        operation = fields(add[2])
+        assert operation[1] == ADD_USER_OPERATION.encode()
+        assert fields(operation[2])[1] == encode_vless_user(USER, USER, "xtls-rprx-vision")
+
+        assert remove[1] == b"reality-vless"
+        operation = fields(remove[2])
+        assert operation[1] == REMOVE_USER_OPERATION.encode()
+        assert fields(operation[2]) == {1: USER.encode()}
+
+    run_with_xray(scenario)
+
+
+def test_alter_inbound_errors():
+    async def scenario(xray, api):
+        # Повторное добавление и удаление отсутствующего — не ошибка, остальное пробрасывается
+        xray.error = f"User {USER} already exists."
+        await api.add_vless_user("reality-vless", USER, USER)
+        xray.error = f"User {USER} not found."
+        await api.remove_user("reality-vless", USER)
+        xray.error = "handler not found: nope"
+        with pytest.raises(XrayApiError, match="UNKNOWN"):
+            await api.add_vless_user("nope", USER, USER)
+
+    run_with_xray(scenario)
+
+
+def test_query_stats():
+    async def scenario(xray, api):
+        xray.stats = {
+            f"user>>>{USER}>>>traffic>>>uplink": 5 * 2 ** 32,
+            f"user>>>{USER}>>>traffic>>>downlink": 0,
+        }
+        assert await api.query_stats("user>>>", reset=True) == xray.stats
+        assert fields(xray.requests[-1]) == {1: b"user>>>", 2: 1}
+        await api.query_stats()
+        assert xray.requests[-1] == b""
+
+    run_with_xray(scenario)